@@ -1,10 +1,80 @@
-from django.contrib import admin
+import io
+
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.http import StreamingHttpResponse
+from django.shortcuts import render
+from django.urls import path
 from django.utils.html import format_html
 from django.utils.safestring import mark_safe
-from django.core.mail import send_mail
-from django.conf import settings
-from django.utils import timezone
-from .models import Venue, Booking, VenueSchedule
+from django.db.models import Count, Min
+from .models import Venue, Booking, BookingSeries, VenueSchedule, BackgroundJob, UserBookingStats
+from .bulk import set_status
+from .jobs import queue_emails
+from .occupancy import with_occupancy
+from .passes import pass_url
+from .series import approve_series, cancel_series, reject_series
+from .transfer import CONTENT_TYPES, FORMATS, import_bookings, import_venues, read_rows, stream_export
+
+# ==========================================
+# BULK EXPORT / IMPORT
+# ==========================================
+class TransferAdminMixin:
+    """
+    "Export CSV / JSONL" and "Import" buttons on a changelist. Exports stream
+    the rows matching the current filters; imports run the chunked importer
+    of transfer.py on the uploaded file.
+    """
+    transfer_kind = None
+    importer = None
+    change_list_template = 'admin/accounts/change_list_transfer.html'
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        return [
+            path('export/', self.admin_site.admin_view(self.export_view), name='%s_%s_export' % info),
+            path('import/', self.admin_site.admin_view(self.import_view), name='%s_%s_import' % info),
+        ] + super().get_urls()
+
+    def export_view(self, request):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        # Everything else in the query string is a changelist filter
+        request.GET = request.GET.copy()
+        fmt = request.GET.pop('format', ['csv'])[-1]
+        if fmt not in FORMATS:
+            fmt = 'csv'
+        queryset = self.get_changelist_instance(request).get_queryset(request)
+
+        response = StreamingHttpResponse(stream_export(self.transfer_kind, fmt, queryset), content_type=CONTENT_TYPES[fmt])
+        response['Content-Disposition'] = f'attachment; filename="{self.transfer_kind}.{fmt}"'
+        return response
+
+    def import_view(self, request):
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        report = None
+        if request.method == 'POST' and request.FILES.get('file'):
+            upload = request.FILES['file']
+            fmt = 'jsonl' if upload.name.endswith(('.jsonl', '.ndjson')) else 'csv'
+            kwargs = {'dry_run': bool(request.POST.get('dry_run'))}
+            if self.transfer_kind == 'bookings':
+                kwargs['allow_past'] = bool(request.POST.get('allow_past'))
+            rows = read_rows(io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline=''), fmt)
+            report = self.importer(rows, **kwargs)
+
+            level = messages.SUCCESS if report.ok else messages.WARNING
+            verb = "Would create" if report.dry_run else "Created"
+            self.message_user(request, f"{verb} {report.created} {self.transfer_kind} ({report.updated} updated); {report.error_count} rows rejected.", level)
+
+        return render(request, 'admin/accounts/import.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': f"Import {self.transfer_kind}",
+            'kind': self.transfer_kind,
+            'report': report,
+        })
+
 
 # ==========================================
 # MANAGE SCHEDULE
@@ -35,36 +105,34 @@ class VenueScheduleAdmin(admin.ModelAdmin):
 # MANAGE VENUES
 # ==========================================
 @admin.register(Venue)
-class VenueAdmin(admin.ModelAdmin):
+class VenueAdmin(TransferAdminMixin, admin.ModelAdmin):
+    transfer_kind = 'venues'
+    importer = staticmethod(import_venues)
     list_display = ('name', 'location', 'capacity', 'equipment', 'venue_status')
     search_fields = ('name', 'location')
 
+    def get_queryset(self, request):
+        # Occupancy is computed for every row inside the changelist query itself
+        return with_occupancy(super().get_queryset(request))
+
     # --- REAL-TIME AVAILABILITY CHECK ---
-    @admin.display(description='Current Status')
+    @admin.display(description='Current Status', ordering='is_occupied')
     def venue_status(self, obj):
-        try:
-            now = timezone.now()
-
-            # Check for bookings happening RIGHT NOW
-            is_busy = Booking.objects.filter(
-                venue=obj,
-                status='APPROVED',
-                start_time__lte=now,
-                end_time__gte=now
-            ).exists()
-
-            if is_busy:
-                return mark_safe('<span style="color: red; font-weight: bold;">🔴 Booked</span>')
-            else:
-                return mark_safe('<span style="color: green; font-weight: bold;">🟢 Available</span>')
-        except Exception:
+        if getattr(obj, 'is_occupied', None) is None:
             return mark_safe('<span style="color: gray;">⚠️ Error</span>')
 
+        if obj.is_occupied:
+            return mark_safe('<span style="color: red; font-weight: bold;">🔴 Booked</span>')
+        else:
+            return mark_safe('<span style="color: green; font-weight: bold;">🟢 Available</span>')
+
 # ==========================================
 # MANAGE BOOKINGS
 # ==========================================
 @admin.register(Booking)
-class BookingAdmin(admin.ModelAdmin):
+class BookingAdmin(TransferAdminMixin, admin.ModelAdmin):
+    transfer_kind = 'bookings'
+    importer = staticmethod(import_bookings)
     list_display = ('event_name', 'user', 'venue', 'start_time', 'colored_status', 'purpose', 'time_slot_display', 'approved_by_display')
     list_filter = ('status', 'venue', 'start_time', 'purpose', 'created_at')
     search_fields = ('event_name', 'user__username', 'description')
@@ -98,9 +166,9 @@ class BookingAdmin(admin.ModelAdmin):
     # Display QR Code
     @admin.display(description='QR Code')
     def qr_code_display(self, obj):
-        if obj.qr_code:
-            return mark_safe(f'<img src="{obj.qr_code.url}" width="200" height="200">')
-        return "No QR code generated"
+        if obj.pk and obj.pass_status == 'ready':
+            return format_html('<img src="{}" width="200" height="200">', pass_url(obj, 'svg'))
+        return "No entry pass until the booking is approved"
 
     # Display time slot if selected
     @admin.display(description='Time Slot')
@@ -137,16 +205,97 @@ class BookingAdmin(admin.ModelAdmin):
     # --- ACTION 1: APPROVE & SEND EMAIL & TRACK APPROVAL ---
     @admin.action(description='✅ Approve selected bookings')
     def approve_bookings(self, request, queryset):
-        for booking in queryset:
-            booking.status = 'APPROVED'
-            booking.approved_by = request.user
-            booking.approved_at = timezone.now()
-            booking.save()
-
-            # Send email notification
-            if booking.user.email:
-                subject = f"Booking Approved: {booking.event_name} ✅"
-                message = f"""
+        try:
+            bookings, conflicts = set_status(queryset, 'APPROVED', by=request.user)
+        except ValidationError as e:
+            # A slot was taken by a write that skipped the venue lock; nothing changed
+            self.message_user(request, f"❌ Nothing was approved: {e.messages[0]}", messages.ERROR)
+            return
+
+        # Emails go out from the background worker in one batch
+        queue_emails([approval_email(booking) for booking in bookings if booking.user.email])
+
+        self.message_user(request, f"✅ {len(bookings)} bookings approved & user notifications queued.")
+        report_conflicts(self, request, conflicts)
+
+    # --- ACTION 2: REJECT & SEND EMAIL ---
+    @admin.action(description='❌ Reject selected bookings')
+    def reject_bookings(self, request, queryset):
+        bookings, _ = set_status(queryset, 'REJECTED', by=request.user)
+
+        queue_emails([rejection_email(booking) for booking in bookings if booking.user.email])
+
+        self.message_user(request, f"❌ {len(bookings)} bookings rejected & user notifications queued.")
+
+
+def report_conflicts(model_admin, request, conflicts):
+    """Warn about bookings an approval left alone because their slot is taken"""
+    if conflicts:
+        listed = ', '.join(f"#{booking.id}" for booking in conflicts[:20])
+        more = f" and {len(conflicts) - 20} more" if len(conflicts) > 20 else ""
+        model_admin.message_user(
+            request,
+            f"⚠️ {len(conflicts)} bookings were not approved: their time slot is reserved by another booking ({listed}{more}).",
+            messages.WARNING,
+        )
+
+
+# ==========================================
+# MANAGE RECURRING SERIES
+# ==========================================
+@admin.register(BookingSeries)
+class BookingSeriesAdmin(admin.ModelAdmin):
+    list_display = ('event_name', 'user', 'venue', 'frequency', 'interval', 'count', 'occurrence_count', 'first_start')
+    list_filter = ('frequency', 'venue')
+    search_fields = ('event_name', 'user__username')
+    readonly_fields = ('created_at',)
+    actions = ['approve_series_action', 'reject_series_action', 'cancel_series_action']
+
+    def get_queryset(self, request):
+        # Occurrence count and first date for the whole page in the list query
+        return super().get_queryset(request).select_related('user', 'venue').annotate(
+            occurrences_left=Count('bookings'),
+            first_occurrence=Min('bookings__start_time'),
+        )
+
+    @admin.display(description='Bookings', ordering='occurrences_left')
+    def occurrence_count(self, obj):
+        return obj.occurrences_left
+
+    @admin.display(description='First Booking', ordering='first_occurrence')
+    def first_start(self, obj):
+        return obj.first_occurrence
+
+    # Each action is ONE set-based write over every occurrence of every selected series
+    @admin.action(description='✅ Approve all pending occurrences')
+    def approve_series_action(self, request, queryset):
+        try:
+            bookings, conflicts = approve_series(queryset, by=request.user)
+        except ValidationError as e:
+            self.message_user(request, f"❌ Nothing was approved: {e.messages[0]}", messages.ERROR)
+            return
+        queue_emails([approval_email(booking) for booking in bookings if booking.user.email])
+        self.message_user(request, f"✅ {len(bookings)} bookings approved across {queryset.count()} series & user notifications queued.")
+        report_conflicts(self, request, conflicts)
+
+    @admin.action(description='❌ Reject all occurrences')
+    def reject_series_action(self, request, queryset):
+        bookings, _ = reject_series(queryset, by=request.user)
+        queue_emails([rejection_email(booking) for booking in bookings if booking.user.email])
+        self.message_user(request, f"❌ {len(bookings)} bookings rejected across {queryset.count()} series & user notifications queued.")
+
+    @admin.action(description='🗑 Cancel future occurrences')
+    def cancel_series_action(self, request, queryset):
+        bookings = cancel_series(queryset)
+        self.message_user(request, f"🗑 {len(bookings)} upcoming bookings cancelled.")
+
+
+# ==========================================
+# NOTIFICATION EMAILS
+# ==========================================
+def approval_email(booking):
+    subject = f"Booking Approved: {booking.event_name} ✅"
+    message = f"""
 Hi {booking.user.first_name or booking.user.username},
 
 Great news! Your booking request has been APPROVED.
@@ -156,31 +305,17 @@ Great news! Your booking request has been APPROVED.
 ⏰ Time: {booking.start_time.strftime('%Y-%m-%d %H:%M')} to {booking.end_time.strftime('%H:%M')}
 🎯 Purpose: {booking.get_purpose_display()}
 
-Please arrive on time. Your QR entry pass is ready!
+Please arrive on time. Your QR entry pass is on the booking page.
 
 Best regards,
 Campus Booking Admin
                 """
-                try:
-                    send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [booking.user.email], fail_silently=True)
-                except Exception as e:
-                    print(f"Error sending email: {e}")
+    return subject, message, booking.user.email
 
-        self.message_user(request, f"✅ {queryset.count()} bookings approved & user notifications sent.")
 
-    # --- ACTION 2: REJECT & SEND EMAIL ---
-    @admin.action(description='❌ Reject selected bookings')
-    def reject_bookings(self, request, queryset):
-        for booking in queryset:
-            booking.status = 'REJECTED'
-            booking.approved_by = request.user
-            booking.approved_at = timezone.now()
-            booking.save()
-
-            # Send email notification
-            if booking.user.email:
-                subject = f"Booking Update: {booking.event_name} ❌"
-                message = f"""
+def rejection_email(booking):
+    subject = f"Booking Update: {booking.event_name} ❌"
+    message = f"""
 Hi {booking.user.first_name or booking.user.username},
 
 We regret to inform you that your booking request has been REJECTED.
@@ -199,9 +334,24 @@ Please try booking a different time slot or contact support for more details.
 Best regards,
 Campus Booking Admin
                 """
-                try:
-                    send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [booking.user.email], fail_silently=True)
-                except Exception as e:
-                    print(f"Error sending email: {e}")
+    return subject, message, booking.user.email
 
-        self.message_user(request, f"❌ {queryset.count()} bookings rejected & user notifications sent.")
\ No newline at end of file
+# ==========================================
+# BACKGROUND JOBS
+# ==========================================
+@admin.register(BackgroundJob)
+class BackgroundJobAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'key', 'status', 'attempts', 'claimed_at', 'created_at', 'updated_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('key', 'last_error')
+    readonly_fields = ('kind', 'key', 'payload', 'attempts', 'claimed_by', 'claimed_at', 'last_error', 'created_at', 'updated_at')
+
+
+# ==========================================
+# BOOKING COUNTERS (read-only; rebuilt with manage.py rebuild_booking_counters)
+# ==========================================
+@admin.register(UserBookingStats)
+class UserBookingStatsAdmin(admin.ModelAdmin):
+    list_display = ('user', 'approved', 'pending', 'rejected', 'updated_at')
+    search_fields = ('user__username',)
+    readonly_fields = ('user', 'approved', 'pending', 'rejected', 'updated_at')
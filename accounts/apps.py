@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class AccountsConfig(AppConfig):
     name = 'accounts'
+
+    def ready(self):
+        # Connect cache invalidation / bookkeeping receivers
+        from . import signals  # noqa: F401
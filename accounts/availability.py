@@ -0,0 +1,210 @@
+import bisect
+import hashlib
+from datetime import datetime, time, timedelta
+from functools import lru_cache
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .booking_index import booking_index
+from .caching import aget_versions, get_versions
+
+# Bitmaps are tiny ints; keep them for a week unless a booking write bumps the venue version
+BITMAP_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+
+# ==========================================
+# SLOT TABLE
+# ==========================================
+class SlotTable:
+    """
+    The day's slot grid from VenueSchedule.get_time_slots(), parsed ONCE into
+    minutes-since-midnight so occupancy can be computed with bit masks.
+    Bit i of a day bitmap is set when slot i is booked.
+    """
+
+    def __init__(self, slots):
+        self.slots = slots
+        self.starts = [self._minutes(slot['start']) for slot in slots]
+        self.ends = [self._minutes(slot['end']) for slot in slots]
+        self.full_mask = (1 << len(slots)) - 1
+        self.edges = frozenset(self.starts) | frozenset(self.ends)
+        # Part of every cache key, so editing the schedule never serves an old grid
+        grid = ','.join(f"{s}-{e}" for s, e in zip(self.starts, self.ends))
+        self.signature = hashlib.md5(grid.encode()).hexdigest()[:12]
+
+    @staticmethod
+    def _minutes(hhmm):
+        hours, minutes = hhmm.split(':')
+        return int(hours) * 60 + int(minutes)
+
+    def on_grid(self, value):
+        """True when the datetime falls exactly on a slot start or end (local time)"""
+        local = timezone.localtime(value)
+        return not (local.second or local.microsecond) and local.hour * 60 + local.minute in self.edges
+
+    def mask_for(self, start_minute, end_minute):
+        """Bit mask of every slot overlapping [start_minute, end_minute)"""
+        first = bisect.bisect_right(self.ends, start_minute)   # first slot ending after the start
+        last = bisect.bisect_left(self.starts, end_minute)     # slots [0, last) start before the end
+        if first >= last:
+            return 0
+        return ((1 << last) - 1) & ~((1 << first) - 1)
+
+    def booked(self, bitmap):
+        return [slot for i, slot in enumerate(self.slots) if bitmap >> i & 1]
+
+    def available(self, bitmap):
+        return [slot for i, slot in enumerate(self.slots) if not bitmap >> i & 1]
+
+    def free_count(self, bitmap):
+        return bin(~bitmap & self.full_mask).count('1')
+
+    def as_string(self, bitmap):
+        """'0'/'1' per slot in slot order (1 = booked)"""
+        return ''.join('1' if bitmap >> i & 1 else '0' for i in range(len(self.slots)))
+
+
+def get_slot_table(schedule):
+    return _slot_table(schedule.open_hour, schedule.close_hour, schedule.slot_duration_minutes)
+
+
+@lru_cache(maxsize=32)
+def _slot_table(open_hour, close_hour, slot_duration_minutes):
+    from .models import _build_time_slots
+    return SlotTable([dict(slot) for slot in _build_time_slots(open_hour, close_hour, slot_duration_minutes)])
+
+
+# ==========================================
+# VENUE-DAY BITMAPS
+# ==========================================
+def _day_bounds(day):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+def _bitmap_key(table, venue_id, day, version):
+    return f"availability:bitmap:{venue_id}:{day.isoformat()}:{version}:{table.signature}"
+
+
+def day_masks(table, start_time, end_time, first_day=None, last_day=None):
+    """
+    (day, slot mask) for every local day the interval touches, optionally
+    clipped to [first_day, last_day]. Days whose mask is empty are skipped.
+    """
+    start_local = timezone.localtime(start_time)
+    end_local = timezone.localtime(end_time)
+    # A booking may spill over midnight - clip it to each day it touches
+    day = start_local.date() if first_day is None else max(start_local.date(), first_day)
+    last = end_local.date() if last_day is None else min(end_local.date(), last_day)
+    while day <= last:
+        day_start, _ = _day_bounds(day)
+        start_minute = max(int((start_local - day_start).total_seconds() // 60), 0)
+        end_minute = min(-(-int((end_local - day_start).total_seconds()) // 60), 24 * 60)
+        mask = table.mask_for(start_minute, end_minute)
+        if mask:
+            yield day, mask
+        day += timedelta(days=1)
+
+
+def _empty_bitmaps(venue_ids, first_day, last_day):
+    bitmaps = {}
+    day = first_day
+    while day <= last_day:
+        for venue_id in venue_ids:
+            bitmaps[(venue_id, day)] = 0
+        day += timedelta(days=1)
+    return bitmaps
+
+
+def _reserved_slots(venue_ids, first_day, last_day):
+    from .models import SlotReservation
+
+    return SlotReservation.objects.filter(
+        venue_id__in=venue_ids,
+        date__range=(first_day, last_day)
+    ).values_list('venue_id', 'date', 'slot_index')
+
+
+def compute_bitmaps(table, venue_ids, first_day, last_day):
+    """
+    Occupancy bitmaps for every (venue, day) in the range from ONE indexed
+    lookup on the slot reservation table (see reservations.py).
+    Returns {(venue_id, day): bitmap}; days without bookings map to 0.
+    """
+    bitmaps = _empty_bitmaps(venue_ids, first_day, last_day)
+    for venue_id, day, slot_index in _reserved_slots(venue_ids, first_day, last_day):
+        bitmaps[(venue_id, day)] |= (1 << slot_index) & table.full_mask
+    return bitmaps
+
+
+async def acompute_bitmaps(table, venue_ids, first_day, last_day):
+    bitmaps = _empty_bitmaps(venue_ids, first_day, last_day)
+    async for venue_id, day, slot_index in _reserved_slots(venue_ids, first_day, last_day):
+        bitmaps[(venue_id, day)] |= (1 << slot_index) & table.full_mask
+    return bitmaps
+
+
+def _bitmap_keys(table, venue_ids, first_day, last_day, versions):
+    """{cache key: (venue_id, day)} under each venue's current booking version"""
+    keys = {}
+    day = first_day
+    while day <= last_day:
+        for venue_id in venue_ids:
+            version = versions[booking_index.version_name(venue_id)]
+            keys[_bitmap_key(table, venue_id, day, version)] = (venue_id, day)
+        day += timedelta(days=1)
+    return keys
+
+
+def get_bitmaps(table, venue_ids, first_day, last_day):
+    """
+    Cached version of compute_bitmaps(). Each venue-day bitmap is cached under
+    the venue's booking version, so any write to that venue drops its entries
+    (the stamp moves after the write commits, never before it is visible).
+    Only the missing venues are recomputed, together in one query.
+    """
+    versions = get_versions([booking_index.version_name(v) for v in venue_ids])
+    keys = _bitmap_keys(table, venue_ids, first_day, last_day, versions)
+
+    cached = cache.get_many(list(keys))
+    bitmaps = {keys[key]: bitmap for key, bitmap in cached.items()}
+
+    missing_venues = sorted({venue_id for key, (venue_id, day) in keys.items() if key not in cached})
+    if missing_venues:
+        fresh = compute_bitmaps(table, missing_venues, first_day, last_day)
+        bitmaps.update(fresh)
+        cache.set_many(
+            {key: fresh[target] for key, target in keys.items() if target in fresh},
+            BITMAP_CACHE_TIMEOUT
+        )
+
+    return bitmaps
+
+
+async def aget_bitmaps(table, venue_ids, first_day, last_day):
+    """get_bitmaps() for async views (same cache entries)"""
+    versions = await aget_versions([booking_index.version_name(v) for v in venue_ids])
+    keys = _bitmap_keys(table, venue_ids, first_day, last_day, versions)
+
+    cached = await cache.aget_many(list(keys))
+    bitmaps = {keys[key]: bitmap for key, bitmap in cached.items()}
+
+    missing_venues = sorted({venue_id for key, (venue_id, day) in keys.items() if key not in cached})
+    if missing_venues:
+        fresh = await acompute_bitmaps(table, missing_venues, first_day, last_day)
+        bitmaps.update(fresh)
+        await cache.aset_many(
+            {key: fresh[target] for key, target in keys.items() if target in fresh},
+            BITMAP_CACHE_TIMEOUT
+        )
+
+    return bitmaps
+
+
+def get_day_bitmap(table, venue_id, day):
+    return get_bitmaps(table, [venue_id], day, day)[(venue_id, day)]
+
+
+async def aget_day_bitmap(table, venue_id, day):
+    return (await aget_bitmaps(table, [venue_id], day, day))[(venue_id, day)]
@@ -0,0 +1,177 @@
+import bisect
+import threading
+import time
+from collections import namedtuple
+
+from .caching import aget_version, get_version, bump_version
+
+# Bookings in these states occupy the venue
+ACTIVE_STATUSES = ('APPROVED', 'PENDING')
+
+# A loaded venue is re-read from the database at least this often (seconds),
+# so a write that was rolled back can never poison the index for long.
+INDEX_MAX_AGE = 300
+
+Interval = namedtuple('Interval', ['start', 'end', 'booking_id', 'event_name'])
+
+
+class VenueIntervals:
+    """Active bookings of ONE venue, kept sorted by start time"""
+
+    def __init__(self, intervals, version):
+        self.intervals = sorted(intervals, key=lambda i: (i.start, i.booking_id))
+        self.starts = [i.start for i in self.intervals]
+        # Longest booking seen: anything that can overlap [start, end) must begin after start - max_duration
+        self.max_duration = max((i.end - i.start for i in self.intervals), default=None)
+        self.version = version
+        self.loaded_at = time.monotonic()
+
+    def add(self, interval):
+        pos = bisect.bisect_left(self.starts, interval.start)
+        self.starts.insert(pos, interval.start)
+        self.intervals.insert(pos, interval)
+        duration = interval.end - interval.start
+        if self.max_duration is None or duration > self.max_duration:
+            self.max_duration = duration
+
+    def remove(self, booking_id):
+        for pos, interval in enumerate(self.intervals):
+            if interval.booking_id == booking_id:
+                del self.intervals[pos]
+                del self.starts[pos]
+                return interval
+        return None
+
+    def overlapping(self, start, end):
+        """Every interval with interval.start < end and interval.end > start - O(log n + k)"""
+        if self.max_duration is None:
+            return []
+        lo = bisect.bisect_right(self.starts, start - self.max_duration)
+        hi = bisect.bisect_left(self.starts, end)
+        return [i for i in self.intervals[lo:hi] if i.end > start]
+
+
+class BookingIntervalIndex:
+    """
+    Per-venue interval index of APPROVED and PENDING bookings.
+
+    Each venue is loaded from the database on first use and then kept current
+    by the Booking save/delete receivers in signals.py once each write
+    commits. Other processes learn about a write through the venue's version
+    stamp in the cache backend and reload that venue on their next lookup.
+    """
+
+    def __init__(self):
+        self._venues = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def version_name(venue_id):
+        """Cache stamp bumped on every booking write for the venue"""
+        return f"booking_index:venue:{venue_id}"
+
+    @staticmethod
+    def _rows(venue_id):
+        from .models import Booking
+
+        return Booking.objects.filter(
+            venue_id=venue_id,
+            status__in=ACTIVE_STATUSES
+        ).values_list('start_time', 'end_time', 'id', 'event_name')
+
+    def _load(self, venue_id, version):
+        return VenueIntervals([Interval(*row) for row in self._rows(venue_id)], version)
+
+    def _get(self, venue_id):
+        version = get_version(self.version_name(venue_id))
+        with self._lock:
+            entry = self._fresh(venue_id, version)
+            if entry is None:
+                entry = self._load(venue_id, version)
+                self._venues[venue_id] = entry
+            return entry
+
+    def _fresh(self, venue_id, version):
+        """Our copy of the venue if it is still current, else None"""
+        entry = self._venues.get(venue_id)
+        if entry is None or entry.version != version or time.monotonic() - entry.loaded_at > INDEX_MAX_AGE:
+            return None
+        return entry
+
+    async def _aget(self, venue_id):
+        version = await aget_version(self.version_name(venue_id))
+        with self._lock:
+            entry = self._fresh(venue_id, version)
+        if entry is None:
+            # Loaded outside the lock: the event loop must never wait on it
+            entry = VenueIntervals([Interval(*row) async for row in self._rows(venue_id)], version)
+            with self._lock:
+                self._venues[venue_id] = entry
+        return entry
+
+    # --- Queries ---
+    def clashes(self, venue_id, start, end, exclude_pk=None):
+        """All active bookings of the venue overlapping [start, end), earliest first"""
+        if venue_id is None or start is None or end is None:
+            return []
+        entry = self._get(venue_id)
+        with self._lock:
+            found = entry.overlapping(start, end)
+        return [i for i in found if i.booking_id != exclude_pk]
+
+    def first_clash(self, venue_id, start, end, exclude_pk=None):
+        clashes = self.clashes(venue_id, start, end, exclude_pk=exclude_pk)
+        return clashes[0] if clashes else None
+
+    async def aclashes(self, venue_id, start, end, exclude_pk=None):
+        if venue_id is None or start is None or end is None:
+            return []
+        entry = await self._aget(venue_id)
+        with self._lock:
+            found = entry.overlapping(start, end)
+        return [i for i in found if i.booking_id != exclude_pk]
+
+    async def afirst_clash(self, venue_id, start, end, exclude_pk=None):
+        clashes = await self.aclashes(venue_id, start, end, exclude_pk=exclude_pk)
+        return clashes[0] if clashes else None
+
+    # --- Maintenance (called from signals, after commit) ---
+    def _apply(self, venue_id, change):
+        """Run ``change(entry)`` on our copy if nobody else wrote since we loaded it, else drop it"""
+        new_version = bump_version(self.version_name(venue_id))
+        with self._lock:
+            entry = self._venues.get(venue_id)
+            if entry is None:
+                return
+            if entry.version == new_version - 1:
+                change(entry)
+                entry.version = new_version
+            else:
+                del self._venues[venue_id]
+
+    def booking_saved(self, booking):
+        old_venue_id = booking.get_loaded_value('venue_id')
+        if old_venue_id is not None and old_venue_id != booking.venue_id:
+            self.booking_deleted(booking, venue_id=old_venue_id)
+
+        def change(entry):
+            entry.remove(booking.pk)
+            if booking.status in ACTIVE_STATUSES:
+                entry.add(Interval(booking.start_time, booking.end_time, booking.pk, booking.event_name))
+
+        self._apply(booking.venue_id, change)
+
+    def booking_deleted(self, booking, venue_id=None):
+        self._apply(venue_id or booking.venue_id, lambda entry: entry.remove(booking.pk))
+
+    def invalidate(self, venue_id):
+        bump_version(self.version_name(venue_id))
+        with self._lock:
+            self._venues.pop(venue_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._venues.clear()
+
+
+booking_index = BookingIntervalIndex()
@@ -0,0 +1,113 @@
+from django.db import connections, models, transaction
+from django.utils import timezone
+
+from .models import Booking, Venue
+from .reservations import reservation_conflicts
+from .signals import bookings_bulk_changed, bookings_bulk_deleted
+
+# Rows written per INSERT by bulk_create
+BATCH_SIZE = 500
+
+
+# ==========================================
+# SET-BASED BOOKING WRITES
+# ==========================================
+# Each helper is ONE statement (per batch) instead of a save() / delete() per
+# row. They skip post_save / post_delete, so the caches, counters, slot
+# reservations and QR queue hear about the rows through the bulk signals.
+
+def set_status(queryset, status, by=None):
+    """
+    Change the status of every booking in ``queryset`` with ONE UPDATE.
+    Related rows are loaded once up-front. Bookings that would take a slot
+    already reserved by another booking (e.g. re-approving a rejected one)
+    are left as they are. Returns (updated bookings, conflicting bookings).
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        bookings = list(queryset.select_related('user', 'venue'))
+        if not bookings:
+            return bookings, []
+        # The same venue locks as Booking.save_checked, so no checked save can
+        # take a slot between the conflict check and the UPDATE
+        venue_ids = sorted({b.venue_id for b in bookings})
+        list(Venue.objects.select_for_update().filter(pk__in=venue_ids).order_by('pk').values_list('pk', flat=True))
+
+        for booking in bookings:
+            booking.status = status
+        conflicts = reservation_conflicts(bookings)
+        if conflicts:
+            skipped = {id(booking) for booking in conflicts}
+            bookings = [booking for booking in bookings if id(booking) not in skipped]
+            for booking in conflicts:
+                booking.status = booking.get_loaded_value('status')
+            if not bookings:
+                return bookings, conflicts
+
+        Booking.objects.filter(pk__in=[b.pk for b in bookings]).update(
+            status=status, approved_by=by, approved_at=now, updated_at=now
+        )
+
+        for booking in bookings:
+            booking.approved_by = by
+            booking.approved_at = now
+            booking.updated_at = now
+        # Inside the transaction so the counters commit together with the UPDATE
+        bookings_bulk_changed.send(sender=Booking, bookings=bookings)
+    return bookings, conflicts
+
+
+def create_bookings(bookings, batch_size=BATCH_SIZE):
+    """
+    INSERT unsaved bookings with bulk_create. No validation happens here:
+    callers check times, clashes and reservation_conflicts() first (see
+    series.py, transfer.py).
+    """
+    with transaction.atomic():
+        created = Booking.objects.bulk_create(bookings, batch_size=batch_size)
+        bookings_bulk_changed.send(sender=Booking, bookings=created)
+    return created
+
+
+def _clear_related(booking_ids):
+    """
+    What the deletion collector would do to rows pointing at these bookings,
+    for every relation Booking has: CASCADE deletes them, SET_NULL clears
+    the link. Any other on_delete raises, so a new relation can't be skipped
+    silently; give it a branch here.
+    """
+    for relation in Booking._meta.related_objects:
+        related = relation.related_model._base_manager.filter(**{f"{relation.field.name}__in": booking_ids})
+        if relation.on_delete is models.CASCADE:
+            related.delete()
+        elif relation.on_delete is models.SET_NULL:
+            related.update(**{relation.field.name: None})
+        else:
+            raise NotImplementedError(
+                f"delete_bookings() has no rule for {relation.related_model.__name__}.{relation.field.name}"
+            )
+
+
+def delete_bookings(queryset):
+    """
+    DELETE the bookings of ``queryset`` (and what cascades from them) without
+    loading them one by one through the deletion collector. Returns the deleted bookings.
+    """
+    connection = connections[Booking.objects.db]
+    table = connection.ops.quote_name(Booking._meta.db_table)
+    pk = connection.ops.quote_name(Booking._meta.pk.column)
+    with transaction.atomic(using=connection.alias):
+        bookings = list(queryset)
+        if not bookings:
+            return bookings
+        booking_ids = [b.pk for b in bookings]
+        with connection.cursor() as cursor:
+            for i in range(0, len(booking_ids), BATCH_SIZE):
+                chunk = booking_ids[i:i + BATCH_SIZE]
+                # Plain SQL rather than QuerySet.delete(): with post_delete receivers
+                # connected, that would collect and signal every row, repeating
+                # what bookings_bulk_deleted does below for the whole set
+                _clear_related(chunk)
+                cursor.execute(f"DELETE FROM {table} WHERE {pk} IN ({', '.join(['%s'] * len(chunk))})", chunk)
+        bookings_bulk_deleted.send(sender=Booking, bookings=bookings)
+    return bookings
@@ -0,0 +1,67 @@
+import time
+
+from django.core.cache import cache
+
+
+# ==========================================
+# VERSION STAMPS
+# ==========================================
+# Cached entries embed a version number in their key. Bumping the version
+# makes every entry built from the old data unreachable at once, so we never
+# have to know (or delete) each individual key.
+
+def _version_key(name):
+    return f"version:{name}"
+
+
+def get_version(name):
+    """Return the current version stamp for ``name`` (creating one if needed)"""
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock so an evicted stamp never reuses an old number
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name):
+    """Invalidate everything cached under ``name`` and return the new stamp"""
+    key = _version_key(name)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = int(time.time() * 1000)
+        cache.set(key, version, None)
+        return version
+
+
+def get_versions(names):
+    """Version stamps for many names in one cache round-trip: {name: version}"""
+    keys = {_version_key(name): name for name in names}
+    found = cache.get_many(list(keys))
+    versions = {keys[key]: version for key, version in found.items()}
+    for name in names:
+        if name not in versions:
+            versions[name] = get_version(name)
+    return versions
+
+
+# --- Async twins (async views; same keys, cache.a* methods) ---
+async def aget_version(name):
+    key = _version_key(name)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, int(time.time() * 1000), None)
+        version = await cache.aget(key)
+    return version
+
+
+async def aget_versions(names):
+    keys = {_version_key(name): name for name in names}
+    found = await cache.aget_many(list(keys))
+    versions = {keys[key]: version for key, version in found.items()}
+    for name in names:
+        if name not in versions:
+            versions[name] = await aget_version(name)
+    return versions
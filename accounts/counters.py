@@ -0,0 +1,139 @@
+from collections import Counter
+
+from django.db.models import Case, Count, F, Sum, Value, When
+
+from .models import Booking, UserBookingStats
+
+# Booking.status -> counter column
+STATUS_FIELDS = {
+    'APPROVED': 'approved',
+    'PENDING': 'pending',
+    'REJECTED': 'rejected',
+}
+
+
+# Users updated per statement when many change at once (admin bulk actions)
+UPDATE_CHUNK_SIZE = 500
+
+
+# ==========================================
+# DELTAS
+# ==========================================
+def change_deltas(bookings, deleted=False):
+    """
+    Counter changes caused by writing (or deleting) these bookings:
+    Counter({(user_id, status): +/-n}). A booking read from the database
+    first gives back its old (user, status); the new one is added unless deleted.
+    """
+    deltas = Counter()
+    for booking in bookings:
+        old_user = booking.get_loaded_value('user_id')
+        old_status = booking.get_loaded_value('status')
+        if old_user is not None:
+            deltas[(old_user, old_status)] -= 1
+        if deleted:
+            if old_user is None:
+                deltas[(booking.user_id, booking.status)] -= 1
+        else:
+            deltas[(booking.user_id, booking.status)] += 1
+    return Counter({key: n for key, n in deltas.items() if n})
+
+
+def apply_deltas(deltas, create_missing=True):
+    """
+    Apply deltas with F() expressions: one UPDATE per chunk of users, whatever
+    their number. Users without a stats row are rebuilt from scratch instead
+    (which already includes the write).
+    """
+    per_user = {}
+    for (user_id, status), n in deltas.items():
+        field = STATUS_FIELDS.get(status)
+        if field:
+            per_user.setdefault(user_id, {})[field] = n
+
+    user_ids = list(per_user)
+    missing = []
+    for i in range(0, len(user_ids), UPDATE_CHUNK_SIZE):
+        chunk = user_ids[i:i + UPDATE_CHUNK_SIZE]
+        if len(chunk) == 1:
+            changes = per_user[chunk[0]]
+            updated = UserBookingStats.objects.filter(user_id=chunk[0]).update(
+                **{field: F(field) + n for field, n in changes.items()}
+            )
+            missing += chunk if not updated else []
+            continue
+
+        existing = set(UserBookingStats.objects.filter(user_id__in=chunk).values_list('user_id', flat=True))
+        missing += [user_id for user_id in chunk if user_id not in existing]
+        fields = {field for user_id in chunk for field in per_user[user_id]}
+        UserBookingStats.objects.filter(user_id__in=existing).update(**{
+            field: F(field) + Case(
+                *[When(user_id=user_id, then=Value(per_user[user_id][field]))
+                  for user_id in existing if field in per_user[user_id]],
+                default=Value(0),
+            )
+            for field in fields
+        })
+
+    if missing and create_missing:
+        rebuild_counters(user_ids=missing)
+
+
+# ==========================================
+# READ / REBUILD
+# ==========================================
+def count_bookings(user_ids=None):
+    """Recount from the Booking table: {user_id: {'approved': n, 'pending': n, 'rejected': n}}"""
+    rows = Booking.objects.order_by().values('user_id', 'status').annotate(n=Count('id'))
+    if user_ids is not None:
+        rows = rows.filter(user_id__in=user_ids)
+
+    counts = {}
+    for row in rows:
+        field = STATUS_FIELDS.get(row['status'])
+        if field:
+            counts.setdefault(row['user_id'], dict.fromkeys(STATUS_FIELDS.values(), 0))[field] = row['n']
+    return counts
+
+
+def rebuild_counters(user_ids=None):
+    """Overwrite the stats rows of ``user_ids`` (or everyone) with fresh counts. Returns rows written."""
+    counts = count_bookings(user_ids)
+    if user_ids is None:
+        # Users whose bookings are all gone must drop back to zero
+        stale = UserBookingStats.objects.exclude(user_id__in=list(counts))
+        stale.update(approved=0, pending=0, rejected=0)
+    else:
+        for user_id in user_ids:
+            counts.setdefault(user_id, dict.fromkeys(STATUS_FIELDS.values(), 0))
+
+    UserBookingStats.objects.bulk_create(
+        [UserBookingStats(user_id=user_id, **values) for user_id, values in counts.items()],
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=list(STATUS_FIELDS.values()),
+        batch_size=500,
+    )
+    return len(counts)
+
+
+def get_counts(user):
+    """The user's counters in one lookup (built on first use)"""
+    stats = UserBookingStats.objects.filter(user=user).first()
+    if stats is None:
+        rebuild_counters(user_ids=[user.pk])
+        stats = UserBookingStats.objects.get(user=user)
+    return stats
+
+
+def estimated_total(user=None, status=None):
+    """
+    Bookings of ``user`` (or everyone) in ``status`` (or any) read from the
+    counters instead of a COUNT(*) over Booking. Exact while the counters are.
+    """
+    fields = [STATUS_FIELDS[status]] if status in STATUS_FIELDS else list(STATUS_FIELDS.values())
+    if user is not None:
+        stats = get_counts(user)
+        return sum(getattr(stats, field) for field in fields)
+    totals = UserBookingStats.objects.aggregate(**{field: Sum(field) for field in fields})
+    return sum(value or 0 for value in totals.values())
@@ -0,0 +1,292 @@
+import hashlib
+import posixpath
+import re
+from datetime import timedelta
+from io import BytesIO
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+# Largest booking document accepted; the upload stops being written at this size
+DOCUMENT_MAX_SIZE = 10 * 1024 * 1024
+
+# Accepted extensions: (served content type, leading bytes the file must start with)
+DOCUMENT_TYPES = {
+    'pdf': ('application/pdf', (b'%PDF-',)),
+    'png': ('image/png', (b'\x89PNG\r\n\x1a\n',)),
+    'jpg': ('image/jpeg', (b'\xff\xd8\xff',)),
+    'jpeg': ('image/jpeg', (b'\xff\xd8\xff',)),
+    'doc': ('application/msword', (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1',)),
+    'docx': ('application/vnd.openxmlformats-officedocument.wordprocessingml.document', (b'PK\x03\x04',)),
+}
+
+# Bytes read from the start of an upload to check its type
+SNIFF_SIZE = max(len(magic) for _, signatures in DOCUMENT_TYPES.values() for magic in signatures)
+
+# Upload fields streamed by DocumentUploadHandler (others go to Django's handlers)
+DOCUMENT_FIELDS = ('document',)
+
+# Unreferenced documents younger than this are kept: their booking may not be saved yet
+PRUNE_GRACE = timedelta(hours=1)
+
+# Bytes per read when streaming a document out
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+HASH_NAME = re.compile(r'^[0-9a-f]{64}$')
+
+
+# ==========================================
+# LIMITS
+# ==========================================
+def document_extension(name):
+    return posixpath.splitext(name or '')[1].lstrip('.').lower()
+
+
+def document_error(name, size=None, head=None):
+    """Why a document can't be accepted, or None. Checks what is known so far."""
+    extension = document_extension(name)
+    if extension not in DOCUMENT_TYPES:
+        return "Only PDF, Word, PNG or JPEG documents can be uploaded."
+    if size is not None and size > DOCUMENT_MAX_SIZE:
+        return f"Documents can be at most {DOCUMENT_MAX_SIZE // (1024 * 1024)} MB."
+    if head is not None and not head.startswith(DOCUMENT_TYPES[extension][1]):
+        return f"The file's contents do not match its .{extension} extension."
+    return None
+
+
+def validate_document(value):
+    """
+    Booking.document validator: reports what DocumentUploadHandler refused,
+    and checks new files that did not come through it. Stored files passed
+    on their way in, so they are not read again.
+    """
+    if not value or getattr(value, '_committed', True):
+        return
+    upload = value.file
+    reason = getattr(upload, 'reason', None)
+    if reason is None and getattr(upload, 'sha256', None) is None:
+        upload.seek(0)
+        head = upload.read(SNIFF_SIZE)
+        upload.seek(0)
+        reason = document_error(upload.name, upload.size, head)
+    if reason:
+        raise ValidationError(reason)
+
+
+# ==========================================
+# STREAMED UPLOADS
+# ==========================================
+class RejectedUpload(UploadedFile):
+    """Stands in for a document the handler refused, so the form can say why"""
+
+    def __init__(self, name, content_type, size, reason):
+        super().__init__(BytesIO(), name, content_type, size)
+        self.reason = reason
+
+
+class DocumentUploadHandler(FileUploadHandler):
+    """
+    Writes DOCUMENT_FIELDS uploads chunk by chunk to a temporary file,
+    hashing as they arrive and checking type and size on the way: nothing
+    is held in memory, and a refused upload is read to its end but no
+    longer written. Other file fields fall through to the next handler.
+    """
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.active = field_name in DOCUMENT_FIELDS
+        if not self.active:
+            return
+        self.hasher = hashlib.sha256()
+        self.head = b''
+        self.file = None
+        self.reason = document_error(file_name, content_length)
+        if not self.reason:
+            self.file = TemporaryUploadedFile(file_name, content_type, 0, charset, content_type_extra)
+        raise StopFutureHandlers()
+
+    def refuse(self, reason):
+        self.reason = reason
+        if self.file is not None:
+            self.file.close()  # deletes the temporary file
+            self.file = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.active:
+            return raw_data
+        if self.reason:
+            return None
+
+        if len(self.head) < SNIFF_SIZE:
+            self.head += raw_data[:SNIFF_SIZE - len(self.head)]
+            if len(self.head) == SNIFF_SIZE:
+                reason = document_error(self.file_name, head=self.head)
+                if reason:
+                    self.refuse(reason)
+                    return None
+        reason = document_error(self.file_name, start + len(raw_data))
+        if reason:
+            self.refuse(reason)
+            return None
+
+        self.hasher.update(raw_data)
+        self.file.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if not self.active:
+            return None
+        if not self.reason:
+            # Files shorter than SNIFF_SIZE are only checked here
+            reason = document_error(self.file_name, file_size, self.head)
+            if reason:
+                self.refuse(reason)
+        if self.reason:
+            return RejectedUpload(self.file_name, self.content_type, file_size, self.reason)
+
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.hasher.hexdigest()
+        return self.file
+
+
+# ==========================================
+# CONTENT-ADDRESSED STORE
+# ==========================================
+def content_digest(content):
+    """sha256 of a file: taken while streaming when it came through the handler, else read now"""
+    digest = getattr(content, 'sha256', None)
+    if digest:
+        return digest
+    hasher = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        hasher.update(chunk if isinstance(chunk, bytes) else chunk.encode())
+    content.seek(0)
+    return hasher.hexdigest()
+
+
+@deconstructible
+class DocumentStorage(FileSystemStorage):
+    """
+    Stores a document under upload_to/<aa>/<sha256>.<ext>, so however many
+    bookings (re)submit the same file it is written once. Saving bytes that
+    are already stored returns the existing name without writing anything.
+    """
+
+    def save(self, name, content, max_length=None):
+        if not hasattr(content, 'chunks'):
+            return super().save(name, content, max_length)
+        name = name or content.name
+        digest = content_digest(content)
+        extension = document_extension(name)
+        name = posixpath.join(posixpath.dirname(name), digest[:2], f"{digest}.{extension}" if extension else digest)
+        if self.exists(name):
+            return name
+        # A concurrent save of the same bytes can still win the race; the
+        # loser then lands under a suffixed name: one spare copy, still correct
+        return super().save(name, content, max_length)
+
+
+def document_digest(name):
+    """The content hash of a stored document (documents stored before hashing get one of their name)"""
+    stem = posixpath.splitext(posixpath.basename(name))[0]
+    return stem if HASH_NAME.match(stem) else hashlib.sha256(name.encode()).hexdigest()
+
+
+def document_url(booking):
+    """Content-addressed URL of the booking's document, or None"""
+    if not booking.document:
+        return None
+    return reverse('booking_document', args=[booking.id, document_digest(booking.document.name)])
+
+
+def document_content_type(name):
+    return DOCUMENT_TYPES.get(document_extension(name), ('application/octet-stream',))[0]
+
+
+def prune_documents():
+    """Delete stored documents no booking refers to any more. Returns the count."""
+    from .models import Booking
+
+    field = Booking._meta.get_field('document')
+    storage = field.storage
+    root = field.upload_to.rstrip('/')
+    keep = set(Booking.objects.exclude(document='').exclude(document__isnull=True).values_list('document', flat=True).distinct())
+    cutoff = timezone.now() - PRUNE_GRACE
+
+    deleted = 0
+    pending = [root]
+    while pending:
+        directory = pending.pop()
+        if not storage.exists(directory):
+            continue
+        directories, files = storage.listdir(directory)
+        pending.extend(f"{directory}/{sub}" for sub in directories)
+        for file_name in files:
+            name = f"{directory}/{file_name}"
+            if name not in keep and storage.get_modified_time(name) < cutoff:
+                storage.delete(name)
+                deleted += 1
+    return deleted
+
+
+# ==========================================
+# RANGED DOWNLOADS
+# ==========================================
+def parse_range(header, size):
+    """
+    (start, end) inclusive of a single 'bytes=' range, None to send the whole
+    file (no header, several ranges, or one we don't understand), or
+    'unsatisfiable' when it lies past the end.
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    first, _, last = header[len('bytes='):].strip().partition('-')
+    try:
+        if not first:
+            length = int(last)  # the last N bytes
+            if length <= 0:
+                return 'unsatisfiable'
+            return max(size - length, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        return 'unsatisfiable'
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+def iter_file(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(DOWNLOAD_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+async def aiter_file(path, start, length):
+    """iter_file for ASGI: the reads run in a thread, one chunk at a time"""
+    f = await sync_to_async(open, thread_sensitive=False)(path, 'rb')
+    try:
+        await sync_to_async(f.seek, thread_sensitive=False)(start)
+        while length > 0:
+            chunk = await sync_to_async(f.read, thread_sensitive=False)(min(DOWNLOAD_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
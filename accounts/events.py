@@ -0,0 +1,397 @@
+import asyncio
+import itertools
+import json
+import logging
+import queue
+import threading
+import time
+from collections import deque, namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Carries events between workers unless settings.AVAILABILITY_EVENTS_BACKEND says otherwise
+DEFAULT_BACKEND = 'accounts.events.DatabaseBackend'
+
+# How often each worker's pump asks a polling backend for new events (seconds)
+POLL_INTERVAL = 0.5
+
+# Polls re-read this many ids below the newest seen: ids are taken at insert but
+# become visible at commit, so a lower one can show up after a higher one
+REREAD_IDS = 100
+
+# Events kept for clients reconnecting with Last-Event-ID
+EVENT_RETENTION = timedelta(minutes=15)
+
+# Old events are pruned on every this many-th publish
+PRUNE_EVERY = 100
+
+# One write touching more venue-days than this sends a 'reload' per venue instead
+MAX_DAY_EVENTS = 200
+
+# A comment line goes out this often so proxies keep an idle stream open (seconds)
+KEEPALIVE_INTERVAL = 15
+
+# Streams end after this long; EventSource reconnects by itself, with Last-Event-ID
+STREAM_MAX_AGE = 5 * 60
+
+# Reconnect delay suggested to the browser (ms)
+RETRY_MS = 3000
+
+# date is None for venue-wide events
+Event = namedtuple('Event', 'id venue_id date data')
+
+
+# ==========================================
+# BACKENDS
+# ==========================================
+# publish([(venue_id, date, data), ...]) -> [Event, ...]
+# read(after_id) -> events with a larger id, oldest first
+# polling: True when other workers publish too, so the broker has to read()
+class LocalBackend:
+    """This process only: events go straight to local subscribers (runserver, tests)"""
+    polling = False
+
+    def __init__(self, keep=1000):
+        self._ids = itertools.count(1)
+        self._recent = deque(maxlen=keep)
+        self._lock = threading.Lock()
+
+    def publish(self, items):
+        with self._lock:
+            events = [Event(next(self._ids), venue_id, day, data) for venue_id, day, data in items]
+            self._recent.extend(events)
+        return events
+
+    def read(self, after_id):
+        with self._lock:
+            return [event for event in self._recent if event.id > after_id]
+
+    def last_id(self):
+        with self._lock:
+            return self._recent[-1].id if self._recent else 0
+
+
+class DatabaseBackend:
+    """Events as AvailabilityEvent rows, read by every worker's pump"""
+    polling = True
+
+    def __init__(self):
+        self._published = 0
+
+    def publish(self, items):
+        from .models import AvailabilityEvent
+
+        rows = AvailabilityEvent.objects.bulk_create([
+            AvailabilityEvent(venue_id=venue_id, date=day, data=data) for venue_id, day, data in items
+        ])
+        self._published += 1
+        if self._published % PRUNE_EVERY == 0:
+            AvailabilityEvent.objects.filter(created_at__lt=timezone.now() - EVENT_RETENTION).delete()
+        return [Event(row.id, row.venue_id, row.date, row.data) for row in rows]
+
+    def read(self, after_id, limit=500):
+        from .models import AvailabilityEvent
+
+        rows = AvailabilityEvent.objects.filter(id__gt=after_id).order_by('id').values_list('id', 'venue_id', 'date', 'data')[:limit]
+        return [Event(*row) for row in rows]
+
+    def last_id(self):
+        from .models import AvailabilityEvent
+
+        return AvailabilityEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+# ==========================================
+# BROKER
+# ==========================================
+class Subscription:
+    """
+    Events of one venue (or one venue-day) for one stream. Filled from the
+    pump thread; read with get() in a sync stream or aget() in an async one.
+    """
+
+    def __init__(self, venue_id, day=None, last_id=0, loop=None):
+        self.venue_id = venue_id
+        self.day = day
+        self.last_id = last_id
+        self.loop = loop
+        self.queue = asyncio.Queue() if loop else queue.SimpleQueue()
+        self._start_id = last_id
+        self._seen = set()
+
+    def wants(self, event):
+        return event.venue_id == self.venue_id and (self.day is None or event.date in (None, self.day))
+
+    def put(self, event):
+        if self.loop:
+            try:
+                self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+            except RuntimeError:
+                pass  # the loop is gone; the stream unsubscribes as it unwinds
+        else:
+            self.queue.put(event)
+
+    def _fresh(self, event):
+        # Replayed and pumped events may overlap right after subscribing, and a
+        # late-committed event may come in below ones already sent
+        if event.id <= self._start_id or event.id in self._seen:
+            return False
+        self._seen.add(event.id)
+        self.last_id = max(self.last_id, event.id)
+        self._seen = {seen for seen in self._seen if seen > self.last_id - REREAD_IDS}
+        return True
+
+    def get(self, timeout):
+        """Next event, or None after ``timeout`` seconds without one"""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                event = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                return None
+            if self._fresh(event):
+                return event
+
+    async def aget(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                event = await asyncio.wait_for(self.queue.get(), max(deadline - time.monotonic(), 0))
+            except asyncio.TimeoutError:
+                return None
+            if self._fresh(event):
+                return event
+
+
+class Broker:
+    """
+    Fans events out to this process's subscriptions. With a polling backend
+    ONE pump thread per worker reads new events, however many streams are
+    open, and stops when the last one closes.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+        self._pump = None
+
+    def publish(self, items):
+        events = self.backend.publish(items) if items else []
+        if not self.backend.polling:
+            self.dispatch(events)
+        return events
+
+    def dispatch(self, events):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for event in events:
+            for subscription in subscriptions:
+                if subscription.wants(event):
+                    subscription.put(event)
+
+    def subscribe(self, venue_id, day=None, last_event_id=None, loop=None):
+        """
+        Start receiving the venue's events. A reconnecting client passes its
+        Last-Event-ID and first gets what it missed, as far as the backend kept it.
+        """
+        if last_event_id is None:
+            subscription = Subscription(venue_id, day, self.backend.last_id(), loop)
+        else:
+            subscription = Subscription(venue_id, day, last_event_id, loop)
+            for event in self.backend.read(last_event_id):
+                if subscription.wants(event):
+                    subscription.put(event)
+
+        with self._lock:
+            self._subscriptions.add(subscription)
+            if self.backend.polling and self._pump is None:
+                self._pump = threading.Thread(target=self._run_pump, args=(subscription.last_id,), name='availability-events', daemon=True)
+                self._pump.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def _run_pump(self, last_id):
+        seen = set()
+        try:
+            while True:
+                with self._lock:
+                    if not self._subscriptions:
+                        self._pump = None
+                        return
+                try:
+                    events = [event for event in self.backend.read(max(last_id - REREAD_IDS, 0)) if event.id not in seen]
+                except Exception:
+                    logger.exception("Reading availability events failed")
+                    connection.close()  # reconnect on the next round
+                    events = []
+                if events:
+                    last_id = max(last_id, events[-1].id)
+                    seen = {seen_id for seen_id in seen if seen_id > last_id - REREAD_IDS}
+                    seen.update(event.id for event in events)
+                    self.dispatch(events)
+                else:
+                    time.sleep(POLL_INTERVAL)
+        finally:
+            connection.close()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """The process-wide broker over the configured backend"""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                backend = import_string(getattr(settings, 'AVAILABILITY_EVENTS_BACKEND', DEFAULT_BACKEND))
+                _broker = Broker(backend())
+    return _broker
+
+
+def reset_broker():
+    """Forget the broker, e.g. after the backend setting changed"""
+    global _broker
+    with _broker_lock:
+        _broker = None
+
+
+# ==========================================
+# SLOT-STATE EVENTS
+# ==========================================
+def booking_action(booking, deleted=False):
+    """What a write did to one booking: created / deleted / approved / rejected / pending / modified"""
+    if deleted:
+        return 'deleted'
+    previous_status = booking.get_loaded_value('status')
+    if previous_status is None:
+        return 'created'
+    if previous_status != booking.status:
+        return booking.status.lower()
+    return 'modified'
+
+
+def moves_slots(booking):
+    """False for writes that leave venue, times and status alone (e.g. storing the QR pass)"""
+    return any(
+        booking.get_loaded_value(field) != getattr(booking, field)
+        for field in ('venue_id', 'start_time', 'end_time', 'status')
+    )
+
+
+def venue_days(booking):
+    """(venue_id, local date) of every day the booking covers, before and after the write"""
+    touched = set()
+    versions = (
+        (booking.venue_id, booking.start_time, booking.end_time),
+        (booking.get_loaded_value('venue_id'), booking.get_loaded_value('start_time'), booking.get_loaded_value('end_time')),
+    )
+    for venue_id, start_time, end_time in versions:
+        if venue_id is None or start_time is None or end_time is None:
+            continue
+        day, last = timezone.localtime(start_time).date(), timezone.localtime(end_time).date()
+        while day <= last:
+            touched.add((venue_id, day))
+            day += timedelta(days=1)
+    return touched
+
+
+def slot_events(changes):
+    """
+    Events for {(venue_id, date): [{'booking_id', 'action'}, ...]}: each day's
+    new slot state from ONE lookup on the slot reservations. Past
+    MAX_DAY_EVENTS, every venue gets one 'reload' event instead.
+    """
+    from .availability import compute_bitmaps, get_slot_table
+    from .models import VenueSchedule
+
+    if len(changes) > MAX_DAY_EVENTS:
+        return [(venue_id, None, {'type': 'reload', 'venue_id': venue_id}) for venue_id in sorted({v for v, _ in changes})]
+
+    table = get_slot_table(VenueSchedule.get_schedule())
+    days = [day for _, day in changes]
+    bitmaps = compute_bitmaps(table, sorted({v for v, _ in changes}), min(days), max(days))
+    items = []
+    for (venue_id, day), bookings in sorted(changes.items()):
+        bitmap = bitmaps[(venue_id, day)]
+        items.append((venue_id, day, {
+            'type': 'slots',
+            'venue_id': venue_id,
+            'date': day.isoformat(),
+            'booked': table.as_string(bitmap),
+            'free_count': table.free_count(bitmap),
+            'changes': bookings,
+        }))
+    return items
+
+
+def booking_changes(bookings, deleted=False):
+    """
+    {(venue_id, date): [{'booking_id', 'action'}, ...]} of a write. Taken in
+    the signal itself: by commit time save() has reset the loaded values.
+    """
+    changes = {}
+    for booking in bookings:
+        if not deleted and not moves_slots(booking):
+            continue
+        change = {'booking_id': booking.pk, 'action': booking_action(booking, deleted)}
+        for venue_day in venue_days(booking):
+            changes.setdefault(venue_day, []).append(change)
+    return changes
+
+
+def publish_changes(changes):
+    """Push the new slot state of every changed venue-day (after commit, see signals.py)"""
+    if changes:
+        get_broker().publish(slot_events(changes))
+
+
+# ==========================================
+# SSE FRAMING
+# ==========================================
+def sse_message(event_type, data, event_id=None):
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines.append(f'event: {event_type}')
+    lines.append(f'data: {json.dumps(data, separators=(",", ":"))}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def sse_event(event):
+    return sse_message(event.data.get('type', 'slots'), event.data, event.id)
+
+
+def stream_events(subscription, first=''):
+    """Sync stream (WSGI): one thread is parked per open stream"""
+    broker = get_broker()
+    try:
+        yield f'retry: {RETRY_MS}\n\n{first}'
+        deadline = time.monotonic() + STREAM_MAX_AGE
+        while time.monotonic() < deadline:
+            event = subscription.get(KEEPALIVE_INTERVAL)
+            yield sse_event(event) if event else ': keepalive\n\n'
+    finally:
+        broker.unsubscribe(subscription)
+
+
+async def astream_events(subscription, first=''):
+    """Async stream (ASGI): an open stream costs a queue, not a thread"""
+    broker = get_broker()
+    try:
+        yield f'retry: {RETRY_MS}\n\n{first}'
+        deadline = time.monotonic() + STREAM_MAX_AGE
+        while time.monotonic() < deadline:
+            event = await subscription.aget(KEEPALIVE_INTERVAL)
+            yield sse_event(event) if event else ': keepalive\n\n'
+    finally:
+        broker.unsubscribe(subscription)
@@ -0,0 +1,135 @@
+import hashlib
+from datetime import timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.core.signing import Signer
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+
+from .booking_index import booking_index
+from .caching import get_versions
+from .fragments import user_bookings_version_name
+from .models import Booking
+from .venue_matcher import VENUES_VERSION_NAME
+
+# Salt of the feed URL tokens; changing it revokes every subscription link
+FEED_SALT = 'accounts.feeds'
+
+FEED_KINDS = ('venue', 'user')
+
+# Bookings that ended longer ago than this drop out of the feed
+FEED_HISTORY = timedelta(days=90)
+
+# Validators are rebuilt at least this often even without writes, as the window moves
+FEED_CACHE_TIMEOUT = 60 * 60
+
+# Rows read per round trip while streaming a feed
+FEED_CHUNK_SIZE = 500
+
+# Longest content line in octets before folding (RFC 5545, 3.1)
+ICS_LINE_LIMIT = 75
+
+
+# ==========================================
+# TOKENS
+# ==========================================
+def feed_token(kind, obj_id):
+    return Signer(salt=FEED_SALT).signature(f"{kind}:{obj_id}")
+
+
+def check_feed_token(kind, obj_id, token):
+    return kind in FEED_KINDS and constant_time_compare(feed_token(kind, obj_id), token or '')
+
+
+# ==========================================
+# VALIDATORS (ETag / Last-Modified)
+# ==========================================
+def feed_bookings(kind, obj_id):
+    """APPROVED bookings of the venue / user that have not long ended"""
+    return Booking.objects.filter(
+        status='APPROVED',
+        end_time__gte=timezone.now() - FEED_HISTORY,
+        **{f'{kind}_id': obj_id}
+    )
+
+
+def _feed_versions(kind, obj_id):
+    # The venue stamp is the clash index's, bumped by every booking write for the venue
+    name = booking_index.version_name(obj_id) if kind == 'venue' else user_bookings_version_name(obj_id)
+    versions = get_versions([name, VENUES_VERSION_NAME])
+    return versions[name], versions[VENUES_VERSION_NAME]
+
+
+def feed_stamp(kind, obj_id):
+    """
+    (ETag, Last-Modified) of a feed: the count and latest updated_at of its
+    bookings. Cached under the feed's version stamps, so a poll that ends in
+    a 304 reads only the cache.
+    """
+    version, venues_version = _feed_versions(kind, obj_id)
+    key = f"feed:stamp:{kind}:{obj_id}:{version}:{venues_version}"
+    stamp = cache.get(key)
+    if stamp is None:
+        row = feed_bookings(kind, obj_id).order_by().aggregate(count=Count('id'), latest=Max('updated_at'))
+        latest = row['latest']
+        raw = f"{kind}:{obj_id}:{row['count']}:{latest.isoformat() if latest else ''}:{venues_version}"
+        stamp = (f'"{hashlib.md5(raw.encode()).hexdigest()}"', latest)
+        cache.set(key, stamp, FEED_CACHE_TIMEOUT)
+    return stamp
+
+
+# ==========================================
+# ICS RENDERING
+# ==========================================
+def ics_escape(value):
+    return (value or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n')
+
+
+def ics_time(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def ics_line(line):
+    """One content line, folded at ICS_LINE_LIMIT octets, CRLF-terminated"""
+    data = line.encode()
+    if len(data) <= ICS_LINE_LIMIT:
+        return line + '\r\n'
+    parts, limit = [], ICS_LINE_LIMIT
+    while data:
+        cut = min(limit, len(data))
+        # Never split a multi-byte UTF-8 character
+        while cut < len(data) and (data[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(data[:cut].decode())
+        data = data[cut:]
+        limit = ICS_LINE_LIMIT - 1  # continuation lines start with a space
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def stream_ics(kind, obj_id, title, host='university-portal'):
+    """The feed as a generator of CRLF lines, read from the database in chunks"""
+    yield ics_line('BEGIN:VCALENDAR')
+    yield ics_line('VERSION:2.0')
+    yield ics_line('PRODID:-//University Portal//Venue Bookings//EN')
+    yield ics_line('CALSCALE:GREGORIAN')
+    yield ics_line(f'X-WR-CALNAME:{ics_escape(title)}')
+    yield ics_line('REFRESH-INTERVAL;VALUE=DURATION:PT15M')
+
+    rows = feed_bookings(kind, obj_id).order_by('start_time', 'id').values_list(
+        'id', 'event_name', 'description', 'start_time', 'end_time', 'updated_at', 'venue__name', 'venue__location'
+    )
+    for booking_id, event_name, description, start_time, end_time, updated_at, venue_name, location in rows.iterator(chunk_size=FEED_CHUNK_SIZE):
+        yield ics_line('BEGIN:VEVENT')
+        yield ics_line(f'UID:booking-{booking_id}@{host}')
+        yield ics_line(f'DTSTAMP:{ics_time(updated_at)}')
+        yield ics_line(f'DTSTART:{ics_time(start_time)}')
+        yield ics_line(f'DTEND:{ics_time(end_time)}')
+        yield ics_line(f'SUMMARY:{ics_escape(event_name or "Booking")}')
+        yield ics_line(f'LOCATION:{ics_escape(f"{venue_name} ({location})")}')
+        if description:
+            yield ics_line(f'DESCRIPTION:{ics_escape(description)}')
+        yield ics_line('STATUS:CONFIRMED')
+        yield ics_line('END:VEVENT')
+
+    yield ics_line('END:VCALENDAR')
@@ -1,5 +1,10 @@
 from django import forms
-from .models import Venue, Booking, VenueSchedule
+from .models import Venue, Booking, BookingSeries, VenueSchedule
+from .documents import DOCUMENT_TYPES
+from .series import MAX_OCCURRENCES
+
+# File picker filter for booking documents (the server checks the contents anyway)
+DOCUMENT_ACCEPT = ','.join(f'.{extension}' for extension in DOCUMENT_TYPES)
 
 class VenueSearchForm(forms.Form):
     query = forms.CharField(
@@ -17,6 +22,25 @@ class BookingForm(forms.ModelForm):
         widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
     )
 
+    # Recurring series (optional): repeat the same slot daily / weekly
+    repeat = forms.ChoiceField(
+        required=False,
+        choices=[('', 'Does not repeat')] + BookingSeries.FREQUENCY_CHOICES,
+        widget=forms.Select(attrs={'class': 'form-control', 'id': 'id_repeat'})
+    )
+    repeat_count = forms.IntegerField(
+        required=False,
+        min_value=2,
+        max_value=MAX_OCCURRENCES,
+        label='Occurrences',
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'e.g. 14'})
+    )
+    skip_conflicts = forms.BooleanField(
+        required=False,
+        label='Book the free dates and skip the ones that clash',
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
+    )
+
     class Meta:
         model = Booking
         fields = ['purpose', 'event_name', 'venue', 'description', 'addon_equipment', 'document', 'start_time', 'end_time', 'time_slot']
@@ -31,7 +55,7 @@ class BookingForm(forms.ModelForm):
                 'rows': 2,
                 'placeholder': 'Need extras? List them here (e.g. 1x Microphone, 2x Whiteboard Markers)...'
             }),
-            'document': forms.FileInput(attrs={'class': 'form-control'}),
+            'document': forms.FileInput(attrs={'class': 'form-control', 'accept': DOCUMENT_ACCEPT}),
             'start_time': forms.DateTimeInput(attrs={'class': 'form-control', 'type': 'datetime-local', 'id': 'id_start_time'}),
             'end_time': forms.DateTimeInput(attrs={'class': 'form-control', 'type': 'datetime-local', 'id': 'id_end_time'}),
             'time_slot': forms.Select(attrs={'class': 'form-control', 'id': 'id_time_slot'}),
@@ -53,3 +77,8 @@ class BookingForm(forms.ModelForm):
         self.fields['time_slot'].choices = slot_choices
         self.fields['time_slot'].required = False
 
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('repeat') and not cleaned_data.get('repeat_count'):
+            self.add_error('repeat_count', 'How many times should the booking repeat?')
+        return cleaned_data
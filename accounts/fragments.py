@@ -0,0 +1,36 @@
+from .caching import get_versions
+
+# Writes drop fragments through the version stamps; this only bounds how long an unused one lingers
+FRAGMENT_TIMEOUT = 60 * 60
+
+
+# ==========================================
+# RENDERED FRAGMENTS
+# ==========================================
+# Pages wrap their expensive parts in {% cache fragment_timeout <name> fragment_version ... %}.
+# fragment_version joins the stamps the fragment was built from, and
+# signals.py bumps those on every Venue / Booking write, so a stale fragment
+# is never served and nothing has to find and delete it.
+
+def user_bookings_version_name(user_id):
+    """Cache stamp bumped on every write to one of the user's bookings"""
+    return f"bookings:user:{user_id}"
+
+
+def user_version_name(user_id):
+    """Cache stamp bumped on every write to the user account (the organizer shown on their bookings)"""
+    return f"user:{user_id}"
+
+
+def booking_version_name(booking_id):
+    """Cache stamp bumped on every write to the booking"""
+    return f"booking:{booking_id}"
+
+
+def fragment_context(*names):
+    """Template context for a page's {% cache %} blocks, stamps of ``names`` read in one round-trip"""
+    versions = get_versions(names)
+    return {
+        'fragment_timeout': FRAGMENT_TIMEOUT,
+        'fragment_version': ':'.join(str(versions[name]) for name in names),
+    }
@@ -0,0 +1,248 @@
+import logging
+import uuid
+from datetime import timedelta
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import BackgroundJob, Booking
+from .passes import DEFAULT_PASS_SIZE, pass_digest, pass_name, pass_payload, render_pass, store_pass
+
+logger = logging.getLogger(__name__)
+
+# A failing job is retried until it has been attempted this many times
+MAX_ATTEMPTS = 3
+
+# A job still RUNNING this long after it was claimed is taken to have died with
+# its worker and is queued again (or failed, once out of attempts)
+LEASE_TIMEOUT = timedelta(minutes=15)
+
+# Finished jobs are kept this long for the admin, then pruned by the worker
+DONE_RETENTION = timedelta(days=7)
+
+# Keys are checked for duplicates this many at a time
+ENQUEUE_CHUNK_SIZE = 500
+
+# kind -> handler(jobs, pool) returning {job_id: error message} for the jobs that failed
+HANDLERS = {}
+
+
+def register(kind):
+    """Register a batch handler for a job kind"""
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+# ==========================================
+# ENQUEUE
+# ==========================================
+def enqueue(kind, key='', **payload):
+    """Queue one job unless an identical (kind, key) job is already waiting"""
+    return _enqueue_items(kind, [(str(key), payload)])
+
+
+def enqueue_many(kind, payloads):
+    """Queue one job per {key: payload}, skipping keys already queued or running. Returns the count queued."""
+    return _enqueue_items(kind, [(str(key), payload) for key, payload in payloads.items()])
+
+
+def _enqueue_items(kind, items):
+    queued = 0
+    for i in range(0, len(items), ENQUEUE_CHUNK_SIZE):
+        chunk = items[i:i + ENQUEUE_CHUNK_SIZE]
+        waiting = set(BackgroundJob.objects.filter(
+            kind=kind,
+            key__in=[key for key, _ in chunk if key],
+            status__in=['QUEUED', 'RUNNING']
+        ).values_list('key', flat=True))
+
+        # A blank key opts out of de-duplication
+        jobs = [BackgroundJob(kind=kind, key=key, payload=payload) for key, payload in chunk if not key or key not in waiting]
+        BackgroundJob.objects.bulk_create(jobs)
+        queued += len(jobs)
+    return queued
+
+
+# ==========================================
+# WORKER
+# ==========================================
+def requeue_expired():
+    """Release RUNNING jobs whose lease ran out: queued again, or FAILED once out of attempts. Returns the count."""
+    now = timezone.now()
+    # Rows claimed before claimed_at existed have no lease at all
+    expired = BackgroundJob.objects.filter(status='RUNNING').filter(
+        Q(claimed_at__lt=now - LEASE_TIMEOUT) | Q(claimed_at__isnull=True)
+    )
+    lost = 'Worker lease expired'
+    failed = expired.filter(attempts__gte=MAX_ATTEMPTS).update(
+        status='FAILED', claimed_by='', last_error=lost, updated_at=now
+    )
+    requeued = expired.update(status='QUEUED', claimed_by='', last_error=lost, updated_at=now)
+    if failed or requeued:
+        logger.warning("Released %d jobs with an expired lease (%d failed)", failed + requeued, failed)
+    return failed + requeued
+
+
+def claim_batch(batch_size):
+    """Atomically mark up to ``batch_size`` queued jobs as ours and return them"""
+    requeue_expired()
+    token = uuid.uuid4().hex
+    ids = list(BackgroundJob.objects.filter(status='QUEUED').values_list('id', flat=True)[:batch_size])
+    if not ids:
+        return []
+    # The status guard means two workers can never claim the same row
+    now = timezone.now()
+    BackgroundJob.objects.filter(id__in=ids, status='QUEUED').update(
+        status='RUNNING',
+        claimed_by=token,
+        claimed_at=now,
+        attempts=F('attempts') + 1,
+        updated_at=now
+    )
+    return list(BackgroundJob.objects.filter(claimed_by=token, status='RUNNING'))
+
+
+def prune_jobs():
+    """Delete DONE jobs finished more than DONE_RETENTION ago. Returns the count."""
+    deleted, _ = BackgroundJob.objects.filter(status='DONE', updated_at__lt=timezone.now() - DONE_RETENTION).delete()
+    return deleted
+
+
+def run_batch(batch_size=50, workers=4, use_processes=False):
+    """Claim one batch, run it on a thread (or process) pool and record the outcome. Returns jobs processed."""
+    jobs = claim_batch(batch_size)
+    if not jobs:
+        return 0
+
+    by_kind = {}
+    for job in jobs:
+        by_kind.setdefault(job.kind, []).append(job)
+
+    failures = {}
+    pool_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    with pool_class(max_workers=workers) as pool:
+        for kind, kind_jobs in by_kind.items():
+            handler = HANDLERS.get(kind)
+            if handler is None:
+                failures.update({job.id: f"No handler registered for '{kind}'" for job in kind_jobs})
+                continue
+            try:
+                failures.update(handler(kind_jobs, pool))
+            except Exception as e:
+                logger.exception("Job handler %s crashed", kind)
+                failures.update({job.id: str(e) for job in kind_jobs})
+
+    # Guarded by our claim: a job whose lease ran out meanwhile belongs to another worker now
+    token = jobs[0].claimed_by
+    now = timezone.now()
+    done_ids = [job.id for job in jobs if job.id not in failures]
+    BackgroundJob.objects.filter(id__in=done_ids, claimed_by=token).update(status='DONE', last_error='', updated_at=now)
+
+    for job in jobs:
+        if job.id in failures:
+            retry = job.attempts < MAX_ATTEMPTS
+            BackgroundJob.objects.filter(id=job.id, claimed_by=token).update(
+                status='QUEUED' if retry else 'FAILED',
+                last_error=failures[job.id],
+                updated_at=now
+            )
+            logger.warning("Job %s (%s:%s) failed: %s", job.id, job.kind, job.key, failures[job.id])
+
+    return len(jobs)
+
+
+# ==========================================
+# HANDLERS
+# ==========================================
+@register('qr_pass')
+def generate_qr_passes(jobs, pool):
+    """
+    Render the default pass of a whole batch in the pool ahead of the first
+    request for it (see passes.py). Passes already in the store are skipped.
+    """
+    booking_ids = [job.payload.get('booking_id') for job in jobs]
+    bookings = Booking.objects.filter(id__in=booking_ids).select_related('user', 'venue').in_bulk()
+
+    failures = {}
+    futures = {}
+    for job in jobs:
+        booking = bookings.get(job.payload.get('booking_id'))
+        # Deleted or rejected since it was queued: nothing to do
+        if booking is None or booking.status != 'APPROVED':
+            continue
+        payload = pass_payload(booking)
+        digest = pass_digest(payload, 'png', DEFAULT_PASS_SIZE)
+        if default_storage.exists(pass_name(digest, 'png')):
+            continue
+        futures[job.id] = (digest, pool.submit(render_pass, payload, 'png', DEFAULT_PASS_SIZE))
+
+    for job_id, (digest, future) in futures.items():
+        try:
+            store_pass(digest, 'png', future.result())
+        except Exception as e:
+            failures[job_id] = str(e)
+    return failures
+
+
+def enqueue_qr_pass(booking):
+    return enqueue('qr_pass', key=booking.id, booking_id=booking.id)
+
+
+def enqueue_missing_qr_passes():
+    """Queue a pass for every upcoming approved booking whose current pass is not stored yet (the backlog)"""
+    bookings = Booking.objects.filter(status='APPROVED', end_time__gte=timezone.now()).select_related('user', 'venue')
+    missing = {}
+    for booking in bookings.iterator(chunk_size=2000):
+        digest = pass_digest(pass_payload(booking), 'png', DEFAULT_PASS_SIZE)
+        if not default_storage.exists(pass_name(digest, 'png')):
+            missing[booking.id] = {'booking_id': booking.id}
+    return enqueue_many('qr_pass', missing)
+
+
+@register('send_emails')
+def send_emails(jobs, pool):
+    """
+    Send every queued message of the batch over ONE mail connection. A job
+    that fails part-way records how many of its messages went out
+    (payload['sent']), so the retry sends only the rest.
+    """
+    failures = {}
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+        for job in jobs:
+            queued = job.payload.get('messages', [])
+            sent = job.payload.get('sent', 0)
+            try:
+                for subject, body, to in queued[sent:]:
+                    connection.send_messages([EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, [to], connection=connection)])
+                    sent += 1
+            except Exception as e:
+                failures[job.id] = str(e)
+                BackgroundJob.objects.filter(id=job.id).update(payload={**job.payload, 'sent': sent})
+    finally:
+        connection.close()
+    return failures
+
+
+def queue_emails(messages, chunk_size=200):
+    """Queue (subject, body, to) messages for the worker, ``chunk_size`` per job"""
+    items = [
+        ('', {'messages': [list(m) for m in messages[i:i + chunk_size]]})
+        for i in range(0, len(messages), chunk_size)
+    ]
+    return _enqueue_items('send_emails', items)
+
+
+@register('reconcile_reservations')
+def reconcile_reservations(jobs, pool):
+    """Rebuild every venue's slot reservations, e.g. to repair drift (one pass covers the whole batch)"""
+    from .reservations import reconcile
+    reconcile()
+    return {}
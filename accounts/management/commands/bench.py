@@ -0,0 +1,258 @@
+import json
+import math
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import django
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import (
+    CaptureQueriesContext,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+from django.utils import timezone
+
+from accounts.booking_index import booking_index
+from accounts.counters import rebuild_counters
+from accounts.models import Booking, Venue, VenueSchedule
+from accounts.reservations import reconcile
+
+SCENARIOS = [
+    'calendar_view',
+    'get_availability_json',
+    'check_availability',
+    'create_booking_view',
+    'my_bookings_view',
+    'dashboard_view',
+    'admin_approve',
+]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(pct * len(sorted_values) / 100), 1)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Command(BaseCommand):
+    help = "Seed a synthetic campus in a throwaway database and time the booking hot paths"
+
+    # Scenario names accepted by --only (subclasses run their own list)
+    scenarios = SCENARIOS
+    # Options recorded in the meta block of the results file
+    meta_options = ('venues', 'bookings', 'users', 'days', 'iterations', 'cold', 'seed')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--venues', type=int, default=500)
+        parser.add_argument('--bookings', type=int, default=1_000_000)
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--days', type=int, default=365, help="Bookings are spread over this many days around today")
+        parser.add_argument('--iterations', type=int, default=50, help="Timed runs per scenario")
+        parser.add_argument('--only', nargs='*', choices=self.scenarios, help="Run just these scenarios")
+        parser.add_argument('--cold', action='store_true', help="Clear the cache before every timed run")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', default='bench_results.json', help="Where to write the JSON results")
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        verbosity = options['verbosity']
+
+        # Everything happens in the test database: the real db.sqlite3 is never touched
+        setup_test_environment()
+        old_config = setup_databases(verbosity=verbosity, interactive=False)
+        try:
+            cache.clear()
+            booking_index.clear()
+            started = time.perf_counter()
+            self.seed(options)
+            seed_seconds = time.perf_counter() - started
+            self.stdout.write(f"Seeded in {seed_seconds:.1f}s")
+
+            results = {}
+            for name in options['only'] or self.scenarios:
+                results[name] = self.run_scenario(name, options)
+                self.report(name, results[name])
+        finally:
+            teardown_databases(old_config, verbosity=verbosity)
+            teardown_test_environment()
+
+        payload = {
+            'meta': {
+                'commit': self.git_commit(),
+                'timestamp': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'seed_seconds': round(seed_seconds, 2),
+                'options': {k: options[k] for k in self.meta_options},
+            },
+            'results': results,
+        }
+        with open(options['output'], 'w') as f:
+            json.dump(payload, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    # ==========================================
+    # SEEDING
+    # ==========================================
+    def seed(self, options):
+        schedule = VenueSchedule.get_schedule()
+        slots = schedule.get_time_slots()
+        today = timezone.localdate()
+        first_day = today - timedelta(days=options['days'] // 2)
+
+        self.user = User.objects.create_superuser('bench', 'bench@example.com', 'bench-password')
+        users = [self.user] + User.objects.bulk_create(
+            [User(username=f'bench_user_{i}', email=f'user{i}@example.com') for i in range(options['users'] - 1)],
+            batch_size=1000,
+        )
+        self.venues = Venue.objects.bulk_create(
+            [
+                Venue(
+                    name=f'Room {i:04d}',
+                    location=f'Block {chr(65 + i % 6)}, Level {i % 5 + 1}',
+                    capacity=self.rng.choice([10, 20, 30, 50, 80, 150]),
+                    equipment=self.rng.choice(['Projector, Wifi', 'Wifi, AC', 'Projector, Wifi, AC, Mic', '']),
+                )
+                for i in range(options['venues'])
+            ],
+            batch_size=1000,
+        )
+
+        # Non-overlapping (day, slot) cells per venue, so the data looks like real bookings
+        cells_per_venue = options['days'] * len(slots)
+        per_venue = min(options['bookings'] // max(len(self.venues), 1) + 1, cells_per_venue)
+        statuses = ['APPROVED'] * 6 + ['PENDING'] * 3 + ['REJECTED']
+        remaining = options['bookings']
+        batch = []
+        for venue in self.venues:
+            for cell in self.rng.sample(range(cells_per_venue), min(per_venue, remaining)):
+                day = first_day + timedelta(days=cell // len(slots))
+                slot = slots[cell % len(slots)]
+                start = timezone.make_aware(datetime.combine(day, datetime.strptime(slot['start'], '%H:%M').time()))
+                end = timezone.make_aware(datetime.combine(day, datetime.strptime(slot['end'], '%H:%M').time()))
+                batch.append(Booking(
+                    user=self.rng.choice(users) if self.rng.random() > 0.01 else self.user,
+                    venue=venue,
+                    event_name=f'Bench event {cell}',
+                    start_time=start,
+                    end_time=end,
+                    status=self.rng.choice(statuses),
+                    time_slot=slot['display'],
+                ))
+                remaining -= 1
+                if len(batch) >= 10000:
+                    Booking.objects.bulk_create(batch)
+                    batch = []
+            if remaining <= 0:
+                break
+        Booking.objects.bulk_create(batch)
+        # bulk_create skips the receivers: derive the counters and slot reservations in bulk
+        rebuild_counters()
+        reconcile()
+
+        self.slots = slots
+        self.today = today
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    # ==========================================
+    # SCENARIOS
+    # ==========================================
+    def random_future_window(self):
+        day = self.today + timedelta(days=self.rng.randint(1, 30))
+        slot = self.rng.choice(self.slots)
+        return f"{day} {slot['start']}", f"{day} {slot['end']}", slot
+
+    def make_request(self, name):
+        """Return a zero-argument callable performing one request of the scenario"""
+        venue = self.rng.choice(self.venues)
+        if name == 'calendar_view':
+            day = self.today + timedelta(days=self.rng.randint(-180, 180))
+            return lambda: self.client.get('/calendar/', {'month': f"{day.year}-{day.month}"})
+        if name == 'get_availability_json':
+            day = self.today + timedelta(days=self.rng.randint(0, 30))
+            return lambda: self.client.get('/api/get_availability/', {'venue_id': venue.id, 'date': str(day)})
+        if name == 'check_availability':
+            start, end, _ = self.random_future_window()
+            return lambda: self.client.get('/check_availability/', {'venue_id': venue.id, 'start_time': start, 'end_time': end})
+        if name == 'create_booking_view':
+            start, end, slot = self.random_future_window()
+            data = {
+                'purpose': 'EVENT', 'event_name': 'Bench booking', 'venue': venue.id,
+                'description': '', 'addon_equipment': '', 'start_time': start, 'end_time': end,
+                'time_slot': slot['display'],
+            }
+            return lambda: self.client.post('/create_booking/', data)
+        if name == 'my_bookings_view':
+            return lambda: self.client.get('/my_bookings/')
+        if name == 'dashboard_view':
+            return lambda: self.client.get('/dashboard/')
+        if name == 'admin_approve':
+            ids = list(Booking.objects.filter(status='PENDING', venue=venue).values_list('id', flat=True)[:50])
+            data = {'action': 'approve_bookings', '_selected_action': ids}
+            return lambda: self.client.post('/admin/accounts/booking/', data)
+        raise ValueError(name)
+
+    def run_scenario(self, name, options):
+        # One warm-up run, then one run under tracemalloc for the peak memory figure
+        self.make_request(name)()
+        tracemalloc.start()
+        self.make_request(name)()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        timings = []
+        queries = []
+        for _ in range(options['iterations']):
+            request = self.make_request(name)
+            if options['cold']:
+                cache.clear()
+                booking_index.clear()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = request()
+                elapsed = time.perf_counter() - started
+            if response.status_code >= 400:
+                self.stderr.write(f"{name}: HTTP {response.status_code}")
+            timings.append(elapsed * 1000)
+            queries.append(len(captured.captured_queries))
+
+        timings.sort()
+        queries.sort()
+        return {
+            'iterations': len(timings),
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'p99_ms': round(percentile(timings, 99), 3),
+            'mean_ms': round(sum(timings) / len(timings), 3),
+            'queries_p50': percentile(queries, 50),
+            'queries_max': queries[-1],
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
+
+    def report(self, name, result):
+        self.stdout.write(
+            f"{name:<24} p50 {result['p50_ms']:>9.2f}ms  p95 {result['p95_ms']:>9.2f}ms  "
+            f"p99 {result['p99_ms']:>9.2f}ms  queries {result['queries_p50']:>4} (max {result['queries_max']})  "
+            f"peak {result['peak_memory_kb']:>9.1f}KB"
+        )
+
+    @staticmethod
+    def git_commit():
+        try:
+            return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
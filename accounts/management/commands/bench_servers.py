@@ -0,0 +1,150 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.test import AsyncClient, Client
+
+from accounts.booking_index import booking_index
+
+from .bench import Command as BenchCommand, percentile
+
+SERVER_SCENARIOS = [
+    'check_availability',
+    'get_availability_json',
+    'calendar_json',
+    'ai_chat',
+]
+
+SERVERS = ('wsgi', 'asgi')
+
+# What CampusBot is asked, in turn
+CHAT_MESSAGES = [
+    'is {venue} free?',
+    'room for 30 people tomorrow at 3pm',
+    'hello',
+    'need a room with projector for 50 pax',
+]
+
+
+class Command(BenchCommand):
+    """
+    The async endpoints under both handler stacks, in-process: Django's WSGI
+    handler driven by a pool of threads (one per worker, as gunicorn --threads
+    would) against its ASGI handler driven by concurrent tasks on one event
+    loop (as uvicorn would). No sockets are involved, so the numbers compare
+    the stacks themselves; put a load generator in front of real servers for
+    end-to-end figures.
+    """
+    help = "Seed a synthetic campus and compare the async endpoints under the WSGI and ASGI handlers"
+
+    scenarios = SERVER_SCENARIOS
+    meta_options = BenchCommand.meta_options + ('concurrency',)
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--concurrency', type=int, default=16, help="WSGI threads / ASGI tasks in flight")
+        parser.set_defaults(iterations=400, bookings=200_000, output='bench_servers_results.json')
+
+    # ==========================================
+    # REQUESTS
+    # ==========================================
+    def request_spec(self, name):
+        """(method, path, kwargs) of one request of the scenario, usable by Client and AsyncClient"""
+        venue = self.rng.choice(self.venues)
+        if name == 'check_availability':
+            start, end, _ = self.random_future_window()
+            return 'get', '/check_availability/', {'data': {'venue_id': venue.id, 'start_time': start, 'end_time': end}}
+        if name == 'get_availability_json':
+            day = self.today + timedelta(days=self.rng.randint(0, 30))
+            return 'get', '/api/get_availability/', {'data': {'venue_id': venue.id, 'date': str(day)}}
+        if name == 'calendar_json':
+            month = self.rng.randint(1, 12)
+            return 'get', '/api/calendar/', {'data': {'month': f"{self.today.year}-{month}"}}
+        if name == 'ai_chat':
+            message = self.rng.choice(CHAT_MESSAGES).format(venue=venue.name)
+            return 'post', '/ai-chat/', {'data': json.dumps({'message': message}), 'content_type': 'application/json'}
+        raise ValueError(name)
+
+    def run_scenario(self, name, options):
+        specs = [self.request_spec(name) for _ in range(options['iterations'])]
+        concurrency = max(options['concurrency'], 1)
+        # Every worker gets the same share of the same requests under both stacks
+        shares = [specs[i::concurrency] for i in range(concurrency)]
+
+        results = {}
+        for server in SERVERS:
+            if options['cold']:
+                cache.clear()
+                booking_index.clear()
+            run = self.run_wsgi if server == 'wsgi' else self.run_asgi
+            # A short warm-up so both stacks start from the same caches
+            run([shares[0][:5]])
+            started = time.perf_counter()
+            timings, errors = run(shares)
+            elapsed = time.perf_counter() - started
+
+            timings.sort()
+            results[server] = {
+                'requests': len(timings),
+                'errors': errors,
+                'req_per_s': round(len(timings) / elapsed, 1),
+                'p50_ms': round(percentile(timings, 50), 3),
+                'p95_ms': round(percentile(timings, 95), 3),
+                'p99_ms': round(percentile(timings, 99), 3),
+            }
+        return results
+
+    def run_wsgi(self, shares):
+        def worker(share):
+            client = Client()
+            client.force_login(self.user)
+            timings, errors = [], 0
+            for method, path, kwargs in share:
+                started = time.perf_counter()
+                response = getattr(client, method)(path, **kwargs)
+                timings.append((time.perf_counter() - started) * 1000)
+                errors += response.status_code >= 400
+            return timings, errors
+
+        with ThreadPoolExecutor(max_workers=len(shares)) as pool:
+            return self.merge(pool.map(worker, shares))
+
+    def run_asgi(self, shares):
+        clients = []
+        for _ in shares:
+            client = AsyncClient()
+            client.force_login(self.user)
+            clients.append(client)
+
+        async def worker(client, share):
+            timings, errors = [], 0
+            for method, path, kwargs in share:
+                started = time.perf_counter()
+                response = await getattr(client, method)(path, **kwargs)
+                timings.append((time.perf_counter() - started) * 1000)
+                errors += response.status_code >= 400
+            return timings, errors
+
+        async def main():
+            return await asyncio.gather(*(worker(client, share) for client, share in zip(clients, shares)))
+
+        return self.merge(asyncio.run(main()))
+
+    @staticmethod
+    def merge(worker_results):
+        timings, errors = [], 0
+        for worker_timings, worker_errors in worker_results:
+            timings.extend(worker_timings)
+            errors += worker_errors
+        return timings, errors
+
+    def report(self, name, result):
+        for server in SERVERS:
+            row = result[server]
+            self.stdout.write(
+                f"{name:<24} {server:<5} {row['req_per_s']:>8.1f} req/s  p50 {row['p50_ms']:>9.2f}ms  "
+                f"p95 {row['p95_ms']:>9.2f}ms  p99 {row['p99_ms']:>9.2f}ms  errors {row['errors']}"
+            )
@@ -0,0 +1,27 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from accounts.transfer import EXPORTS, FORMATS, stream_export
+
+
+class Command(BaseCommand):
+    help = "Stream venues or bookings as CSV / JSON Lines (constant memory, any table size)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS))
+        parser.add_argument('--format', choices=FORMATS, default='csv', dest='fmt')
+        parser.add_argument('--output', '-o', help="File to write (default: stdout)")
+
+    def handle(self, *args, **options):
+        lines = stream_export(options['kind'], options['fmt'])
+        if not options['output']:
+            sys.stdout.writelines(lines)
+            return
+
+        with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+            count = -1 if options['fmt'] == 'csv' else 0  # the CSV header is not a row
+            for line in lines:
+                f.write(line)
+                count += 1
+        self.stderr.write(self.style.SUCCESS(f"Wrote {count} {options['kind']} to {options['output']}."))
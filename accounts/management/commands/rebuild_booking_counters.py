@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.counters import STATUS_FIELDS, count_bookings, rebuild_counters
+from accounts.models import UserBookingStats
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-user booking status counters from the Booking table (or just verify them)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true', help="Only compare counters with a fresh count; exit 1 on mismatch")
+
+    def handle(self, *args, **options):
+        if not options['verify']:
+            written = rebuild_counters()
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt counters for {written} users."))
+
+        expected = count_bookings()
+        zero = dict.fromkeys(STATUS_FIELDS.values(), 0)
+        mismatches = 0
+
+        stored = {
+            row['user_id']: row
+            for row in UserBookingStats.objects.values('user_id', *STATUS_FIELDS.values())
+        }
+        for user_id in set(expected) | set(stored):
+            want = expected.get(user_id, zero)
+            have = stored.get(user_id)
+            # A missing row is fine for a user with no bookings (it is created on first dashboard visit)
+            if have is None and not any(want.values()):
+                continue
+            have = {field: have[field] for field in STATUS_FIELDS.values()} if have else None
+            if have != want:
+                mismatches += 1
+                self.stdout.write(self.style.WARNING(f"User {user_id}: stored {have}, expected {want}"))
+
+        if mismatches:
+            raise CommandError(f"{mismatches} users have wrong counters.")
+        self.stdout.write(self.style.SUCCESS(f"Verified counters for {len(expected)} users with bookings."))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.reservations import reconcile
+
+
+class Command(BaseCommand):
+    help = "Backfill / repair the slot reservation table from APPROVED and PENDING bookings (or just verify it)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true', help="Only report differences; exit 1 if any")
+        parser.add_argument('--venue', type=int, action='append', dest='venue_ids', help="Limit to this venue id (repeatable)")
+
+    def handle(self, *args, **options):
+        report = reconcile(venue_ids=options['venue_ids'], dry_run=options['verify'])
+
+        created = deleted = conflicted = 0
+        for venue_id, (missing, stale, conflicts) in report.items():
+            created += missing
+            deleted += stale
+            conflicted += len(conflicts)
+            if missing or stale:
+                self.stdout.write(f"Venue {venue_id}: {missing} missing, {stale} stale reservations")
+            for day, slot_index, holder_id, loser_id in conflicts:
+                self.stdout.write(self.style.WARNING(
+                    f"Venue {venue_id} {day} slot #{slot_index}: booking {loser_id} overlaps booking {holder_id}"
+                ))
+
+        if options['verify']:
+            if created or deleted:
+                raise CommandError(f"{created} missing and {deleted} stale reservations.")
+            self.stdout.write(self.style.SUCCESS("Reservations match the bookings."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Created {created} and deleted {deleted} reservations."))
+
+        if conflicted:
+            self.stdout.write(self.style.WARNING(
+                f"{conflicted} slots are claimed by more than one booking; the earliest request holds each of them."
+            ))
@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.documents import prune_documents
+from accounts.jobs import enqueue_missing_qr_passes, prune_jobs, run_batch
+from accounts.passes import prune_passes
+
+# Seconds between prunes of finished jobs while the worker runs
+PRUNE_JOBS_EVERY = 60 * 60
+
+
+class Command(BaseCommand):
+    help = "Run the background job worker (QR entry passes, ...)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help="Jobs claimed per batch")
+        parser.add_argument('--workers', type=int, default=4, help="Pool size")
+        parser.add_argument('--processes', action='store_true', help="Use a process pool instead of threads")
+        parser.add_argument('--sleep', type=float, default=2.0, help="Seconds to wait when the queue is empty")
+        parser.add_argument('--once', action='store_true', help="Drain the queue once and exit")
+        parser.add_argument('--backfill', action='store_true', help="First queue passes for approved bookings that have none")
+        parser.add_argument('--prune-passes', action='store_true', help="First delete stored passes no upcoming booking encodes any more")
+        parser.add_argument('--prune-documents', action='store_true', help="First delete stored documents no booking refers to any more")
+
+    def handle(self, *args, **options):
+        if options['prune_passes']:
+            deleted = prune_passes()
+            self.stdout.write(f"Deleted {deleted} stale QR passes.")
+        if options['prune_documents']:
+            deleted = prune_documents()
+            self.stdout.write(f"Deleted {deleted} unreferenced documents.")
+        if options['backfill']:
+            queued = enqueue_missing_qr_passes()
+            self.stdout.write(f"Queued {queued} missing QR passes.")
+
+        total = 0
+        pruned_at = None
+        while True:
+            if pruned_at is None or time.monotonic() - pruned_at >= PRUNE_JOBS_EVERY:
+                deleted = prune_jobs()
+                if deleted:
+                    self.stdout.write(f"Deleted {deleted} finished jobs.")
+                pruned_at = time.monotonic()
+            processed = run_batch(
+                batch_size=options['batch_size'],
+                workers=options['workers'],
+                use_processes=options['processes'],
+            )
+            total += processed
+            if processed:
+                self.stdout.write(f"Processed {processed} jobs ({total} total).")
+                continue
+            if options['once']:
+                break
+            time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f"Done. {total} jobs processed."))
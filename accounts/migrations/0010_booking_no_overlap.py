@@ -0,0 +1,37 @@
+# Generated by Django 6.0 on 2026-10-18 11:05
+
+from django.db import migrations
+
+# Two APPROVED/PENDING bookings of the same venue may not overlap. Only
+# PostgreSQL can enforce this (GiST exclusion constraint); elsewhere the
+# per-venue lock in Booking.save_checked() is the guarantee.
+ADD_CONSTRAINT = """
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+ALTER TABLE accounts_booking ADD CONSTRAINT booking_no_overlap EXCLUDE USING gist (
+    venue_id WITH =,
+    tstzrange(start_time, end_time, '[)') WITH &&
+) WHERE (status IN ('APPROVED', 'PENDING'));
+"""
+
+DROP_CONSTRAINT = "ALTER TABLE accounts_booking DROP CONSTRAINT IF EXISTS booking_no_overlap;"
+
+
+def add_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(ADD_CONSTRAINT)
+
+
+def drop_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_CONSTRAINT)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_userbookingstats'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_constraint, drop_constraint),
+    ]
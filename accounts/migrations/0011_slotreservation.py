@@ -0,0 +1,51 @@
+# Generated by Django 6.0 on 2026-10-18 12:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_reservations(apps, schema_editor):
+    """Reserve the slots of existing APPROVED/PENDING bookings (earliest request wins a contested slot)"""
+    from accounts.availability import get_slot_table
+    from accounts.reservations import booking_cells
+
+    VenueSchedule = apps.get_model('accounts', 'VenueSchedule')
+    Booking = apps.get_model('accounts', 'Booking')
+    SlotReservation = apps.get_model('accounts', 'SlotReservation')
+
+    schedule = VenueSchedule.objects.first() or VenueSchedule()
+    table = get_slot_table(schedule)
+
+    taken = set()
+    rows = []
+    bookings = Booking.objects.filter(status__in=['APPROVED', 'PENDING']).order_by('created_at', 'id')
+    for booking_id, venue_id, start_time, end_time in bookings.values_list('id', 'venue_id', 'start_time', 'end_time').iterator():
+        for day, slot_index in booking_cells(table, start_time, end_time):
+            if (venue_id, day, slot_index) not in taken:
+                taken.add((venue_id, day, slot_index))
+                rows.append(SlotReservation(venue_id=venue_id, date=day, slot_index=slot_index, booking_id=booking_id))
+    SlotReservation.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_booking_no_overlap'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlotReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('slot_index', models.PositiveSmallIntegerField(help_text='Position in VenueSchedule.get_time_slots()')),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_reservations', to='accounts.booking')),
+                ('venue', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_reservations', to='accounts.venue')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('venue', 'date', 'slot_index'), name='unique_venue_date_slot')],
+            },
+        ),
+        migrations.RunPython(backfill_reservations, migrations.RunPython.noop),
+    ]
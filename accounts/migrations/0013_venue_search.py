@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-18 14:00
+
+from django.db import migrations, models
+
+
+def create_fts_index(apps, schema_editor):
+    # SQLite with FTS5 only; other databases use the portable icontains search
+    from accounts.venue_search import ensure_fts_index
+    ensure_fts_index(schema_editor.connection)
+
+
+def drop_fts_index(apps, schema_editor):
+    from accounts.venue_search import drop_fts_index
+    drop_fts_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_booking_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='venue',
+            index=models.Index(fields=['capacity'], name='accounts_ve_capacit_12d7a2_idx'),
+        ),
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0 on 2026-10-18 16:05
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0015_availabilityevent'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='booking',
+            name='qr_code',
+        ),
+    ]
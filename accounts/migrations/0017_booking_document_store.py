@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-18 16:40
+
+import accounts.documents
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0016_remove_booking_qr_code'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='booking',
+            name='document',
+            field=models.FileField(blank=True, null=True, storage=accounts.documents.DocumentStorage(), upload_to='booking_docs/', validators=[accounts.documents.validate_document]),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0017_booking_document_store'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='backgroundjob',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, help_text="Start of the current worker's lease (see jobs.LEASE_TIMEOUT)", null=True),
+        ),
+    ]
@@ -1,10 +1,18 @@
-import qrcode
-from io import BytesIO
-from django.core.files import File
-from django.db import models
+from functools import lru_cache
+from django.core.cache import cache
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.utils import timezone
+from .booking_index import ACTIVE_STATUSES, booking_index
+from .caching import aget_version, get_version
+from .documents import DocumentStorage, validate_document
+
+# Bumped whenever the schedule row is saved (see signals.py)
+SCHEDULE_VERSION_NAME = 'venue_schedule'
+
+# Name of the PostgreSQL exclusion constraint added by migration 0010
+NO_OVERLAP_CONSTRAINT = 'booking_no_overlap'
 
 # 0. Global Schedule Configuration
 class VenueSchedule(models.Model):
@@ -20,42 +28,101 @@ class VenueSchedule(models.Model):
     def __str__(self):
         return f"Schedule: {self.open_hour}:00 - {self.close_hour}:00 ({self.slot_duration_minutes} min slots)"
 
+    # Process-wide copy: (version stamp, schedule). Treat the shared instance as read-only.
+    _cached = None
+
     @classmethod
     def get_schedule(cls):
-        """Get or create default schedule"""
-        schedule, _ = cls.objects.get_or_create(pk=1)
+        """Get or create default schedule (cached in-process and in the cache backend)"""
+        version = get_version(SCHEDULE_VERSION_NAME)
+        cached = cls._cached
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        # Another worker may already have loaded this version into the shared cache
+        key = f"venue_schedule:{version}"
+        values = cache.get(key)
+        if values is None:
+            schedule, created = cls.objects.get_or_create(pk=1)
+            if created:
+                # Creating the row bumped the stamp (post_save); file it under the new one
+                version = get_version(SCHEDULE_VERSION_NAME)
+                key = f"venue_schedule:{version}"
+            values = {f.attname: getattr(schedule, f.attname) for f in cls._meta.concrete_fields}
+            cache.set(key, values, None)
+        else:
+            schedule = cls._from_values(values)
+
+        cls._cached = (version, schedule)
+        return schedule
+
+    @classmethod
+    def _from_values(cls, values):
+        schedule = cls(**values)
+        schedule._state.adding = False
+        schedule._state.db = 'default'
+        return schedule
+
+    @classmethod
+    async def aget_schedule(cls):
+        """get_schedule() for async views: same cache entries, async cache and ORM calls"""
+        version = await aget_version(SCHEDULE_VERSION_NAME)
+        cached = cls._cached
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        key = f"venue_schedule:{version}"
+        values = await cache.aget(key)
+        if values is None:
+            schedule, created = await cls.objects.aget_or_create(pk=1)
+            if created:
+                version = await aget_version(SCHEDULE_VERSION_NAME)
+                key = f"venue_schedule:{version}"
+            values = {f.attname: getattr(schedule, f.attname) for f in cls._meta.concrete_fields}
+            await cache.aset(key, values, None)
+        else:
+            schedule = cls._from_values(values)
+
+        cls._cached = (version, schedule)
         return schedule
 
     def get_time_slots(self):
         """Generate list of all available time slots for the day"""
-        slots = []
-        current_hour = self.open_hour
-        current_minute = 0
+        slots = _build_time_slots(self.open_hour, self.close_hour, self.slot_duration_minutes)
+        return [dict(slot) for slot in slots]
+
+
+@lru_cache(maxsize=32)
+def _build_time_slots(open_hour, close_hour, slot_duration_minutes):
+    """Slot table for one schedule configuration - computed once per configuration"""
+    slots = []
+    current_hour = open_hour
+    current_minute = 0
 
-        while True:
-            end_hour = current_hour
-            end_minute = current_minute + self.slot_duration_minutes
+    while True:
+        end_hour = current_hour
+        end_minute = current_minute + slot_duration_minutes
 
-            if end_minute >= 60:
-                end_hour += end_minute // 60
-                end_minute = end_minute % 60
+        if end_minute >= 60:
+            end_hour += end_minute // 60
+            end_minute = end_minute % 60
 
-            if end_hour > self.close_hour:
-                break
+        if end_hour > close_hour:
+            break
 
-            slot_display = f"{current_hour:02d}:{current_minute:02d}-{end_hour:02d}:{end_minute:02d}"
-            slots.append({
-                'display': slot_display,
-                'start': f"{current_hour:02d}:{current_minute:02d}",
-                'end': f"{end_hour:02d}:{end_minute:02d}",
-            })
+        slot_display = f"{current_hour:02d}:{current_minute:02d}-{end_hour:02d}:{end_minute:02d}"
+        slots.append({
+            'display': slot_display,
+            'start': f"{current_hour:02d}:{current_minute:02d}",
+            'end': f"{end_hour:02d}:{end_minute:02d}",
+        })
 
-            current_minute += self.slot_duration_minutes
-            if current_minute >= 60:
-                current_hour += current_minute // 60
-                current_minute = current_minute % 60
+        current_minute += slot_duration_minutes
+        if current_minute >= 60:
+            current_hour += current_minute // 60
+            current_minute = current_minute % 60
 
-        return slots
+    return tuple(slots)
 
 # 1. The Venue Table
 class Venue(models.Model):
@@ -69,6 +136,42 @@ class Venue(models.Model):
 
     class Meta:
         ordering = ['name']
+        indexes = [
+            # Capacity filters of the venue list / recommendations
+            models.Index(fields=['capacity']),
+        ]
+
+# 1b. Recurring Booking Series
+class BookingSeries(models.Model):
+    """
+    A booking repeated on a simple rule (every ``interval`` days or weeks,
+    ``count`` times). Each occurrence is an ordinary Booking pointing back
+    here; see series.py for creating, approving and cancelling them together.
+    """
+    FREQUENCY_CHOICES = [
+        ('DAILY', 'Daily'),
+        ('WEEKLY', 'Weekly'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='booking_series')
+    venue = models.ForeignKey(Venue, on_delete=models.CASCADE, related_name='booking_series')
+    event_name = models.CharField(max_length=200, blank=True)
+
+    # First occurrence; later ones keep the same local wall-clock times
+    start_time = models.DateTimeField()
+    end_time = models.DateTimeField()
+
+    frequency = models.CharField(max_length=10, choices=FREQUENCY_CHOICES, default='WEEKLY')
+    interval = models.PositiveIntegerField(default=1, help_text="Repeat every N days / weeks")
+    count = models.PositiveIntegerField(help_text="Number of occurrences, e.g. 14 for a semester")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.event_name} - {self.get_frequency_display()} x{self.count}"
+
+    class Meta:
+        verbose_name_plural = "Booking series"
+        ordering = ['-created_at']
 
 # 2. The Booking Table
 class Booking(models.Model):
@@ -90,7 +193,10 @@ class Booking(models.Model):
     event_name = models.CharField(max_length=200, blank=True)
     description = models.TextField(blank=True)
     
-    document = models.FileField(upload_to='booking_docs/', blank=True, null=True)
+    # Stored once per distinct content (see documents.py), checked while it uploads
+    document = models.FileField(
+        upload_to='booking_docs/', storage=DocumentStorage(), validators=[validate_document], blank=True, null=True
+    )
 
     start_time = models.DateTimeField()
     end_time = models.DateTimeField()
@@ -104,11 +210,39 @@ class Booking(models.Model):
     approved_at = models.DateTimeField(null=True, blank=True)
     
     addon_equipment = models.TextField(blank=True, null=True, help_text="List any extra equipment needed (e.g., Extra Mic, Extension Cord).")
-    qr_code = models.ImageField(upload_to='qr_codes/', blank=True, null=True)
     time_slot = models.CharField(max_length=20, blank=True, null=True, help_text="Selected time slot (e.g. 09:00-10:00)")
+    series = models.ForeignKey(BookingSeries, on_delete=models.SET_NULL, null=True, blank=True, related_name='bookings')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the values loaded from the database so signal handlers can see what changed"""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def get_loaded_value(self, field_name, default=None):
+        """Value of a field as it was when this booking was read from the database"""
+        return getattr(self, '_loaded_values', {}).get(field_name, default)
 
     def clean(self):
         """Validate booking times"""
+        self.validate_times()
+
+        # Check for clashes with BOTH approved and pending bookings
+        # This prevents users from creating multiple conflicting bookings.
+        # Answered from the in-memory interval index (excluding this booking when editing)
+        first_clash = booking_index.first_clash(self.venue_id, self.start_time, self.end_time, exclude_pk=self.pk)
+        if first_clash:
+            clash_name = first_clash.event_name or "another booking"
+            raise ValidationError(f"Time slot conflicts with existing booking: {clash_name}")
+
+        # Slots held by a booking the interval check can't see (e.g. an older off-grid one)
+        from .reservations import RESERVED_MESSAGE, reservation_conflicts
+        if reservation_conflicts([self]):
+            raise ValidationError(RESERVED_MESSAGE)
+
+    def validate_times(self, schedule=None, allow_past=False):
+        """Start/end present, in order, in the future and within operating hours (no clash check)"""
         errors = {}
         if self.start_time is None:
             errors['start_time'] = 'Start time is required.'
@@ -120,11 +254,11 @@ class Booking(models.Model):
         if self.start_time >= self.end_time:
             raise ValidationError({'end_time': "End time must be after start time."})
 
-        if self.start_time < timezone.now():
+        if not allow_past and self.start_time < timezone.now():
             raise ValidationError({'start_time': "Cannot book for past times."})
 
         # Check operating hours
-        schedule = VenueSchedule.get_schedule()
+        schedule = schedule or VenueSchedule.get_schedule()
         start_hour = self.start_time.hour
         end_hour = self.end_time.hour
         end_minute = self.end_time.minute
@@ -136,38 +270,65 @@ class Booking(models.Model):
         if end_hour > schedule.close_hour or (end_hour == schedule.close_hour and end_minute > 0):
             raise ValidationError({'end_time': f"End time must be before {schedule.close_hour}:00"})
 
-        # Check for clashes with BOTH approved and pending bookings
-        # This prevents users from creating multiple conflicting bookings
-        clashing = Booking.objects.filter(
-            venue=self.venue,
-            status__in=['APPROVED', 'PENDING'],  # ← Check both statuses
+        # Slot reservations (reservations.py) are held per slot of the grid: off it,
+        # two back-to-back bookings would both claim the slot they share. Only
+        # times being set are checked, so older off-grid bookings stay editable.
+        from .availability import get_slot_table
+        table = get_slot_table(schedule)
+        grid = f"Times must fall on the {schedule.slot_duration_minutes}-minute slot grid (slots start at {table.slots[0]['start']})."
+        for field in ('start_time', 'end_time'):
+            value = getattr(self, field)
+            if value != self.get_loaded_value(field) and not table.on_grid(value):
+                raise ValidationError({field: grid})
+
+    def clashes_in_db(self):
+        """Active bookings overlapping this one, read straight from the database (not the index)"""
+        if self.status not in ACTIVE_STATUSES:
+            return Booking.objects.none()
+        return Booking.objects.filter(
+            venue_id=self.venue_id,
+            status__in=ACTIVE_STATUSES,
             start_time__lt=self.end_time,
             end_time__gt=self.start_time
-        )
+        ).exclude(pk=self.pk).order_by('start_time')
 
-        # Exclude current booking when editing
-        if self.pk:
-            clashing = clashing.exclude(pk=self.pk)
+    def save_checked(self, *args, **kwargs):
+        """
+        full_clean() and save() as ONE short critical section per venue.
 
-        if clashing.exists():
-            # Get the first clashing booking's event name separately to avoid recursion
-            first_clash = clashing.first()
-            clash_name = first_clash.event_name if first_clash else "another booking"
-            raise ValidationError(f"Time slot conflicts with existing booking: {clash_name}")
+        The venue row is locked first (SELECT ... FOR UPDATE; on SQLite the
+        IMMEDIATE transaction takes the write lock instead), and the clash check
+        is repeated against the database under that lock, so two requests can
+        never both pass it for the same slot.
+        """
+        try:
+            with transaction.atomic():
+                venue_ids = sorted({self.venue_id, self.get_loaded_value('venue_id')} - {None})
+                list(Venue.objects.select_for_update().filter(pk__in=venue_ids).order_by('pk').values_list('pk', flat=True))
+
+                self.full_clean()
+                clash = self.clashes_in_db().only('event_name').first()
+                if clash:
+                    raise ValidationError(f"Time slot conflicts with existing booking: {clash.event_name or 'another booking'}")
+                self.save(*args, **kwargs)
+        except IntegrityError as e:
+            # The database-level guarantee (PostgreSQL only) caught what slipped past the lock
+            if NO_OVERLAP_CONSTRAINT in str(e):
+                raise ValidationError("Time slot conflicts with an existing booking.")
+            raise
 
     def save(self, *args, **kwargs):
-        # Generate QR code when status changes to APPROVED
-        if self.status == 'APPROVED' and not self.qr_code:
-            qr_data = f"ENTRY PASS\nID: {self.id}\nUser: {self.user.username}\nEvent: {self.event_name}\nVenue: {self.venue.name}\nTime: {self.start_time}"
-            
-            qr_img = qrcode.make(qr_data)
-            canvas = BytesIO()
-            qr_img.save(canvas, format='PNG')
-            
-            file_name = f"qr_booking_{self.id}.png"
-            self.qr_code.save(file_name, File(canvas), save=False)
-
-        super().save(*args, **kwargs)
+        # The QR entry pass is rendered on first request (see passes.py), not here.
+        # post_save receivers (status counters, ...) run inside the same transaction as the row.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+        # The row now matches this instance; later saves diff against it
+        self._loaded_values = {f.attname: getattr(self, f.attname) for f in self._meta.concrete_fields}
+
+    @property
+    def pass_status(self):
+        """'ready' once approved (the QR entry pass is rendered on first request), None otherwise"""
+        return 'ready' if self.status == 'APPROVED' else None
 
     def __str__(self):
         return f"{self.event_name} - {self.status}"
@@ -177,4 +338,103 @@ class Booking(models.Model):
         indexes = [
             models.Index(fields=['user', 'status']),
             models.Index(fields=['venue', 'start_time', 'end_time']),
+            # Keyset pagination of booking listings (see pagination.py)
+            models.Index(fields=['user', 'created_at', 'id']),
+            models.Index(fields=['created_at', 'id']),
+        ]
+
+
+# 2b. Slot Reservations
+class SlotReservation(models.Model):
+    """
+    One row per (venue, day, slot of the VenueSchedule grid) held by an
+    APPROVED or PENDING booking. Written in the booking's own transaction
+    (see reservations.py); the unique constraint turns a double booking into
+    an IntegrityError on insert instead of a race between read and write.
+    """
+    venue = models.ForeignKey(Venue, on_delete=models.CASCADE, related_name='slot_reservations')
+    date = models.DateField()
+    slot_index = models.PositiveSmallIntegerField(help_text="Position in VenueSchedule.get_time_slots()")
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='slot_reservations')
+
+    def __str__(self):
+        return f"{self.venue_id} {self.date} #{self.slot_index} -> booking {self.booking_id}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['venue', 'date', 'slot_index'], name='unique_venue_date_slot'),
+        ]
+
+
+# 3. Per-user Booking Counters
+class UserBookingStats(models.Model):
+    """Per-user booking counts by status, kept current by signals.py and read by the dashboard"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='booking_stats')
+    approved = models.IntegerField(default=0)
+    pending = models.IntegerField(default=0)
+    rejected = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "User booking stats"
+
+    def __str__(self):
+        return f"{self.user}: {self.approved} approved, {self.pending} pending, {self.rejected} rejected"
+
+# 4. Background Job Queue
+class BackgroundJob(models.Model):
+    """
+    Work queued for the background worker (python manage.py run_jobs).
+
+    A local, database-backed stand-in for a real broker: jobs are enqueued
+    with accounts.jobs.enqueue() and claimed in batches by the worker. A claim
+    is a lease: a job still RUNNING after jobs.LEASE_TIMEOUT is queued again.
+    """
+    STATUS_CHOICES = [
+        ('QUEUED', 'Queued'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=50, help_text="Registered handler name, e.g. qr_pass")
+    key = models.CharField(max_length=100, blank=True, help_text="De-duplication key, e.g. the booking id")
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='QUEUED')
+    attempts = models.IntegerField(default=0)
+    claimed_by = models.CharField(max_length=64, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True, help_text="Start of the current worker's lease (see jobs.LEASE_TIMEOUT)")
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.kind}:{self.key} - {self.status}"
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'id']),
+            models.Index(fields=['kind', 'key']),
         ]
+
+
+# 5. Availability Events
+class AvailabilityEvent(models.Model):
+    """
+    One venue-day slot change pushed to the SSE streams (see events.py).
+
+    The local, database-backed stand-in for a pub/sub server: every worker's
+    broker reads the rows after the last id it has seen. Rows only live long
+    enough for reconnecting clients to catch up.
+    """
+    venue_id = models.IntegerField()
+    date = models.DateField(null=True, blank=True, help_text="Empty for venue-wide events, e.g. reload")
+    data = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"#{self.id} venue {self.venue_id} {self.date or ''}"
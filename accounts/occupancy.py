@@ -0,0 +1,154 @@
+import math
+
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef, Subquery
+from django.utils import timezone
+
+from .caching import aget_version, get_version
+from .models import Booking, Venue
+
+# Bumped by every booking write (see signals.py)
+OCCUPANCY_VERSION_NAME = 'occupancy'
+
+# Upper bound on how long a snapshot lives when no booking boundary is coming up
+MAX_SNAPSHOT_AGE = 60 * 60
+
+
+def current_bookings(now):
+    """APPROVED bookings running at ``now`` for the venue in the outer query"""
+    return Booking.objects.filter(
+        venue=OuterRef('pk'),
+        status='APPROVED',
+        start_time__lte=now,
+        end_time__gte=now
+    ).order_by('start_time')
+
+
+def upcoming_bookings(now):
+    return Booking.objects.filter(
+        venue=OuterRef('pk'),
+        status='APPROVED',
+        start_time__gt=now
+    ).order_by('start_time')
+
+
+def with_occupancy(venues, now=None):
+    """Annotate a Venue queryset with is_occupied (one EXISTS per row, inside the same query)"""
+    return venues.annotate(is_occupied=Exists(current_bookings(now or timezone.now())))
+
+
+def snapshot_rows(now):
+    """ONE query: every venue with its current and next APPROVED booking as subqueries"""
+    current = current_bookings(now)
+    upcoming = upcoming_bookings(now)
+
+    return Venue.objects.annotate(
+        current_id=Subquery(current.values('id')[:1]),
+        current_event=Subquery(current.values('event_name')[:1]),
+        current_start=Subquery(current.values('start_time')[:1]),
+        current_end=Subquery(current.values('end_time')[:1]),
+        next_id=Subquery(upcoming.values('id')[:1]),
+        next_event=Subquery(upcoming.values('event_name')[:1]),
+        next_start=Subquery(upcoming.values('start_time')[:1]),
+        next_end=Subquery(upcoming.values('end_time')[:1]),
+    ).values(
+        'id', 'name', 'location', 'capacity',
+        'current_id', 'current_event', 'current_start', 'current_end',
+        'next_id', 'next_event', 'next_start', 'next_end',
+    )
+
+
+def build_snapshot(now=None):
+    """Every venue with its current and next APPROVED booking, in ONE query"""
+    now = now or timezone.now()
+    return snapshot_from_rows(snapshot_rows(now), now)
+
+
+async def abuild_snapshot(now=None):
+    now = now or timezone.now()
+    return snapshot_from_rows([row async for row in snapshot_rows(now)], now)
+
+
+def snapshot_from_rows(rows, now):
+    venues = []
+    boundaries = []
+    for row in rows:
+        current = None
+        if row['current_id'] is not None:
+            current = {
+                'id': row['current_id'],
+                'event_name': row['current_event'],
+                'start_time': row['current_start'].isoformat(),
+                'end_time': row['current_end'].isoformat(),
+            }
+            boundaries.append(row['current_end'])
+        upcoming = None
+        if row['next_id'] is not None:
+            upcoming = {
+                'id': row['next_id'],
+                'event_name': row['next_event'],
+                'start_time': row['next_start'].isoformat(),
+                'end_time': row['next_end'].isoformat(),
+            }
+            boundaries.append(row['next_start'])
+        venues.append({
+            'id': row['id'],
+            'name': row['name'],
+            'location': row['location'],
+            'capacity': row['capacity'],
+            'status': 'occupied' if current else 'available',
+            'current': current,
+            'next': upcoming,
+        })
+
+    # The board cannot change before the earliest upcoming start or current end
+    valid_until = min(boundaries) if boundaries else None
+    return {
+        'generated_at': now.isoformat(),
+        'valid_until': valid_until.isoformat() if valid_until else None,
+        'venues': venues,
+    }, valid_until
+
+
+def _snapshot_timeout(valid_until, now):
+    if valid_until is None:
+        return MAX_SNAPSHOT_AGE
+    # end_time is inclusive, so expire just after the boundary itself
+    return min(max(math.ceil((valid_until - now).total_seconds()) + 1, 1), MAX_SNAPSHOT_AGE)
+
+
+def get_snapshot():
+    """Cached snapshot, kept until the next booking boundary or the next booking write"""
+    key = f"occupancy:snapshot:{get_version(OCCUPANCY_VERSION_NAME)}"
+    snapshot = cache.get(key)
+    if snapshot is None:
+        now = timezone.now()
+        snapshot, valid_until = build_snapshot(now)
+        cache.set(key, snapshot, _snapshot_timeout(valid_until, now))
+    return snapshot
+
+
+async def aget_snapshot():
+    key = f"occupancy:snapshot:{await aget_version(OCCUPANCY_VERSION_NAME)}"
+    snapshot = await cache.aget(key)
+    if snapshot is None:
+        now = timezone.now()
+        snapshot, valid_until = await abuild_snapshot(now)
+        await cache.aset(key, snapshot, _snapshot_timeout(valid_until, now))
+    return snapshot
+
+
+def _find_venue(snapshot, venue_id):
+    for venue in snapshot['venues']:
+        if venue['id'] == venue_id:
+            return venue
+    return None
+
+
+def venue_occupancy(venue_id):
+    """This venue's entry on the board (or None if it does not exist)"""
+    return _find_venue(get_snapshot(), venue_id)
+
+
+async def avenue_occupancy(venue_id):
+    return _find_venue(await aget_snapshot(), venue_id)
@@ -0,0 +1,90 @@
+import binascii
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+# ==========================================
+# KEYSET (CURSOR) PAGINATION
+# ==========================================
+# Pages are cut on (created_at, id), newest first. A page is one indexed range
+# scan whatever its depth: no OFFSET and no COUNT(*).
+
+def encode_cursor(created_at, pk, direction):
+    """Opaque cursor for the row at a page edge; direction is 'n' (next) or 'p' (previous)"""
+    raw = f"{direction}|{created_at.isoformat()}|{pk}"
+    return urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(direction, created_at, pk) or None for a malformed cursor"""
+    try:
+        raw = urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        direction, created_at, pk = raw.split('|')
+        created_at = parse_datetime(created_at)
+        if direction not in ('n', 'p') or created_at is None:
+            return None
+        return direction, created_at, int(pk)
+    except (ValueError, TypeError, binascii.Error, UnicodeDecodeError):
+        return None
+
+
+class KeysetPage:
+    """One page of rows plus the cursors leading away from it"""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def keyset_page(queryset, cursor=None, per_page=10):
+    """
+    The page of ``queryset`` (newest first) after / before ``cursor``. An
+    unknown or missing cursor gives the first page. One query per page: it
+    reads per_page + 1 rows to know whether there is more.
+    """
+    position = decode_cursor(cursor) if cursor else None
+
+    if position is None:
+        rows = list(queryset.order_by('-created_at', '-id')[:per_page + 1])
+        has_next, has_prev = len(rows) > per_page, False
+        rows = rows[:per_page]
+    else:
+        direction, created_at, pk = position
+        if direction == 'n':
+            rows = list(queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+            ).order_by('-created_at', '-id')[:per_page + 1])
+            has_next, has_prev = len(rows) > per_page, True
+            rows = rows[:per_page]
+        else:
+            # Walk backwards from the cursor, then restore newest-first order
+            rows = list(queryset.filter(
+                Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+            ).order_by('created_at', 'id')[:per_page + 1])
+            has_next, has_prev = True, len(rows) > per_page
+            rows = rows[:per_page][::-1]
+
+    if not rows:
+        return KeysetPage([])
+    return KeysetPage(
+        rows,
+        next_cursor=encode_cursor(rows[-1].created_at, rows[-1].pk, 'n') if has_next else None,
+        prev_cursor=encode_cursor(rows[0].created_at, rows[0].pk, 'p') if has_prev else None,
+    )
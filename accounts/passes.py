@@ -0,0 +1,163 @@
+import hashlib
+from io import BytesIO
+
+import qrcode
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from django.utils import timezone
+
+# Served formats and their content types
+PASS_FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+# Edge lengths (px) a PNG pass can be asked for; other sizes snap to the nearest,
+# so the store holds a handful of variants per pass. SVG scales, so it has one.
+PASS_SIZES = (160, 320, 640)
+DEFAULT_PASS_SIZE = 320
+
+# Rendered passes live under this storage prefix, named by content hash
+PASS_DIR = 'qr_passes'
+
+# Where Booking.qr_code used to write one PNG per booking (removed by prune_passes)
+LEGACY_PASS_DIR = 'qr_codes'
+
+# Quiet zone around the code, in modules (the QR spec asks for 4)
+QR_BORDER = 4
+
+
+# ==========================================
+# QR ENTRY PASSES
+# ==========================================
+# A pass is rendered on first request and stored under the hash of what it
+# encodes, so it is immutable: a booking edit that changes the payload gets a
+# new URL, any other edit keeps the cached file and every browser's copy.
+
+def pass_payload(booking):
+    """Text encoded in the booking's entry pass"""
+    return (
+        f"ENTRY PASS\nID: {booking.id}\nUser: {booking.user.username}\n"
+        f"Event: {booking.event_name}\nVenue: {booking.venue.name}\nTime: {booking.start_time}"
+    )
+
+
+def pass_size(fmt, size=None):
+    """The stored size for a requested one (0 for SVG)"""
+    if fmt == 'svg':
+        return 0
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        return DEFAULT_PASS_SIZE
+    return min(PASS_SIZES, key=lambda allowed: abs(allowed - size))
+
+
+def pass_digest(payload, fmt, size):
+    return hashlib.sha256(f"{fmt}\n{size}\n{payload}".encode()).hexdigest()[:40]
+
+
+def pass_name(digest, fmt):
+    return f"{PASS_DIR}/{digest[:2]}/{digest}.{fmt}"
+
+
+def pass_url(booking, fmt='png', size=None):
+    """Content-addressed URL of the booking's current pass (needs booking.user / booking.venue)"""
+    size = pass_size(fmt, size)
+    digest = pass_digest(pass_payload(booking), fmt, size)
+    return reverse('booking_pass_file', args=[booking.id, size, digest, fmt])
+
+
+# ==========================================
+# RENDERING
+# ==========================================
+def _qr_matrix(data):
+    qr = qrcode.QRCode(border=QR_BORDER)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr
+
+
+def render_pass(data, fmt='png', size=DEFAULT_PASS_SIZE):
+    """Pass bytes for ``data``. Pure function, so it can run in a thread or process pool"""
+    qr = _qr_matrix(data)
+    if fmt == 'svg':
+        return render_svg(qr.get_matrix())
+
+    qr.box_size = max(size // (qr.modules_count + 2 * QR_BORDER), 1)
+    canvas = BytesIO()
+    qr.make_image().save(canvas, format='PNG')
+    return canvas.getvalue()
+
+
+def render_svg(matrix):
+    """One path of dark runs per row: far smaller than a square per module"""
+    width = len(matrix)
+    runs = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < width:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < width and row[x]:
+                x += 1
+            runs.append(f"M{start} {y}h{x - start}v1h-{x - start}z")
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width} {width}" shape-rendering="crispEdges">'
+        f'<rect width="100%" height="100%" fill="#fff"/><path d="{"".join(runs)}"/></svg>'
+    ).encode()
+
+
+# ==========================================
+# STORE
+# ==========================================
+def store_pass(digest, fmt, content):
+    """Save rendered bytes under their hash; a concurrent render of the same pass is dropped"""
+    name = pass_name(digest, fmt)
+    if not default_storage.exists(name):
+        saved = default_storage.save(name, ContentFile(content))
+        if saved != name:
+            default_storage.delete(saved)
+    return name
+
+
+def get_pass(payload, fmt, size):
+    """Bytes of a pass, rendered and stored on first use"""
+    digest = pass_digest(payload, fmt, size)
+    name = pass_name(digest, fmt)
+    if default_storage.exists(name):
+        with default_storage.open(name, 'rb') as f:
+            return f.read()
+    content = render_pass(payload, fmt, size)
+    store_pass(digest, fmt, content)
+    return content
+
+
+def live_digests():
+    """Digests of every variant of every pass still in use (APPROVED bookings that have not ended)"""
+    from .models import Booking
+
+    bookings = Booking.objects.filter(status='APPROVED', end_time__gte=timezone.now()).select_related('user', 'venue')
+    variants = [('svg', 0)] + [('png', size) for size in PASS_SIZES]
+    digests = set()
+    for booking in bookings.iterator(chunk_size=2000):
+        payload = pass_payload(booking)
+        digests.update(pass_digest(payload, fmt, size) for fmt, size in variants)
+    return digests
+
+
+def prune_passes():
+    """Delete stored passes nothing encodes any more, and the old per-booking PNGs. Returns the count."""
+    keep = live_digests()
+    deleted = 0
+    if default_storage.exists(PASS_DIR):
+        for bucket in default_storage.listdir(PASS_DIR)[0]:
+            for file_name in default_storage.listdir(f"{PASS_DIR}/{bucket}")[1]:
+                if file_name.rsplit('.', 1)[0] not in keep:
+                    default_storage.delete(f"{PASS_DIR}/{bucket}/{file_name}")
+                    deleted += 1
+    if default_storage.exists(LEGACY_PASS_DIR):
+        for file_name in default_storage.listdir(LEGACY_PASS_DIR)[1]:
+            default_storage.delete(f"{LEGACY_PASS_DIR}/{file_name}")
+            deleted += 1
+    return deleted
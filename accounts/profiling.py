@@ -0,0 +1,174 @@
+import json
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template as DjangoBackendTemplate, reraise
+from django.utils import timezone
+
+# Slow requests are written here as one JSON object per line (see LOGGING)
+slow_log = logging.getLogger('accounts.slow_requests')
+
+# Repeated statements listed per slow request
+TOP_QUERIES = 5
+
+# The stats of the request being handled on this thread / task
+_current = ContextVar('request_profile', default=None)
+
+
+class RequestProfile:
+    """Counters collected while one request is handled"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view = None
+        self.queries = 0
+        self.db_ms = 0.0
+        self.template_ms = 0.0
+        # SQL (with placeholders, so repeated lookups group together) -> [count, ms]
+        self.statements = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        """connection.execute_wrapper hook: time every statement"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.queries += 1
+            self.db_ms += elapsed
+            entry = self.statements.setdefault(sql, [0, 0.0])
+            entry[0] += 1
+            entry[1] += elapsed
+
+    def top_repeated(self, limit=TOP_QUERIES):
+        counts = Counter({sql: entry[0] for sql, entry in self.statements.items() if entry[0] > 1})
+        return [
+            {'sql': sql, 'count': count, 'ms': round(self.statements[sql][1], 2)}
+            for sql, count in counts.most_common(limit)
+        ]
+
+
+# ==========================================
+# TEMPLATE TIMING
+# ==========================================
+# Django only sends template_rendered under the test runner, so the timing
+# comes from a template backend instead (TEMPLATES' BACKEND in settings).
+# Includes are rendered inside the outer render(), so they are not counted twice.
+class TimedTemplate(DjangoBackendTemplate):
+    def render(self, context=None, request=None):
+        profile = _current.get()
+        if profile is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            profile.template_ms += (time.perf_counter() - started) * 1000
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, adding render times to the request's profile"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+# ==========================================
+# MIDDLEWARE
+# ==========================================
+class RequestProfilingMiddleware:
+    """
+    Adds a Server-Timing header (db / tpl / total) to every response and logs
+    requests slower than SLOW_REQUEST_THRESHOLD_MS, with their most repeated
+    queries, to the slow request log. tpl needs the TimedDjangoTemplates backend.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.threshold_ms = getattr(settings, 'SLOW_REQUEST_THRESHOLD_MS', 500)
+        self.server_timing = getattr(settings, 'SERVER_TIMING', True)
+        # Under ASGI the chain below is async: stay async so no thread is spent per request
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _wrap_connections(stack, profile):
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(profile))
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profile = RequestProfile()
+        token = _current.set(profile)
+        try:
+            with ExitStack() as stack:
+                self._wrap_connections(stack, profile)
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, profile)
+
+    async def __acall__(self, request):
+        profile = RequestProfile()
+        token = _current.set(profile)
+        # Connections are per thread, and under ASGI the queries (sync views,
+        # the async ORM) run on the request's thread-sensitive executor, not
+        # on the event loop: wrap that thread's connections, from that thread
+        stack = ExitStack()
+        try:
+            await sync_to_async(self._wrap_connections, thread_sensitive=True)(stack, profile)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(stack.close, thread_sensitive=True)()
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, profile)
+
+    def finish(self, request, response, profile):
+        total_ms = (time.perf_counter() - profile.started) * 1000
+        if self.server_timing:
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={profile.db_ms:.1f};desc="{profile.queries} queries"',
+                f'tpl;dur={profile.template_ms:.1f}',
+                f'total;dur={total_ms:.1f}',
+            ])
+        if total_ms >= self.threshold_ms:
+            self.log_slow_request(request, response, profile, total_ms)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = _current.get()
+        if profile is not None:
+            profile.view = getattr(view_func, '__name__', repr(view_func))
+
+    def log_slow_request(self, request, response, profile, total_ms):
+        slow_log.warning(json.dumps({
+            'time': timezone.now().isoformat(),
+            'method': request.method,
+            'path': request.path,
+            'view': profile.view,
+            'status': response.status_code,
+            'total_ms': round(total_ms, 2),
+            'db_ms': round(profile.db_ms, 2),
+            'template_ms': round(profile.template_ms, 2),
+            'queries': profile.queries,
+            'repeated_queries': profile.top_repeated(),
+        }))
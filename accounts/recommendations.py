@@ -0,0 +1,132 @@
+import re
+from datetime import datetime, timedelta
+
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .booking_index import ACTIVE_STATUSES
+from .models import Booking, Venue
+
+# Equipment words CampusBot recognises in a message
+KNOWN_EQUIPMENT = ('projector', 'wifi', 'ac', 'mic', 'microphone', 'whiteboard', 'speaker', 'computer', 'screen')
+
+# Length of the window assumed when a message names no end time
+DEFAULT_WINDOW = timedelta(hours=1)
+
+
+def clashing_bookings(start_time, end_time):
+    """APPROVED/PENDING bookings of the outer query's venue overlapping [start_time, end_time)"""
+    return Booking.objects.filter(
+        venue=OuterRef('pk'),
+        status__in=ACTIVE_STATUSES,
+        start_time__lt=end_time,
+        end_time__gt=start_time
+    )
+
+
+def recommended_venues(headcount, start_time, end_time, equipment=(), limit=5, exclude_ids=()):
+    """
+    Queryset of the ``limit`` best-fitting venues for a group: big enough, carrying every
+    piece of ``equipment`` and free for the whole window - smallest adequate
+    room first. ONE query: the availability test is a NOT EXISTS anti-join.
+    """
+    venues = Venue.objects.filter(capacity__gte=max(int(headcount or 0), 0))
+    for item in equipment:
+        venues = venues.filter(equipment__icontains=item)
+    if exclude_ids:
+        venues = venues.exclude(pk__in=list(exclude_ids))
+    return venues.filter(~Exists(clashing_bookings(start_time, end_time))).order_by('capacity', 'name')[:limit]
+
+
+def recommend_venues(headcount, start_time, end_time, equipment=(), limit=5, exclude_ids=()):
+    return list(recommended_venues(headcount, start_time, end_time, equipment, limit, exclude_ids))
+
+
+async def arecommend_venues(headcount, start_time, end_time, equipment=(), limit=5, exclude_ids=()):
+    return [venue async for venue in recommended_venues(headcount, start_time, end_time, equipment, limit, exclude_ids)]
+
+
+# ==========================================
+# CAMPUSBOT MESSAGE PARSING
+# ==========================================
+def parse_equipment(text):
+    words = set(re.findall(r'[a-z]+', text.lower()))
+    return [item for item in KNOWN_EQUIPMENT if item in words]
+
+
+def parse_headcount(text):
+    """'room for 30 people' -> 30 (numbers that are clearly times are skipped)"""
+    match = re.search(r'(\d+)\s*(?:people|pax|persons|students|seats)', text)
+    if match:
+        return int(match.group(1))
+    for match in re.finditer(r'\d+', text):
+        following = text[match.end():match.end() + 3]
+        if not re.match(r'\s*(?::|am|pm)', following):
+            return int(match.group())
+    return None
+
+
+def parse_window(text, now=None, table=None):
+    """
+    'tomorrow at 3pm' / 'at 14:30' / nothing -> (start, end). Defaults to the
+    next DEFAULT_WINDOW from now; an explicit time on a past moment of today
+    moves to tomorrow. With the schedule's SlotTable the window is moved onto
+    bookable slots (see bookable_window).
+    """
+    now = now or timezone.now()
+    start = _requested_start(text, now)
+    if table is not None:
+        return bookable_window(start, table, now)
+    return start, start + DEFAULT_WINDOW
+
+
+def _requested_start(text, now):
+    local_now = timezone.localtime(now)
+    day = local_now.date() + timedelta(days=1) if 'tomorrow' in text else local_now.date()
+
+    match = re.search(r'\b(\d{1,2})(?::(\d{2}))?\s*(am|pm)\b', text) or re.search(r'\b(\d{1,2}):(\d{2})\b()', text)
+    if not match:
+        if day == local_now.date():
+            return now
+        return timezone.make_aware(datetime.combine(day, local_now.time().replace(second=0, microsecond=0)))
+
+    hour, minute, meridiem = int(match.group(1)), int(match.group(2) or 0), match.group(3)
+    if meridiem == 'pm' and hour < 12:
+        hour += 12
+    elif meridiem == 'am' and hour == 12:
+        hour = 0
+    if hour > 23 or minute > 59:
+        return now
+
+    start = timezone.make_aware(datetime.combine(day, datetime.min.time().replace(hour=hour, minute=minute)))
+    if start < now and 'tomorrow' not in text:
+        start += timedelta(days=1)
+    return start
+
+
+def _at_minute(day, minutes):
+    return timezone.make_aware(datetime.combine(day, datetime.min.time().replace(hour=minutes // 60, minute=minutes % 60)))
+
+
+def bookable_window(start, table, now=None):
+    """
+    (start, end) on the slot grid of ``table``: from the slot holding ``start``
+    - or the next one, when that slot has begun already or ``start`` is
+    outside opening hours, rolling over to the next day - for DEFAULT_WINDOW,
+    cut short at closing time. What the bot offers can then really be booked.
+    """
+    now = now or timezone.now()
+    if not table.slots:
+        return start, start + DEFAULT_WINDOW
+    local = timezone.localtime(start)
+    minute = local.hour * 60 + local.minute
+    window = int(DEFAULT_WINDOW.total_seconds() // 60)
+
+    for offset in (0, 1):
+        day = local.date() + timedelta(days=offset)
+        for slot_start, slot_end in zip(table.starts, table.ends):
+            begins = _at_minute(day, slot_start)
+            if begins >= now and (offset or slot_end > minute):
+                end_minute = next((end for end in table.ends if end >= slot_start + window), table.ends[-1])
+                return begins, _at_minute(day, end_minute)
+    return start, start + DEFAULT_WINDOW
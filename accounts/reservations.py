@@ -0,0 +1,177 @@
+from django.db import transaction
+from django.db.models import Q
+
+from .availability import day_masks, get_slot_table
+from .booking_index import ACTIVE_STATUSES, booking_index
+from .models import Booking, SlotReservation, Venue, VenueSchedule
+
+# Reservation rows written / deleted per statement
+BATCH_SIZE = 500
+
+# What a booking hears when one of its slots is held by another booking
+RESERVED_MESSAGE = "Time slot is already reserved by another booking."
+
+
+def booking_cells(table, start_time, end_time):
+    """Every (day, slot_index) of the slot grid that [start_time, end_time) touches"""
+    for day, mask in day_masks(table, start_time, end_time):
+        slot_index = 0
+        while mask:
+            if mask & 1:
+                yield day, slot_index
+            mask >>= 1
+            slot_index += 1
+
+
+def _footprint(venue_id, start_time, end_time, status):
+    return (venue_id, start_time, end_time) if status in ACTIVE_STATUSES else None
+
+
+def footprint_changed(booking):
+    """True when the write moves, frees or takes slots (new rows always count)"""
+    before = _footprint(
+        booking.get_loaded_value('venue_id'),
+        booking.get_loaded_value('start_time'),
+        booking.get_loaded_value('end_time'),
+        booking.get_loaded_value('status'),
+    )
+    after = _footprint(booking.venue_id, booking.start_time, booking.end_time, booking.status)
+    return booking.get_loaded_value('id') is None or before != after
+
+
+# ==========================================
+# WRITE PATH
+# ==========================================
+def sync_reservations(bookings):
+    """
+    Rewrite the slot reservations of bookings whose venue, times or status
+    changed, inside the bookings' own transaction (post_save and
+    bookings_bulk_changed receivers). A plain writer: checking is done before
+    the write, by Booking.clean() / save_checked() and the set-based writers
+    through reservation_conflicts(). A slot another booking already holds
+    stays with its holder (reconcile() reports the overlap), so a write that
+    skipped the checks still never fails here.
+    """
+    changed = [booking for booking in bookings if footprint_changed(booking)]
+    if not changed:
+        return
+
+    table = get_slot_table(VenueSchedule.get_schedule())
+    rows = [
+        SlotReservation(venue_id=booking.venue_id, date=day, slot_index=slot_index, booking_id=booking.pk)
+        for booking in changed if booking.status in ACTIVE_STATUSES
+        for day, slot_index in booking_cells(table, booking.start_time, booking.end_time)
+    ]
+
+    booking_ids = [booking.pk for booking in changed]
+    for i in range(0, len(booking_ids), BATCH_SIZE):
+        SlotReservation.objects.filter(booking_id__in=booking_ids[i:i + BATCH_SIZE]).delete()
+    SlotReservation.objects.bulk_create(rows, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+def reservation_conflicts(bookings):
+    """
+    The bookings (in the given order) whose write would take a slot another
+    booking holds, found before writing so the write can be refused (clean())
+    or leave them out and report them (set-based writes). Within the list,
+    the earlier booking keeps a contested slot.
+    """
+    changed = [booking for booking in bookings if footprint_changed(booking)]
+    claiming = [booking for booking in changed if booking.status in ACTIVE_STATUSES]
+    if not claiming:
+        return []
+
+    table = get_slot_table(VenueSchedule.get_schedule())
+    wanted = [
+        (booking, {(booking.venue_id, day, slot_index) for day, slot_index in booking_cells(table, booking.start_time, booking.end_time)})
+        for booking in claiming
+    ]
+    venue_days = Q()
+    for venue_id, day in {(venue_id, day) for _, cells in wanted for venue_id, day, _ in cells}:
+        venue_days |= Q(venue_id=venue_id, date=day)
+    if not venue_days:
+        return []
+
+    # Slots the changed bookings hold now are rewritten by the same write
+    rewritten = [booking.pk for booking in changed if booking.pk is not None]
+    taken = set(
+        SlotReservation.objects.filter(venue_days).exclude(booking_id__in=rewritten).values_list('venue_id', 'date', 'slot_index')
+    )
+    conflicts = []
+    for booking, cells in wanted:
+        if cells & taken:
+            conflicts.append(booking)
+        else:
+            taken |= cells
+    return conflicts
+
+
+# ==========================================
+# BACKFILL / RECONCILIATION
+# ==========================================
+def expected_reservations(table, venue_id):
+    """
+    {(day, slot_index): booking_id} the venue's active bookings should hold,
+    plus the conflicts [(day, slot_index, holder_id, loser_id)]. The earliest
+    request keeps a contested slot.
+    """
+    expected = {}
+    conflicts = []
+    bookings = Booking.objects.filter(
+        venue_id=venue_id,
+        status__in=ACTIVE_STATUSES
+    ).order_by('created_at', 'id').values_list('id', 'start_time', 'end_time')
+
+    for booking_id, start_time, end_time in bookings.iterator(chunk_size=2000):
+        for cell in booking_cells(table, start_time, end_time):
+            holder = expected.setdefault(cell, booking_id)
+            if holder != booking_id:
+                conflicts.append((*cell, holder, booking_id))
+    return expected, conflicts
+
+
+def reconcile_venue(table, venue_id, dry_run=False):
+    """Bring one venue's reservations in line with its bookings. Returns (created, deleted, conflicts)."""
+    expected, conflicts = expected_reservations(table, venue_id)
+    existing = {
+        (day, slot_index): (pk, booking_id)
+        for pk, day, slot_index, booking_id in SlotReservation.objects.filter(venue_id=venue_id).values_list(
+            'pk', 'date', 'slot_index', 'booking_id'
+        ).iterator(chunk_size=2000)
+    }
+
+    stale = [pk for cell, (pk, booking_id) in existing.items() if expected.get(cell) != booking_id]
+    missing = [
+        SlotReservation(venue_id=venue_id, date=day, slot_index=slot_index, booking_id=booking_id)
+        for (day, slot_index), booking_id in expected.items()
+        if existing.get((day, slot_index), (None, None))[1] != booking_id
+    ]
+
+    if not dry_run and (stale or missing):
+        with transaction.atomic():
+            for i in range(0, len(stale), BATCH_SIZE):
+                SlotReservation.objects.filter(pk__in=stale[i:i + BATCH_SIZE]).delete()
+            SlotReservation.objects.bulk_create(missing, batch_size=BATCH_SIZE)
+        # Cached bitmaps of this venue were built from the old rows
+        transaction.on_commit(lambda: booking_index.invalidate(venue_id), robust=True)
+
+    return len(missing), len(stale), conflicts
+
+
+def reconcile(venue_ids=None, dry_run=False, schedule=None):
+    """
+    Rebuild reservations from the Booking table, venue by venue, on the grid
+    of ``schedule`` (default: the current one) - backfill, renumbering after
+    a schedule change, drift check. Returns
+    {venue_id: (created, deleted, conflicts)} for venues that were out of line.
+    """
+    table = get_slot_table(schedule or VenueSchedule.get_schedule())
+    if venue_ids is None:
+        venue_ids = Venue.objects.order_by('pk').values_list('pk', flat=True)
+
+    report = {}
+    for venue_id in venue_ids:
+        created, deleted, conflicts = reconcile_venue(table, venue_id, dry_run=dry_run)
+        if created or deleted or conflicts:
+            report[venue_id] = (created, deleted, conflicts)
+    return report
@@ -0,0 +1,165 @@
+from bisect import bisect_left
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .booking_index import ACTIVE_STATUSES
+from .bulk import create_bookings, delete_bookings, set_status
+from .models import Booking, BookingSeries, Venue, VenueSchedule, NO_OVERLAP_CONSTRAINT
+from .reservations import RESERVED_MESSAGE, reservation_conflicts
+
+# Longest series a user can request in one go (two semesters of weekly bookings)
+MAX_OCCURRENCES = 60
+
+# Booking fields every occurrence copies from the submitted form
+TEMPLATE_FIELDS = ('purpose', 'description', 'addon_equipment', 'document', 'time_slot')
+
+# One line of the per-occurrence report; status is 'ok', 'conflict' or 'invalid'
+OccurrenceCheck = namedtuple('OccurrenceCheck', 'booking status reason')
+
+
+def occurrences(series):
+    """
+    (start, end) of every occurrence. Later occurrences keep the local
+    wall-clock times of the first, so a weekly 14:00 stays 14:00 across DST.
+    """
+    step = timedelta(days=series.interval) if series.frequency == 'DAILY' else timedelta(weeks=series.interval)
+    local_start = timezone.localtime(series.start_time)
+    local_end = timezone.localtime(series.end_time)
+    days_spanned = local_end.date() - local_start.date()
+
+    for n in range(series.count):
+        day = local_start.date() + step * n
+        yield (
+            timezone.make_aware(datetime.combine(day, local_start.time())),
+            timezone.make_aware(datetime.combine(day + days_spanned, local_end.time())),
+        )
+
+
+def build_bookings(series, template=None, status='PENDING'):
+    """Unsaved Booking rows for the series, copying the extra fields of ``template``"""
+    bookings = []
+    for start_time, end_time in occurrences(series):
+        booking = Booking(
+            user_id=series.user_id, venue_id=series.venue_id, event_name=series.event_name,
+            start_time=start_time, end_time=end_time, status=status,
+        )
+        if template is not None:
+            for field in TEMPLATE_FIELDS:
+                setattr(booking, field, getattr(template, field))
+        bookings.append(booking)
+    return bookings
+
+
+# ==========================================
+# VALIDATION
+# ==========================================
+def check_occurrences(venue_id, bookings):
+    """
+    Per-occurrence report [OccurrenceCheck, ...] in date order. The times are
+    checked in memory; clashes with existing bookings come from ONE range
+    query spanning the whole series. Each accepted occurrence joins them, so
+    occurrences longer than the series interval clash with each other too.
+    """
+    schedule = VenueSchedule.get_schedule()
+    existing = list(Booking.objects.filter(
+        venue_id=venue_id,
+        status__in=ACTIVE_STATUSES,
+        start_time__lt=max(b.end_time for b in bookings),
+        end_time__gt=min(b.start_time for b in bookings),
+    ).order_by('start_time').values_list('start_time', 'end_time', 'event_name'))
+    starts = [row[0] for row in existing]
+    longest = max((end - start for start, end, _ in existing), default=timedelta(0))
+
+    report = []
+    for booking in bookings:
+        try:
+            booking.validate_times(schedule)
+        except ValidationError as e:
+            report.append(OccurrenceCheck(booking, 'invalid', e.messages[0] if e.messages else str(e)))
+            continue
+
+        # Only bookings starting within `longest` before this one can reach into it
+        i = bisect_left(starts, booking.start_time - longest)
+        clash = None
+        while i < len(existing) and existing[i][0] < booking.end_time:
+            if existing[i][1] > booking.start_time:
+                clash = existing[i]
+                break
+            i += 1
+        if clash:
+            report.append(OccurrenceCheck(booking, 'conflict', f"Conflicts with existing booking: {clash[2] or 'another booking'}"))
+            continue
+
+        report.append(OccurrenceCheck(booking, 'ok', ''))
+        interval = (booking.start_time, booking.end_time, f"{booking.event_name or 'this series'} (earlier occurrence)")
+        position = bisect_left(starts, booking.start_time)
+        starts.insert(position, booking.start_time)
+        existing.insert(position, interval)
+        longest = max(longest, booking.end_time - booking.start_time)
+    return report
+
+
+def create_series(series, template=None, skip_conflicts=False):
+    """
+    Validate every occurrence and write the series plus its bookings in ONE
+    transaction, under the venue lock (see Booking.save_checked). Nothing is
+    written if any occurrence fails, unless ``skip_conflicts`` - then only the
+    clean ones are booked. Returns (created bookings, report).
+    """
+    if not 1 <= series.count <= MAX_OCCURRENCES:
+        raise ValidationError(f"A series can have between 1 and {MAX_OCCURRENCES} occurrences.")
+
+    try:
+        with transaction.atomic():
+            list(Venue.objects.select_for_update().filter(pk=series.venue_id).values_list('pk', flat=True))
+
+            report = check_occurrences(series.venue_id, build_bookings(series, template))
+            # Slots reserved by bookings the interval check let through (e.g. older off-grid ones)
+            taken = {id(booking) for booking in reservation_conflicts([c.booking for c in report if c.status == 'ok'])}
+            if taken:
+                report = [
+                    OccurrenceCheck(check.booking, 'conflict', RESERVED_MESSAGE)
+                    if id(check.booking) in taken else check
+                    for check in report
+                ]
+            bookable = [check.booking for check in report if check.status == 'ok']
+            if not bookable or (len(bookable) < len(report) and not skip_conflicts):
+                return [], report
+
+            series.save()
+            for booking in bookable:
+                booking.series = series
+            return create_bookings(bookable), report
+    except IntegrityError as e:
+        if NO_OVERLAP_CONSTRAINT in str(e):
+            raise ValidationError("Time slot conflicts with an existing booking.")
+        raise
+
+
+# ==========================================
+# WHOLE-SERIES ACTIONS
+# ==========================================
+def series_bookings(series):
+    """Bookings of one series, or of every series in a queryset"""
+    if isinstance(series, BookingSeries):
+        return Booking.objects.filter(series=series)
+    return Booking.objects.filter(series_id__in=list(series.values_list('pk', flat=True)))
+
+
+def approve_series(series, by=None):
+    """(approved bookings, bookings left pending because their slot is taken)"""
+    return set_status(series_bookings(series).filter(status='PENDING'), 'APPROVED', by=by)
+
+
+def reject_series(series, by=None):
+    """(rejected bookings, []): rejecting frees slots, so nothing conflicts"""
+    return set_status(series_bookings(series).exclude(status='REJECTED'), 'REJECTED', by=by)
+
+
+def cancel_series(series, now=None):
+    """Delete the occurrences that have not started yet; past ones stay as history"""
+    return delete_bookings(series_bookings(series).filter(start_time__gt=now or timezone.now()))
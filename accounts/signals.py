@@ -0,0 +1,292 @@
+import copy
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, post_migrate
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from .models import Booking, Venue, VenueSchedule, SCHEDULE_VERSION_NAME
+from .caching import bump_version
+from .booking_index import booking_index
+from .utils import calendar_version_name
+
+# Sent after set-based writes (QuerySet.update, bulk_create) that skip post_save.
+# Receives bookings=[Booking, ...] holding the NEW values; get_loaded_value()
+# still returns what each row held before the write (None for new rows).
+bookings_bulk_changed = Signal()
+
+# Sent after a set-based delete that skips post_delete (see bulk.py), with
+# bookings=[Booking, ...] as they were read just before the DELETE.
+bookings_bulk_deleted = Signal()
+
+# Sent after venues are written with bulk_create / bulk_update (see transfer.py)
+venues_bulk_changed = Signal()
+
+
+def _after_commit(func, *args):
+    """Run func(*args) once the current transaction commits, so nobody reloads before the write is visible"""
+    transaction.on_commit(lambda: func(*args), robust=True)
+
+
+def _months_touched(booking):
+    """(year, month) pairs whose calendar shows this booking, before and after the write"""
+    months = set()
+    for value in (booking.start_time, booking.get_loaded_value('start_time')):
+        if value is not None:
+            local = timezone.localtime(value)
+            months.add((local.year, local.month))
+    return months
+
+
+# ==========================================
+# SLOT RESERVATIONS
+# ==========================================
+# Plain writers: whether the slots are free is checked before the write, by
+# Booking.clean() / save_checked() and the set-based writers (see reservations.py).
+@receiver(post_save, sender=Booking)
+def reserve_slots_on_save(sender, instance, **kwargs):
+    from .reservations import sync_reservations
+    sync_reservations([instance])
+
+
+@receiver(bookings_bulk_changed)
+def reserve_slots_on_bulk_change(sender, bookings, **kwargs):
+    from .reservations import sync_reservations
+    sync_reservations(bookings)
+
+
+@receiver(post_save, sender=VenueSchedule)
+def reconcile_reservations_on_schedule_change(sender, instance, created, **kwargs):
+    # A new slot grid re-numbers every reservation. Done in the schedule's own
+    # transaction, under every venue lock, so no booking write ever compares
+    # cells of the old grid with cells of the new one.
+    if not created:
+        from .reservations import reconcile
+        with transaction.atomic():
+            venue_ids = list(Venue.objects.select_for_update().order_by('pk').values_list('pk', flat=True))
+            reconcile(venue_ids=venue_ids, schedule=instance)
+
+
+# ==========================================
+# CALENDAR CACHE INVALIDATION
+# ==========================================
+# Bumped after commit: a month rebuilt on the new stamp must see the new rows
+def _bump_months(months):
+    for year, month in months:
+        bump_version(calendar_version_name(year, month))
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def invalidate_calendar(sender, instance, **kwargs):
+    _after_commit(_bump_months, _months_touched(instance))
+
+
+@receiver(bookings_bulk_changed)
+@receiver(bookings_bulk_deleted)
+def invalidate_calendar_on_bulk_change(sender, bookings, **kwargs):
+    months = set()
+    for booking in bookings:
+        months |= _months_touched(booking)
+    _after_commit(_bump_months, months)
+
+
+# ==========================================
+# CLASH INDEX MAINTENANCE
+# ==========================================
+# After commit: the venue stamp also keys the cached availability bitmaps, and
+# a worker that saw it move before the rows were visible would rebuild (and
+# cache) both from the old ones.
+@receiver(post_save, sender=Booking)
+def update_booking_index_on_save(sender, instance, **kwargs):
+    # A copy: save() forgets the loaded values (the booking's old venue) before commit
+    _after_commit(booking_index.booking_saved, copy.copy(instance))
+
+
+@receiver(post_delete, sender=Booking)
+def update_booking_index_on_delete(sender, instance, **kwargs):
+    _after_commit(booking_index.booking_deleted, instance)
+
+
+@receiver(bookings_bulk_changed)
+@receiver(bookings_bulk_deleted)
+def update_booking_index_on_bulk_change(sender, bookings, **kwargs):
+    # Cheaper to reload each touched venue once than to patch it row by row
+    venue_ids = {b.venue_id for b in bookings} | {b.get_loaded_value('venue_id') for b in bookings}
+    for venue_id in venue_ids - {None}:
+        _after_commit(booking_index.invalidate, venue_id)
+
+
+# ==========================================
+# ICS FEEDS AND RENDERED FRAGMENTS
+# ==========================================
+# Venue feeds follow the clash index stamp above. User feeds and the pages'
+# cached fragments follow the stamps below; fragments that show venues also
+# carry the venue-set stamp (see VENUE SET STAMP below).
+def _bump_booking_stamps(bookings):
+    from .fragments import booking_version_name, user_bookings_version_name
+    user_ids = {b.user_id for b in bookings} | {b.get_loaded_value('user_id') for b in bookings}
+    names = [user_bookings_version_name(user_id) for user_id in user_ids - {None}]
+    names += [booking_version_name(booking_id) for booking_id in {b.pk for b in bookings} - {None}]
+    for name in names:
+        _after_commit(bump_version, name)
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def invalidate_booking_stamps(sender, instance, **kwargs):
+    _bump_booking_stamps([instance])
+
+
+@receiver(bookings_bulk_changed)
+@receiver(bookings_bulk_deleted)
+def invalidate_booking_stamps_on_bulk_change(sender, bookings, **kwargs):
+    _bump_booking_stamps(bookings)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_stamp(sender, instance, update_fields=None, **kwargs):
+    from .fragments import user_version_name
+    if update_fields == {'last_login'}:
+        return  # every login saves this; no fragment shows it
+    _after_commit(bump_version, user_version_name(instance.pk))
+
+
+# ==========================================
+# SCHEDULE CACHE INVALIDATION
+# ==========================================
+@receiver(post_save, sender=VenueSchedule)
+@receiver(post_delete, sender=VenueSchedule)
+def invalidate_schedule(sender, **kwargs):
+    # Every worker compares this stamp before using its cached schedule. Bumped
+    # after commit: a worker reloading on the new stamp must see the new row.
+    _after_commit(bump_version, SCHEDULE_VERSION_NAME)
+
+
+# ==========================================
+# QR ENTRY PASSES
+# ==========================================
+# Booking fields encoded in the pass (see passes.pass_payload)
+PASS_FIELDS = ('user_id', 'event_name', 'venue_id', 'start_time')
+
+
+def _needs_qr_pass(booking):
+    # On approval, or when an approved booking's pass content changed: the worker
+    # renders the new pass ahead of the first request for it
+    if booking.status != 'APPROVED':
+        return False
+    return booking.get_loaded_value('status') != 'APPROVED' or any(
+        booking.get_loaded_value(field) != getattr(booking, field) for field in PASS_FIELDS
+    )
+
+
+@receiver(post_save, sender=Booking)
+def queue_qr_pass(sender, instance, **kwargs):
+    if _needs_qr_pass(instance):
+        from .jobs import enqueue_qr_pass
+        enqueue_qr_pass(instance)
+
+
+@receiver(bookings_bulk_changed)
+def queue_qr_passes_on_bulk_change(sender, bookings, **kwargs):
+    from .jobs import enqueue_many
+    enqueue_many('qr_pass', {b.id: {'booking_id': b.id} for b in bookings if _needs_qr_pass(b)})
+
+
+# ==========================================
+# PER-USER STATUS COUNTERS
+# ==========================================
+@receiver(post_save, sender=Booking)
+def update_counters_on_save(sender, instance, **kwargs):
+    from .counters import apply_deltas, change_deltas
+    apply_deltas(change_deltas([instance]))
+
+
+@receiver(post_delete, sender=Booking)
+def update_counters_on_delete(sender, instance, **kwargs):
+    from .counters import apply_deltas, change_deltas
+    # Never create rows here: the user itself may be in the middle of being deleted
+    apply_deltas(change_deltas([instance], deleted=True), create_missing=False)
+
+
+@receiver(bookings_bulk_changed)
+def update_counters_on_bulk_change(sender, bookings, **kwargs):
+    from .counters import apply_deltas, change_deltas
+    apply_deltas(change_deltas(bookings))
+
+
+@receiver(bookings_bulk_deleted)
+def update_counters_on_bulk_delete(sender, bookings, **kwargs):
+    from .counters import apply_deltas, change_deltas
+    apply_deltas(change_deltas(bookings, deleted=True), create_missing=False)
+
+
+# ==========================================
+# OCCUPANCY BOARD
+# ==========================================
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+@receiver(bookings_bulk_changed)
+@receiver(bookings_bulk_deleted)
+@receiver(post_save, sender=Venue)
+@receiver(post_delete, sender=Venue)
+@receiver(venues_bulk_changed)
+def invalidate_occupancy(sender, **kwargs):
+    from .occupancy import OCCUPANCY_VERSION_NAME
+    _after_commit(bump_version, OCCUPANCY_VERSION_NAME)
+
+
+# ==========================================
+# VENUE SET STAMP (CampusBot's name matcher, venue fragments)
+# ==========================================
+@receiver(post_save, sender=Venue)
+@receiver(post_delete, sender=Venue)
+@receiver(venues_bulk_changed)
+def invalidate_venue_matcher(sender, **kwargs):
+    from .venue_matcher import VENUES_VERSION_NAME
+    _after_commit(bump_version, VENUES_VERSION_NAME)
+
+
+# ==========================================
+# AVAILABILITY EVENTS (SSE)
+# ==========================================
+# After commit, so the new slot state is read from the committed reservations
+# and a rolled-back write never reaches a browser.
+def _publish_on_commit(bookings, deleted=False):
+    from .events import booking_changes, publish_changes
+    changes = booking_changes(bookings, deleted=deleted)
+    if changes:
+        _after_commit(publish_changes, changes)
+
+
+@receiver(post_save, sender=Booking)
+def publish_availability_on_save(sender, instance, **kwargs):
+    _publish_on_commit([instance])
+
+
+@receiver(post_delete, sender=Booking)
+def publish_availability_on_delete(sender, instance, **kwargs):
+    _publish_on_commit([instance], deleted=True)
+
+
+@receiver(bookings_bulk_changed)
+def publish_availability_on_bulk_change(sender, bookings, **kwargs):
+    _publish_on_commit(bookings)
+
+
+@receiver(bookings_bulk_deleted)
+def publish_availability_on_bulk_delete(sender, bookings, **kwargs):
+    _publish_on_commit(bookings, deleted=True)
+
+
+# ==========================================
+# VENUE SEARCH INDEX
+# ==========================================
+@receiver(post_migrate)
+def ensure_venue_search_index(sender, using, **kwargs):
+    # Rebuilding accounts_venue during a SQLite migration drops the FTS triggers
+    if sender.name == 'accounts':
+        from django.db import connections
+        from .venue_search import ensure_fts_index
+        ensure_fts_index(connections[using])
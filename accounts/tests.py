@@ -1,3 +1,971 @@
-from django.test import TestCase
+import io
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core import mail
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import close_old_connections, connection, models, transaction
+from django.template.backends.django import Template as DjangoBackendTemplate
+from django.test import AsyncClient, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .booking_index import booking_index
+from .bulk import delete_bookings, set_status
+from .management.commands import bench
+from .counters import count_bookings, estimated_total, get_counts
+from .documents import DOCUMENT_MAX_SIZE, document_url, parse_range
+from . import events
+from .events import Broker, Event
+from .feeds import feed_token
+from . import jobs
+from .jobs import queue_emails, run_batch
+from .models import BackgroundJob, Booking, BookingSeries, SlotReservation, Venue, VenueSchedule
+from .occupancy import build_snapshot, get_snapshot
+from .pagination import decode_cursor, encode_cursor, keyset_page
+from .passes import DEFAULT_PASS_SIZE, pass_digest, pass_name, pass_payload, pass_url
+from .availability import get_slot_table
+from .recommendations import parse_window, recommend_venues
+from .series import create_series
+from .transfer import import_bookings, import_venues, read_rows, stream_export
+from . import venue_search
+from .venue_matcher import VenueMatcher, get_matcher
+
+
+def at(hour, days=1, minute=0):
+    """Aware datetime ``days`` from today at hour:minute (local time)"""
+    day = timezone.localdate() + timedelta(days=days)
+    return timezone.make_aware(datetime.combine(day, datetime.min.time().replace(hour=hour, minute=minute)))
+
+
+def use_temporary_media(test):
+    """Point MEDIA_ROOT at a directory removed after ``test``"""
+    media = tempfile.TemporaryDirectory()
+    test.addCleanup(media.cleanup)
+    media_root = override_settings(MEDIA_ROOT=media.name)
+    media_root.enable()
+    test.addCleanup(media_root.disable)
+
+
+# Tests below use TransactionTestCase: cache stamps and the clash index are
+# updated on commit, which a TestCase never reaches
+class BookingTestCase(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        booking_index.clear()
+        self.user = User.objects.create_user('alice', password='alice-password')
+        self.venue = Venue.objects.create(name='Hall A', location='Block A', capacity=50)
+
+    def book(self, start, end, user=None, venue=None, status='PENDING', **fields):
+        return Booking.objects.create(
+            user=user or self.user, venue=venue or self.venue, event_name=fields.pop('event_name', 'Event'),
+            start_time=start, end_time=end, status=status, **fields
+        )
+
+
+# ==========================================
+# CONCURRENT BOOKING WRITES
+# ==========================================
+class ConcurrentBookingTests(TransactionTestCase):
+    """Registration-day rush: many threads booking the same slots at once"""
+
+    THREADS = 8
+    ATTEMPTS_PER_THREAD = 10
+
+    def setUp(self):
+        cache.clear()
+        booking_index.clear()
+        self.users = [User.objects.create_user(f'rush_{i}', password='rush-password') for i in range(self.THREADS)]
+        self.venues = [Venue.objects.create(name=f'Hall {i}', location='Block A', capacity=50) for i in range(3)]
+        day = timezone.localdate() + timedelta(days=1)
+        self.slots = [
+            (
+                timezone.make_aware(datetime.combine(day, datetime.min.time().replace(hour=hour))),
+                timezone.make_aware(datetime.combine(day, datetime.min.time().replace(hour=hour + 1))),
+            )
+            for hour in range(9, 12)
+        ]
+
+    def rush(self, user, results):
+        close_old_connections()
+        try:
+            for attempt in range(self.ATTEMPTS_PER_THREAD):
+                venue = self.venues[attempt % len(self.venues)]
+                start, end = self.slots[attempt // len(self.venues) % len(self.slots)]
+                booking = Booking(user=user, venue=venue, event_name=f'{user.username} #{attempt}', start_time=start, end_time=end)
+                try:
+                    booking.save_checked()
+                    results.append('saved')
+                except ValidationError:
+                    results.append('clash')
+        finally:
+            connection.close()
+
+    def test_no_double_booking_under_contention(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("threads need a file-backed test database to share")
+
+        results = []
+        threads = [threading.Thread(target=self.rush, args=(user, results)) for user in self.users]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        # Every attempt finished (no "database is locked"), and each (venue, slot) was won exactly once
+        self.assertEqual(len(results), self.THREADS * self.ATTEMPTS_PER_THREAD)
+        cells = len(self.venues) * len(self.slots)
+        self.assertEqual(results.count('saved'), min(cells, self.ATTEMPTS_PER_THREAD))
+        for venue in self.venues:
+            for start, end in self.slots:
+                self.assertLessEqual(Booking.objects.filter(venue=venue, start_time__lt=end, end_time__gt=start).count(), 1)
+
+        # Loose throughput floor: the lock serializes writers, it must not stall them
+        self.assertLess(elapsed / len(results), 0.5)
+
+
+# ==========================================
+# RECURRING SERIES
+# ==========================================
+class SeriesTests(BookingTestCase):
+    def series(self, **fields):
+        values = dict(user=self.user, venue=self.venue, event_name='Club', start_time=at(10), end_time=at(11), frequency='WEEKLY', count=4)
+        values.update(fields)
+        return BookingSeries(**values)
+
+    def test_occurrences_longer_than_the_interval_clash_with_each_other(self):
+        # Daily, each occurrence running into the next day
+        created, report = create_series(self.series(end_time=at(11, days=2), frequency='DAILY', count=3))
+        self.assertEqual(created, [])
+        self.assertEqual([check.status for check in report], ['ok', 'conflict', 'ok'])
+        self.assertIn('earlier occurrence', report[1].reason)
+        self.assertFalse(Booking.objects.exists())
+
+    def test_set_based_delete_cascades_and_updates_counters(self):
+        bookings = [self.book(at(hour), at(hour + 1)) for hour in (9, 10)]
+        deleted = delete_bookings(Booking.objects.filter(pk=bookings[0].pk))
+        self.assertEqual([b.pk for b in deleted], [bookings[0].pk])
+        self.assertEqual(list(SlotReservation.objects.values_list('booking_id', flat=True)), [bookings[1].pk])
+        self.assertEqual(get_counts(self.user).pending, 1)
+        self.assertEqual(booking_index.clashes(self.venue.id, at(9), at(10)), [])
+
+    def test_set_based_delete_refuses_relations_it_has_no_rule_for(self):
+        booking = self.book(at(10), at(11))
+        protected = SimpleNamespace(
+            related_model=SlotReservation, field=SlotReservation._meta.get_field('booking'), on_delete=models.PROTECT
+        )
+        with mock.patch.dict(Booking._meta.__dict__, {'related_objects': (protected,)}):
+            with self.assertRaises(NotImplementedError):
+                delete_bookings(Booking.objects.all())
+        self.assertTrue(Booking.objects.filter(pk=booking.pk).exists())
+
+
+# ==========================================
+# NOTIFICATION EMAILS (background worker)
+# ==========================================
+class EmailJobTests(TransactionTestCase):
+    def test_retry_sends_only_the_messages_that_did_not_go_out(self):
+        queue_emails([(f'Subject {i}', 'Body', f'user{i}@example.com') for i in range(5)])
+        original = mail.get_connection().__class__.send_messages
+        failed = []
+
+        def flaky(backend, messages):
+            if messages[0].subject == 'Subject 2' and not failed:
+                failed.append(True)
+                raise OSError("connection reset")
+            return original(backend, messages)
+
+        with mock.patch.object(mail.get_connection().__class__, 'send_messages', flaky):
+            run_batch(workers=1)
+            job = BackgroundJob.objects.get()
+            self.assertEqual((job.status, job.payload['sent']), ('QUEUED', 2))
+            run_batch(workers=1)
+
+        self.assertEqual(BackgroundJob.objects.get().status, 'DONE')
+        self.assertEqual([m.subject for m in mail.outbox], [f'Subject {i}' for i in range(5)])
+
+
+# ==========================================
+# VENUE RECOMMENDATIONS
+# ==========================================
+class RecommendationTests(BookingTestCase):
+    def test_default_window_rolls_onto_the_next_bookable_slot(self):
+        table = get_slot_table(VenueSchedule.get_schedule())
+        before_opening = at(4, minute=14)
+        self.assertEqual(parse_window('room for 30 people', now=before_opening, table=table), (at(8), at(9)))
+        after_closing = at(19, minute=30)
+        self.assertEqual(parse_window('room for 30 people', now=after_closing, table=table), (at(8, days=2), at(9, days=2)))
+        self.assertEqual(parse_window('room for 30 at 3:30pm', now=at(9), table=table), (at(15), at(16)))
+
+    def test_smallest_free_room_with_the_equipment_first(self):
+        big = Venue.objects.create(name='Aula', location='Main', capacity=200, equipment='Projector, Mic')
+        seminar = Venue.objects.create(name='Seminar', location='Main', capacity=40, equipment='Whiteboard')
+        busy = Venue.objects.create(name='Lab', location='Main', capacity=35, equipment='Projector')
+        self.book(at(10), at(11), venue=busy)
+        found = recommend_venues(30, at(10), at(11))
+        self.assertEqual([venue.id for venue in found], [seminar.id, self.venue.id, big.id])
+        found = recommend_venues(30, at(10), at(11), equipment=['projector'])
+        self.assertEqual([venue.id for venue in found], [big.id])
+
+
+
+# ==========================================
+# AVAILABILITY EVENTS
+# ==========================================
+class CommitOrderBackend:
+    """Polling backend whose rows show up in commit order, not id order"""
+    polling = True
+
+    def __init__(self):
+        self.visible = []
+
+    def read(self, after_id):
+        return sorted((event for event in self.visible if event.id > after_id), key=lambda event: event.id)
+
+    def last_id(self):
+        return max((event.id for event in self.visible), default=0)
+
+
+class EventPumpTests(BookingTestCase):
+    def setUp(self):
+        super().setUp()
+        events.reset_broker()
+        self.addCleanup(events.reset_broker)
+
+    def test_booking_write_reaches_a_subscriber_through_the_database(self):
+        broker = events.get_broker()
+        self.assertTrue(broker.backend.polling)
+        subscription = broker.subscribe(self.venue.id, timezone.localdate() + timedelta(days=1))
+        try:
+            booking = self.book(at(9), at(10))
+            event = subscription.get(timeout=5)
+            self.assertEqual(event.data['changes'], [{'booking_id': booking.id, 'action': 'created'}])
+            self.assertTrue(event.data['booked'].startswith('01'))
+            # Another day of the venue is not this stream's
+            self.book(at(9, days=2), at(10, days=2))
+            self.assertIsNone(subscription.get(timeout=1))
+        finally:
+            broker.unsubscribe(subscription)
+
+    def test_event_committed_after_a_higher_id_still_arrives(self):
+        backend = CommitOrderBackend()
+        broker = Broker(backend)
+        subscription = broker.subscribe(1, last_event_id=0)
+        try:
+            backend.visible.append(Event(2, 1, None, {'n': 2}))
+            self.assertEqual(subscription.get(timeout=5).id, 2)
+            backend.visible.append(Event(1, 1, None, {'n': 1}))
+            self.assertEqual(subscription.get(timeout=5).id, 1)
+            self.assertIsNone(subscription.get(timeout=1))
+        finally:
+            broker.unsubscribe(subscription)
+
+
+# ==========================================
+# REQUEST PROFILING
+# ==========================================
+class RequestProfilingTests(BookingTestCase):
+    @override_settings(SLOW_REQUEST_THRESHOLD_MS=0)
+    def test_slow_log_has_the_view_queries_and_template_time(self):
+        self.client.force_login(self.user)
+        with self.assertLogs('accounts.slow_requests') as logs:
+            response = self.client.get('/dashboard/')
+        entry = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(entry['view'], 'dashboard_view')
+        self.assertGreater(entry['queries'], 0)
+        self.assertGreater(entry['template_ms'], 0)
+        self.assertIn(f'"{entry["queries"]} queries"', response['Server-Timing'])
+        # Nothing patched: the stock backend's templates render as they always did
+        self.assertEqual(DjangoBackendTemplate.render.__module__, 'django.template.backends.django')
+
+
+# ==========================================
+# RENDERED FRAGMENTS
+# ==========================================
+class BookingDetailFragmentTests(BookingTestCase):
+    def test_cached_fragments_follow_booking_and_venue_writes(self):
+        self.client.force_login(self.user)
+        self.assertContains(self.client.get('/dashboard/'), 'data-pending="0"')
+        booking = self.book(at(10), at(11), event_name='Seminar')
+        self.assertContains(self.client.get('/dashboard/'), 'data-pending="1"')
+
+        self.assertContains(self.client.get(f'/booking_detail/{booking.id}/'), 'Seminar')
+        booking.event_name = 'Workshop'
+        booking.save()
+        self.assertContains(self.client.get(f'/booking_detail/{booking.id}/'), 'Workshop')
+        self.venue.name = 'Aula'
+        self.venue.save()
+        self.assertContains(self.client.get(f'/booking_detail/{booking.id}/'), 'Aula')
+        self.assertContains(self.client.get('/venue_list/'), 'Aula')
+
+    def test_organizer_rename_shows_on_the_cached_detail_page(self):
+        cache.clear()
+        self.user.first_name = 'Alice'
+        self.user.save()
+        booking = self.book(at(10), at(11), event_name='Seminar')
+        self.client.force_login(self.user)
+        self.assertContains(self.client.get(f'/booking_detail/{booking.id}/'), 'Alice')
+        self.user.first_name = 'Alicia'
+        self.user.save()
+        self.assertContains(self.client.get(f'/booking_detail/{booking.id}/'), 'Alicia')
+
+
+# ==========================================
+# BENCHMARK COMMAND
+# ==========================================
+class BenchCommandTests(TransactionTestCase):
+    def test_percentile_is_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual([bench.percentile(values, pct) for pct in (50, 95, 99, 100)], [50, 95, 99, 100])
+        self.assertEqual(bench.percentile([7], 99), 7)
+        self.assertIsNone(bench.percentile([], 50))
+
+    def test_seeded_campus_runs_every_scenario(self):
+        command = bench.Command(stdout=io.StringIO(), stderr=io.StringIO())
+        command.rng = random.Random(1)
+        command.seed({'venues': 3, 'bookings': 60, 'users': 5, 'days': 10})
+
+        self.assertEqual(Booking.objects.count(), 60)
+        # Seeded bookings never overlap, and bulk_create's skipped receivers were made up for
+        live = Booking.objects.exclude(status='REJECTED')
+        self.assertEqual(SlotReservation.objects.values('booking').distinct().count(), live.count())
+        self.assertEqual(estimated_total(), 60)
+
+        for name in bench.SCENARIOS:
+            result = command.run_scenario(name, {'iterations': 3, 'cold': name == 'calendar_view'})
+            self.assertEqual(result['iterations'], 3, name)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        self.assertEqual(command.stderr.getvalue(), '')
+
+
+# ==========================================
+# CLASH INDEX
+# ==========================================
+class ClashIndexTests(BookingTestCase):
+    def test_index_follows_saves_and_deletes(self):
+        booking = self.book(at(10), at(11), event_name='Chess')
+        clash = booking_index.first_clash(self.venue.id, at(10, minute=30), at(12))
+        self.assertEqual((clash.booking_id, clash.event_name), (booking.id, 'Chess'))
+        # [start, end): back-to-back is not a clash
+        self.assertEqual(booking_index.clashes(self.venue.id, at(11), at(12)), [])
+        self.assertEqual(booking_index.clashes(self.venue.id, at(10), at(11), exclude_pk=booking.id), [])
+
+        booking.status = 'REJECTED'
+        booking.save()
+        self.assertEqual(booking_index.clashes(self.venue.id, at(10), at(11)), [])
+
+        booking.status = 'APPROVED'
+        booking.save()
+        booking.delete()
+        self.assertEqual(booking_index.clashes(self.venue.id, at(10), at(11)), [])
+
+    def test_moving_a_booking_updates_both_venues(self):
+        other = Venue.objects.create(name='Hall B', location='Block B', capacity=50)
+        booking = self.book(at(10), at(11))
+        self.assertTrue(booking_index.clashes(self.venue.id, at(10), at(11)))
+        booking.venue = other
+        booking.save()
+        self.assertEqual(booking_index.clashes(self.venue.id, at(10), at(11)), [])
+        self.assertEqual([i.booking_id for i in booking_index.clashes(other.id, at(10), at(11))], [booking.id])
+
+    def test_rolled_back_write_never_reaches_the_index(self):
+        booking_index.clashes(self.venue.id, at(10), at(11))  # load the venue
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.book(at(10), at(11))
+                raise RuntimeError
+        self.assertEqual(booking_index.clashes(self.venue.id, at(10), at(11)), [])
+
+    def test_clean_reports_the_clashing_booking(self):
+        self.book(at(10), at(11), event_name='Chess')
+        with self.assertRaisesMessage(ValidationError, 'Chess'):
+            Booking(user=self.user, venue=self.venue, start_time=at(10), end_time=at(12)).clean()
+
+
+# ==========================================
+# STATUS COUNTERS
+# ==========================================
+class CounterTests(BookingTestCase):
+    def assertCountersExact(self):
+        expected = count_bookings([self.user.id]).get(self.user.id, {'approved': 0, 'pending': 0, 'rejected': 0})
+        stats = get_counts(self.user)
+        self.assertEqual({field: getattr(stats, field) for field in expected}, expected)
+
+    def test_counters_follow_every_kind_of_write(self):
+        bookings = [self.book(at(hour), at(hour + 1)) for hour in range(9, 13)]
+        self.assertEqual(get_counts(self.user).pending, 4)
+
+        bookings[0].status = 'APPROVED'
+        bookings[0].save()
+        set_status(Booking.objects.filter(pk__in=[b.pk for b in bookings[1:3]]), 'REJECTED')
+        bookings[3].delete()
+        self.assertCountersExact()
+        stats = get_counts(self.user)
+        self.assertEqual((stats.approved, stats.pending, stats.rejected), (1, 0, 2))
+
+    def test_moving_a_booking_to_another_user(self):
+        bob = User.objects.create_user('bob', password='bob-password')
+        booking = self.book(at(10), at(11))
+        booking.user = bob
+        booking.save()
+        self.assertEqual(get_counts(self.user).pending, 0)
+        self.assertEqual(get_counts(bob).pending, 1)
+
+
+# ==========================================
+# SLOT RESERVATIONS
+# ==========================================
+class SlotReservationTests(BookingTestCase):
+    def test_adjacent_bookings_both_reserve(self):
+        first = self.book(at(10), at(11))
+        second = Booking(user=self.user, venue=self.venue, event_name='Next', start_time=at(11), end_time=at(12))
+        second.save_checked()
+        self.assertEqual(SlotReservation.objects.filter(booking=first).count(), 1)
+        self.assertEqual(SlotReservation.objects.filter(booking=second).count(), 1)
+
+    def test_clean_refuses_a_reserved_slot(self):
+        holder = self.book(at(10), at(11))
+        # Rejected behind the receivers' back: the index forgets it, its reservation stays
+        Booking.objects.filter(pk=holder.pk).update(status='REJECTED')
+        booking_index.clear()
+        booking = Booking(user=self.user, venue=self.venue, start_time=at(10), end_time=at(11))
+        with self.assertRaisesMessage(ValidationError, 'already reserved'):
+            booking.clean()
+
+    def test_unchecked_save_leaves_the_slot_with_its_holder(self):
+        holder = self.book(at(10), at(12))
+        # Straight to save(): no checks ran, and the write must not fail either
+        self.book(at(11), at(12))
+        self.assertEqual(Booking.objects.count(), 2)
+        self.assertEqual(set(SlotReservation.objects.values_list('booking_id', flat=True)), {holder.id})
+
+    def test_rejecting_frees_the_slots(self):
+        booking = self.book(at(10), at(11))
+        booking.status = 'REJECTED'
+        booking.save()
+        self.assertFalse(SlotReservation.objects.exists())
+        self.book(at(10), at(11))
+
+    def test_schedule_change_renumbers_before_commit(self):
+        self.book(at(10), at(11))
+        schedule = VenueSchedule.objects.get(pk=VenueSchedule.get_schedule().pk)
+        schedule.slot_duration_minutes = 30
+        with transaction.atomic():
+            schedule.save()
+            # 10:00-11:00 is slots 4 and 5 of a 30-minute grid opening at 8:00
+            self.assertEqual(sorted(SlotReservation.objects.values_list('slot_index', flat=True)), [4, 5])
+
+    def test_times_off_the_slot_grid_are_refused(self):
+        booking = Booking(user=self.user, venue=self.venue, start_time=at(10, minute=30), end_time=at(11))
+        with self.assertRaises(ValidationError) as raised:
+            booking.validate_times()
+        self.assertIn('start_time', raised.exception.message_dict)
+
+    def test_off_grid_bookings_made_before_the_grid_stay_editable(self):
+        legacy = self.book(at(10, minute=30), at(11, minute=30))
+        legacy = Booking.objects.get(pk=legacy.pk)
+        legacy.description = 'Moved upstairs'
+        legacy.full_clean()
+        legacy.end_time = at(11, minute=45)
+        with self.assertRaises(ValidationError):
+            legacy.full_clean()
+
+
+# ==========================================
+# CALENDAR API CONDITIONAL GET
+# ==========================================
+class CalendarETagTests(BookingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        day = timezone.localdate() + timedelta(days=1)
+        self.month = {'month': f'{day.year}-{day.month}'}
+
+    def test_unchanged_month_is_a_304_until_a_booking_changes(self):
+        self.book(at(10), at(11), event_name='Chess')
+        response = self.client.get('/api/calendar/', self.month)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('Chess', response.content.decode())
+
+        response = self.client.get('/api/calendar/', self.month, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        self.book(at(12), at(13), event_name='Debate')
+        response = self.client.get('/api/calendar/', self.month, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('Debate', response.content.decode())
+
+
+# ==========================================
+# KEYSET PAGINATION
+# ==========================================
+class KeysetPaginationTests(BookingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.bookings = [self.book(at(8 + i % 12, days=1 + i // 12), at(9 + i % 12, days=1 + i // 12)) for i in range(25)]
+        # Ties on created_at are broken by id
+        Booking.objects.filter(pk__in=[b.pk for b in self.bookings[5:15]]).update(created_at=self.bookings[5].created_at)
+        self.expected = list(Booking.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def test_walking_forwards_and_back_visits_every_row_once(self):
+        pages = [keyset_page(Booking.objects.all(), per_page=10)]
+        while pages[-1].has_next:
+            pages.append(keyset_page(Booking.objects.all(), pages[-1].next_cursor, per_page=10))
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual([b.id for page in pages for b in page], self.expected)
+        self.assertFalse(pages[0].has_previous)
+
+        back = keyset_page(Booking.objects.all(), pages[2].prev_cursor, per_page=10)
+        self.assertEqual([b.id for b in back], [b.id for b in pages[1]])
+        self.assertTrue(back.has_next and back.has_previous)
+
+    def test_cursor_round_trip_and_bad_cursors(self):
+        booking = self.bookings[0]
+        cursor = encode_cursor(booking.created_at, booking.pk, 'n')
+        self.assertEqual(decode_cursor(cursor), ('n', booking.created_at, booking.pk))
+        for bad in ('', 'garbage', encode_cursor(booking.created_at, booking.pk, 'x'), '!!!'):
+            self.assertIsNone(decode_cursor(bad))
+        first = keyset_page(Booking.objects.all(), 'garbage', per_page=10)
+        self.assertEqual([b.id for b in first], self.expected[:10])
+
+
+# ==========================================
+# AVAILABILITY
+# ==========================================
+class AvailabilityTests(BookingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        self.day = timezone.localdate() + timedelta(days=1)
+
+    def test_day_marks_every_slot_a_booking_touches(self):
+        self.book(at(10, minute=30), at(11, minute=30))  # made before the slot grid
+        self.book(at(14), at(15), status='REJECTED')
+        data = self.client.get('/api/get_availability/', {'venue_id': self.venue.id, 'date': str(self.day)}).json()
+        self.assertEqual([slot['start'] for slot in data['booked_slots']], ['10:00', '11:00'])
+        self.assertIn('14:00', [slot['start'] for slot in data['available_slots']])
+
+    def test_grid_over_venues_and_days_follows_writes(self):
+        other = Venue.objects.create(name='Hall B', location='Block B', capacity=50)
+        self.book(at(8), at(10))
+        params = {'venue_ids': f'{self.venue.id},{other.id}', 'from': str(self.day), 'to': str(self.day + timedelta(days=2))}
+
+        def grid():
+            venues = self.client.get('/api/get_availability/', params).json()['venues']
+            return {venue['id']: venue['days'] for venue in venues}
+
+        days = grid()
+        self.assertEqual(len(days[other.id]), 3)
+        self.assertTrue(days[self.venue.id][str(self.day)]['booked'].startswith('110'))
+        self.assertEqual(days[other.id][str(self.day)]['booked'].count('1'), 0)
+
+        # A cached grid still sees the next write
+        self.book(at(9, days=2), at(10, days=2), venue=other)
+        later = grid()[other.id][str(self.day + timedelta(days=1))]
+        self.assertTrue(later['booked'].startswith('010'))
+        self.assertEqual(later['free_count'], len(later['booked']) - 1)
+
+    def test_bad_ranges_are_refused(self):
+        response = self.client.get('/api/get_availability/', {'from': str(self.day), 'to': str(self.day - timedelta(days=1))})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/get_availability/', {'venue_ids': '1,x', 'from': str(self.day)})
+        self.assertEqual(response.status_code, 400)
+
+
+# ==========================================
+# BACKGROUND JOBS AND QR PASSES
+# ==========================================
+class BackgroundJobTests(BookingTestCase):
+    def setUp(self):
+        super().setUp()
+        use_temporary_media(self)
+
+    def test_approval_queues_a_pass_the_worker_renders(self):
+        booking = self.book(at(10), at(11))
+        self.assertFalse(BackgroundJob.objects.exists())
+        booking.status = 'APPROVED'
+        booking.save()
+        self.assertEqual(BackgroundJob.objects.get().kind, 'qr_pass')
+
+        self.assertEqual(run_batch(workers=1), 1)
+        self.assertEqual(BackgroundJob.objects.get().status, 'DONE')
+        digest = pass_digest(pass_payload(booking), 'png', DEFAULT_PASS_SIZE)
+        self.assertTrue(default_storage.exists(pass_name(digest, 'png')))
+
+    def test_a_crashed_workers_job_is_taken_over_after_its_lease(self):
+        jobs.enqueue('reconcile_reservations', key='all')
+        claimed = jobs.claim_batch(10)
+        self.assertEqual(len(claimed), 1)
+        # Queued again while running: de-duplicated, and still leased
+        self.assertEqual(jobs.enqueue('reconcile_reservations', key='all'), 0)
+        self.assertEqual(jobs.claim_batch(10), [])
+
+        BackgroundJob.objects.update(claimed_at=timezone.now() - jobs.LEASE_TIMEOUT - timedelta(seconds=1))
+        self.assertEqual(run_batch(workers=1), 1)
+        job = BackgroundJob.objects.get()
+        self.assertEqual((job.status, job.attempts), ('DONE', 2))
+
+        BackgroundJob.objects.update(updated_at=timezone.now() - jobs.DONE_RETENTION - timedelta(seconds=1))
+        self.assertEqual(jobs.prune_jobs(), 1)
+
+
+# ==========================================
+# OCCUPANCY BOARD
+# ==========================================
+class OccupancyTests(BookingTestCase):
+    def test_board_has_each_venues_current_and_next_approved_booking(self):
+        now = timezone.now()
+        other = Venue.objects.create(name='Hall B', location='Block B', capacity=50)
+        self.book(now - timedelta(minutes=5), now + timedelta(minutes=30), status='APPROVED', event_name='Now')
+        self.book(now + timedelta(hours=1), now + timedelta(hours=2), status='APPROVED', event_name='Later')
+        self.book(now - timedelta(minutes=5), now + timedelta(minutes=30), venue=other, event_name='Pending')
+
+        board, valid_until = build_snapshot(now)
+        venues = {venue['id']: venue for venue in board['venues']}
+        hall = venues[self.venue.id]
+        self.assertEqual((hall['status'], hall['current']['event_name'], hall['next']['event_name']), ('occupied', 'Now', 'Later'))
+        self.assertEqual((venues[other.id]['status'], venues[other.id]['next']), ('available', None))
+        self.assertEqual(valid_until, now + timedelta(minutes=30))
+
+    def test_cached_board_follows_booking_writes(self):
+        now = timezone.now()
+        self.assertEqual(get_snapshot()['venues'][0]['status'], 'available')
+        self.book(now - timedelta(minutes=5), now + timedelta(minutes=30), status='APPROVED')
+        self.assertEqual(get_snapshot()['venues'][0]['status'], 'occupied')
+
+    def test_venue_admin_status_column_costs_no_query_per_row(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin-password')
+        self.client.force_login(admin)
+        now = timezone.now()
+        self.book(now - timedelta(minutes=5), now + timedelta(minutes=30), status='APPROVED')
+
+        def changelist_queries():
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.get('/admin/accounts/venue/')
+            self.assertContains(response, 'Booked', count=1)
+            return len(captured.captured_queries)
+
+        few = changelist_queries()
+        Venue.objects.bulk_create([Venue(name=f'Room {i}', location='Block C', capacity=20) for i in range(10)])
+        self.assertEqual(changelist_queries(), few)
+
+
+# ==========================================
+# CAMPUSBOT VENUE MATCHER
+# ==========================================
+class VenueMatcherTests(BookingTestCase):
+    def test_longest_whole_word_match_wins(self):
+        matcher = VenueMatcher([
+            (1, 'Lab', 'Block B'),
+            (2, 'Lab 2', 'Block B'),
+            (3, 'Block B', 'Annex'),
+        ])
+        self.assertEqual(matcher.best_match('is the LAB free?'), ('lab', 'name', [1]))
+        self.assertEqual(matcher.best_match('is lab 2 free'), ('lab 2', 'name', [2]))
+        self.assertIsNone(matcher.best_match('print a label'))
+        self.assertIsNone(matcher.best_match('collaborate'))
+        # Same text as a name and a location: the name wins
+        self.assertEqual(matcher.best_match('anything in block b?'), ('block b', 'name', [3]))
+        self.assertEqual(matcher.best_match('the annex'), ('annex', 'location', [3]))
+
+    def test_matcher_is_rebuilt_only_after_a_venue_write(self):
+        matcher = get_matcher()
+        with self.assertNumQueries(0):
+            self.assertIs(get_matcher(), matcher)
+        self.assertIsNone(matcher.best_match('zeta lab status'))
+        Venue.objects.create(name='Zeta Lab', location='Library', capacity=10)
+        self.assertEqual(get_matcher().best_match('zeta lab status')[0], 'zeta lab')
+
+
+# ==========================================
+# VENUE SEARCH
+# ==========================================
+class VenueSearchTests(BookingTestCase):
+    def setUp(self):
+        super().setUp()
+        Venue.objects.create(name='Projection Room', location='Block A', capacity=10, equipment='Screen')
+        Venue.objects.create(name='Lab', location='Block B', capacity=30, equipment='Projector, Wifi')
+        Venue.objects.bulk_create([Venue(name='Aula', location='Library', capacity=100, equipment='Mic')])
+
+    def names(self, query, **filters):
+        return [venue.name for venue in venue_search.search_venues(query, **filters)]
+
+    def test_prefix_search_ranks_names_first_and_follows_writes(self):
+        self.assertTrue(venue_search.fts_enabled())
+        with self.assertNumQueries(1):
+            self.assertEqual(self.names('proj'), ['Projection Room', 'Lab'])
+        self.assertEqual(self.names('proj', capacity='medium'), ['Lab'])
+        # Rows written with bulk_create are indexed too
+        self.assertEqual(self.names('mic'), ['Aula'])
+
+        aula = Venue.objects.get(name='Aula')
+        aula.equipment = 'Whiteboard'
+        aula.save()
+        self.assertEqual(self.names('mic'), [])
+        aula.delete()
+        self.assertEqual(self.names('white'), [])
+
+    def test_substrings_are_searched_when_no_prefix_matches(self):
+        venue_search.fts_enabled()  # introspected once per connection
+        with self.assertNumQueries(2):
+            self.assertEqual(self.names('jector'), ['Lab'])
+        with self.assertNumQueries(1):
+            self.assertEqual(self.names('lab'), ['Lab'])
+
+    def test_search_without_fts5_falls_back_to_substrings(self):
+        with mock.patch.dict(venue_search._fts_available, {connection.alias: False}):
+            self.assertEqual(self.names('proj'), ['Projection Room', 'Lab'])
+
+    def test_type_ahead_api(self):
+        self.client.force_login(self.user)
+        results = self.client.get('/api/venues/search/', {'q': 'wifi'}).json()['results']
+        self.assertEqual([(venue['name'], venue['equipment']) for venue in results], [('Lab', 'Projector, Wifi')])
+        self.assertEqual(len(self.client.get('/api/venues/search/', {'q': 'block', 'limit': 2}).json()['results']), 2)
+        self.assertEqual(self.client.get('/api/venues/search/', {'q': 'lab', 'limit': 'x'}).status_code, 400)
+
+
+# ==========================================
+# IMPORT / EXPORT
+# ==========================================
+class TransferRoundTripTests(BookingTestCase):
+    @staticmethod
+    def snapshot():
+        return sorted(Booking.objects.values_list('user__username', 'venue__name', 'event_name', 'start_time', 'end_time', 'status'))
+
+    def test_exported_bookings_import_back_unchanged(self):
+        other = Venue.objects.create(name='Lab, "North"', location='Block B', capacity=20)
+        self.book(at(10), at(11), event_name='Chess; club')
+        self.book(at(10), at(12), venue=other, status='APPROVED', event_name='Lab, "night"')
+        self.book(at(13), at(14), status='REJECTED', event_name='')
+        before = self.snapshot()
+
+        for fmt in ('csv', 'jsonl'):
+            with self.subTest(fmt=fmt):
+                exported = ''.join(stream_export('bookings', fmt))
+                Booking.objects.all().delete()
+                report = import_bookings(read_rows(io.StringIO(exported), fmt))
+                self.assertEqual((report.created, report.error_count), (3, 0), report.errors)
+                self.assertEqual(self.snapshot(), before)
+
+    def test_exported_venues_update_in_place(self):
+        exported = ''.join(stream_export('venues', 'csv'))
+        report = import_venues(read_rows(io.StringIO(exported.replace('Block A', 'Block C')), 'csv'))
+        self.assertEqual((report.created, report.updated, report.error_count), (0, 1, 0))
+        self.assertEqual(Venue.objects.get().location, 'Block C')
+
+    def test_bad_rows_are_reported_not_imported(self):
+        rows = [
+            json.dumps({'user': 'alice', 'venue': 'Hall A', 'start_time': at(10).isoformat(), 'end_time': at(11).isoformat()}),
+            json.dumps({'user': 'alice', 'venue': 'Hall A', 'start_time': at(10).isoformat(), 'end_time': at(11).isoformat()}),
+            json.dumps({'user': 'nobody', 'venue': 'Hall A', 'start_time': at(12).isoformat(), 'end_time': at(13).isoformat()}),
+            '{not json',
+        ]
+        report = import_bookings(read_rows(io.StringIO('\n'.join(rows)), 'jsonl'))
+        self.assertEqual((report.created, report.error_count), (1, 3))
+        self.assertEqual([line for line, _ in report.errors], [2, 3, 4])
+        self.assertEqual(Booking.objects.count(), 1)
+
+
+# ==========================================
+# ICS FEEDS
+# ==========================================
+class IcsFeedTests(BookingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.booking = self.book(at(10), at(11), status='APPROVED', event_name='Chess; club, ' + 'x' * 100)
+        self.book(at(12), at(13), event_name='Still pending')
+
+    def feed_url(self, kind, obj_id, token=None):
+        return reverse('ics_feed', args=[kind, obj_id, token or feed_token(kind, obj_id)])
+
+    def test_feed_lists_approved_bookings_as_folded_escaped_lines(self):
+        response = self.client.get(self.feed_url('venue', self.venue.id))
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        body = b''.join(response.streaming_content).decode()
+        self.assertIn('SUMMARY:Chess\\; club\\,', body)
+        self.assertNotIn('Still pending', body)
+        self.assertTrue(all(len(line.encode()) <= 75 for line in body.split('\r\n')))
+
+    def test_unchanged_feed_is_a_304_from_the_cache_alone(self):
+        url = self.feed_url('venue', self.venue.id)
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+        self.booking.event_name = 'Renamed'
+        self.booking.save()
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 200)
+
+        url = self.feed_url('user', self.user.id)
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+        self.booking.delete()
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_tokens_are_per_feed(self):
+        self.assertEqual(self.client.get(self.feed_url('user', self.user.id, 'not-the-token')).status_code, 404)
+        # The token of user N does not open venue N
+        self.assertEqual(self.client.get(self.feed_url('venue', self.venue.id, feed_token('user', self.venue.id))).status_code, 404)
+
+
+# ==========================================
+# ASYNC VIEWS
+# ==========================================
+class AsyncViewTests(BookingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.book(at(9), at(10), status='APPROVED')
+        self.day = timezone.localdate() + timedelta(days=1)
+        self.async_client = AsyncClient()
+
+    async def test_availability_endpoints_under_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        window = {'venue_id': self.venue.id, 'start_time': f'{self.day} 09:30', 'end_time': f'{self.day} 10:30'}
+        response = await self.async_client.get('/check_availability/', window)
+        self.assertEqual(response.json()['status'], 'unavailable')
+        window.update(start_time=f'{self.day} 10:00', end_time=f'{self.day} 11:00')
+        response = await self.async_client.get('/check_availability/', window)
+        self.assertEqual(response.json()['status'], 'available')
+
+        response = await self.async_client.get('/api/get_availability/', {'venue_id': self.venue.id, 'date': str(self.day)})
+        self.assertEqual([slot['start'] for slot in response.json()['booked_slots']], ['09:00'])
+        # The async ORM's queries are counted too, not just the sync views'
+        self.assertNotIn('"0 queries"', response['Server-Timing'])
+
+        month = {'month': f'{self.day.year}-{self.day.month}'}
+        etag = (await self.async_client.get('/api/calendar/', month))['ETag']
+        response = await self.async_client.get('/api/calendar/', month, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_campusbot_under_asgi(self):
+        response = await self.async_client.post('/ai-chat/', json.dumps({'message': 'is hall a free?'}), content_type='application/json')
+        self.assertIn('Hall A', response.json()['response'])
+
+
+# ==========================================
+# QR PASS URLS
+# ==========================================
+class PassUrlTests(BookingTestCase):
+    def setUp(self):
+        super().setUp()
+        use_temporary_media(self)
+        self.booking = self.book(at(10), at(11), status='APPROVED')
+        self.client.force_login(self.user)
+
+    def test_pass_file_is_immutable_under_its_digest(self):
+        response = self.client.get(f'/booking_pass/{self.booking.id}.png', {'size': 150})
+        self.assertRedirects(response, pass_url(self.booking, 'png', 160), fetch_redirect_response=False)
+
+        response = self.client.get(pass_url(self.booking, 'png', 160))
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn('immutable', response['Cache-Control'])
+        again = self.client.get(pass_url(self.booking, 'png', 160), headers={'If-None-Match': response['ETag']})
+        self.assertEqual(again.status_code, 304)
+
+        self.assertEqual(self.client.get(pass_url(self.booking, 'svg'))['Content-Type'], 'image/svg+xml')
+        download = self.client.get(pass_url(self.booking, 'png', 640) + '?download=1')
+        self.assertIn('attachment', download['Content-Disposition'])
+        # Sizes other than PASS_SIZES are not rendered
+        self.assertEqual(self.client.get(f'/booking_pass/{self.booking.id}/100/{"a" * 40}.png').status_code, 404)
+
+    def test_only_edits_to_the_encoded_fields_change_the_url(self):
+        old = pass_url(self.booking)
+        self.booking.description = 'Bring a laptop'
+        self.booking.save()
+        self.assertEqual(pass_url(self.booking), old)
+
+        self.booking.event_name = 'Renamed'
+        self.booking.save()
+        self.assertNotEqual(pass_url(self.booking), old)
+        self.assertRedirects(self.client.get(old), pass_url(self.booking), fetch_redirect_response=False)
+
+    def test_other_users_cannot_fetch_the_pass(self):
+        User.objects.create_user('eve', password='eve-password')
+        self.client.login(username='eve', password='eve-password')
+        self.assertEqual(self.client.get(pass_url(self.booking)).status_code, 404)
+
+
+# ==========================================
+# BOOKING DOCUMENTS
+# ==========================================
+PDF = b'%PDF-1.4\n' + bytes(range(256)) * 400
+
+
+class DocumentTests(BookingTestCase):
+    def setUp(self):
+        super().setUp()
+        use_temporary_media(self)
+        self.client.force_login(self.user)
+
+    def upload(self, name, content, days=2):
+        day = timezone.localdate() + timedelta(days=days)
+        return self.client.post('/create_booking/', {
+            'purpose': 'STUDY', 'event_name': 'Study group', 'venue': self.venue.id,
+            'start_time': f'{day} 10:00', 'end_time': f'{day} 11:00',
+            'document': SimpleUploadedFile(name, content),
+        })
+
+    def stored_files(self):
+        return [name for _, _, names in os.walk(settings.MEDIA_ROOT) for name in names]
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range('bytes=0-', 10), (0, 9))
+        self.assertEqual(parse_range('bytes=2-4', 10), (2, 4))
+        self.assertEqual(parse_range('bytes=5-100', 10), (5, 9))
+        self.assertEqual(parse_range('bytes=-3', 10), (7, 9))
+        self.assertEqual(parse_range('bytes=-20', 10), (0, 9))
+        self.assertEqual(parse_range('bytes=10-', 10), 'unsatisfiable')
+        self.assertEqual(parse_range('bytes=-0', 10), 'unsatisfiable')
+        for whole_file in (None, '', 'items=0-1', 'bytes=0-1,3-4', 'bytes=4-2', 'bytes=a-b'):
+            self.assertIsNone(parse_range(whole_file, 10), whole_file)
+
+    def test_uploads_are_sniffed_and_size_limited(self):
+        self.assertContains(self.upload('setup.exe', b'MZ' + b'x' * 100), 'Only PDF')
+        self.assertContains(self.upload('notes.pdf', b'<html>' + b'x' * 100), 'do not match')
+        self.assertContains(self.upload('notes.pdf', b'%P'), 'do not match')
+        self.assertContains(self.upload('big.pdf', b'%PDF-' + b'x' * DOCUMENT_MAX_SIZE), 'at most 10 MB')
+        self.assertFalse(Booking.objects.exists())
+        self.assertEqual(self.stored_files(), [])
+
+    def test_same_file_is_stored_once(self):
+        self.assertEqual(self.upload('a.pdf', PDF).status_code, 302)
+        self.assertEqual(self.upload('b.PDF', PDF, days=3).status_code, 302)
+        first, second = Booking.objects.order_by('id')
+        self.assertEqual(first.document.name, second.document.name)
+        self.assertEqual(len(self.stored_files()), 1)
+
+    def test_ranged_download(self):
+        self.upload('a.pdf', PDF)
+        url = document_url(Booking.objects.get())
+
+        response = self.client.get(url)
+        self.assertEqual((response['Content-Type'], response['Accept-Ranges']), ('application/pdf', 'bytes'))
+        self.assertEqual(b''.join(response.streaming_content), PDF)
+
+        response = self.client.get(url, headers={'Range': 'bytes=5-14'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 5-14/{len(PDF)}')
+        self.assertEqual(b''.join(response.streaming_content), PDF[5:15])
+        self.assertEqual(self.client.get(url, headers={'Range': f'bytes={len(PDF)}-'}).status_code, 416)
+        # A stale If-Range gets the whole (new) file
+        response = self.client.get(url, headers={'Range': 'bytes=0-3', 'If-Range': '"stale"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': response['ETag']}).status_code, 304)
 
-# Create your tests here.
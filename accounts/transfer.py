@@ -0,0 +1,396 @@
+import csv
+import json
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .booking_index import ACTIVE_STATUSES, Interval, VenueIntervals
+from .bulk import create_bookings
+from .models import Booking, Venue, VenueSchedule
+from .reservations import RESERVED_MESSAGE, reservation_conflicts
+from .signals import venues_bulk_changed
+
+FORMATS = ('csv', 'jsonl')
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+# Rows read from the database per round trip while exporting
+EXPORT_CHUNK_SIZE = 2000
+
+# Rows validated and written together while importing
+IMPORT_CHUNK_SIZE = 2000
+
+# An import report keeps at most this many error lines (the count is always exact)
+MAX_REPORTED_ERRORS = 1000
+
+# Export columns: output name -> values_list() lookup
+VENUE_COLUMNS = {
+    'id': 'id',
+    'name': 'name',
+    'location': 'location',
+    'capacity': 'capacity',
+    'equipment': 'equipment',
+}
+
+BOOKING_COLUMNS = {
+    'id': 'id',
+    'user': 'user__username',
+    'venue_id': 'venue_id',
+    'venue': 'venue__name',
+    'event_name': 'event_name',
+    'purpose': 'purpose',
+    'description': 'description',
+    'addon_equipment': 'addon_equipment',
+    'start_time': 'start_time',
+    'end_time': 'end_time',
+    'status': 'status',
+    'series_id': 'series_id',
+    'created_at': 'created_at',
+}
+
+PURPOSES = dict(Booking.PURPOSE_CHOICES)
+STATUSES = dict(Booking.STATUS_CHOICES)
+EVENT_NAME_MAX_LENGTH = Booking._meta.get_field('event_name').max_length
+
+EXPORTS = {
+    'venues': (Venue, VENUE_COLUMNS),
+    'bookings': (Booking, BOOKING_COLUMNS),
+}
+
+
+# ==========================================
+# STREAMING EXPORT
+# ==========================================
+class _LineBuffer:
+    """File-like target for csv.writer that hands back each line instead of storing it"""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(kind, queryset=None):
+    """Dicts of the export columns, read with iterator() so memory stays flat"""
+    model, columns = EXPORTS[kind]
+    queryset = model.objects.all() if queryset is None else queryset
+    names = list(columns)
+    rows = queryset.order_by('pk').values_list(*columns.values())
+    for row in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield dict(zip(names, row))
+
+
+def _cell(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def stream_export(kind, fmt='csv', queryset=None):
+    """The export as a generator of text lines - for StreamingHttpResponse or a file"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}; expected one of {', '.join(FORMATS)}")
+    columns = list(EXPORTS[kind][1])
+
+    if fmt == 'csv':
+        writer = csv.writer(_LineBuffer())
+        yield writer.writerow(columns)
+        for row in export_rows(kind, queryset):
+            yield writer.writerow([_cell(row[name]) for name in columns])
+    else:
+        for row in export_rows(kind, queryset):
+            yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+# ==========================================
+# CHUNKED IMPORT
+# ==========================================
+class ImportReport:
+    """What an import did: rows created / updated and the rows it refused, with reasons"""
+
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.created = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []  # [(line number, message)]
+
+    def error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    @property
+    def ok(self):
+        return self.error_count == 0
+
+
+def read_rows(stream, fmt='csv'):
+    """
+    (line number, row dict or None, parse error or None) for every record of
+    a CSV (with header) or JSON Lines text stream. Blank JSONL lines are skipped.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row, None
+    elif fmt == 'jsonl':
+        for line_no, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_no, None, f"Invalid JSON: {e}"
+                continue
+            if not isinstance(row, dict):
+                yield line_no, None, "Expected a JSON object."
+                continue
+            yield line_no, row, None
+    else:
+        raise ValueError(f"Unknown format {fmt!r}; expected one of {', '.join(FORMATS)}")
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _text(row, name, default=''):
+    value = row.get(name)
+    return default if value is None else str(value).strip()
+
+
+def _message(error):
+    if hasattr(error, 'message_dict'):
+        return '; '.join(f"{field}: {' '.join(msgs)}" for field, msgs in error.message_dict.items())
+    return ' '.join(error.messages)
+
+
+# --- Venues ---
+def import_venues(rows, dry_run=False, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Create venues from (line, row, error) records; a row whose name matches an
+    existing venue updates it instead. Each chunk is one SELECT plus one
+    bulk_create / bulk_update.
+    """
+    report = ImportReport(dry_run=dry_run)
+    for chunk in chunked(rows, chunk_size):
+        parsed = []
+        for line, row, error in chunk:
+            if error:
+                report.error(line, error)
+                continue
+            venue = Venue(
+                name=_text(row, 'name'),
+                location=_text(row, 'location'),
+                capacity=_text(row, 'capacity') or None,
+                equipment=_text(row, 'equipment'),
+            )
+            try:
+                venue.full_clean(validate_unique=False)
+            except ValidationError as e:
+                report.error(line, _message(e))
+                continue
+            parsed.append(venue)
+
+        existing = {
+            venue.name: venue
+            for venue in Venue.objects.filter(name__in={venue.name for venue in parsed})
+        }
+        to_create, to_update = [], {}
+        for venue in parsed:
+            current = existing.get(venue.name)
+            if current is None:
+                to_create.append(venue)
+                # A later row with the same name updates this one
+                existing[venue.name] = venue
+            else:
+                current.location, current.capacity, current.equipment = venue.location, venue.capacity, venue.equipment
+                if current.pk is not None:
+                    to_update[current.pk] = current
+
+        if not dry_run:
+            with transaction.atomic():
+                Venue.objects.bulk_create(to_create)
+                Venue.objects.bulk_update(list(to_update.values()), ['location', 'capacity', 'equipment'])
+        report.created += len(to_create)
+        report.updated += len(to_update)
+
+    if not dry_run and (report.created or report.updated):
+        venues_bulk_changed.send(sender=Venue)
+    return report
+
+
+# --- Bookings ---
+class _BookingResolver:
+    """Username / venue lookups for an import, one query per chunk for unseen users"""
+
+    def __init__(self):
+        self.tz = timezone.get_current_timezone()
+        self.users = {}
+        self.venue_ids = set()
+        self.venue_names = {}
+        for pk, name in Venue.objects.values_list('pk', 'name'):
+            self.venue_ids.add(pk)
+            self.venue_names.setdefault(name, pk)
+
+    def load_users(self, rows):
+        wanted = {_text(row, 'user') for _, row, error in rows if row} - set(self.users) - {''}
+        if wanted:
+            self.users.update(User.objects.filter(username__in=wanted).values_list('username', 'pk'))
+
+    def venue_id(self, row):
+        raw = _text(row, 'venue_id')
+        if raw:
+            return int(raw) if raw.isdigit() and int(raw) in self.venue_ids else None
+        return self.venue_names.get(_text(row, 'venue'))
+
+
+def _parse_time(value, tz):
+    moment = parse_datetime(value) if value else None
+    if moment is not None and timezone.is_naive(moment):
+        moment = timezone.make_aware(moment, tz)
+    return moment
+
+
+def _build_booking(row, resolver):
+    """Unsaved Booking for an import row; ValidationError says what is wrong with it"""
+    username = _text(row, 'user')
+    user_id = resolver.users.get(username)
+    if user_id is None:
+        raise ValidationError(f"Unknown user {username!r}.")
+    venue_id = resolver.venue_id(row)
+    if venue_id is None:
+        raise ValidationError(f"Unknown venue {_text(row, 'venue_id') or _text(row, 'venue')!r}.")
+
+    try:
+        start_time = _parse_time(_text(row, 'start_time'), resolver.tz)
+        end_time = _parse_time(_text(row, 'end_time'), resolver.tz)
+    except ValueError:
+        start_time = end_time = None
+    if start_time is None or end_time is None:
+        raise ValidationError("start_time and end_time must be ISO 8601 date-times.")
+
+    # The field checks of clean_fields() that can fail here, minus its per-row overhead
+    purpose = _text(row, 'purpose') or 'STUDY'
+    if purpose not in PURPOSES:
+        raise ValidationError(f"Unknown purpose {purpose!r}.")
+    status = _text(row, 'status') or 'PENDING'
+    if status not in STATUSES:
+        raise ValidationError(f"Unknown status {status!r}.")
+    event_name = _text(row, 'event_name')
+    if len(event_name) > EVENT_NAME_MAX_LENGTH:
+        raise ValidationError(f"event_name is longer than {EVENT_NAME_MAX_LENGTH} characters.")
+
+    return Booking(
+        user_id=user_id,
+        venue_id=venue_id,
+        event_name=event_name,
+        purpose=purpose,
+        description=_text(row, 'description'),
+        addon_equipment=_text(row, 'addon_equipment') or None,
+        start_time=start_time,
+        end_time=end_time,
+        status=status,
+    )
+
+
+def _existing_intervals(bookings):
+    """
+    {venue_id: VenueIntervals} of the active bookings already stored around
+    ``bookings`` - ONE query per chunk, bounded per venue by the chunk's own time span.
+    """
+    spans = {}
+    for booking in bookings:
+        low, high = spans.get(booking.venue_id, (booking.start_time, booking.end_time))
+        spans[booking.venue_id] = (min(low, booking.start_time), max(high, booking.end_time))
+    if not spans:
+        return {}
+
+    window = Q()
+    for venue_id, (low, high) in spans.items():
+        window |= Q(venue_id=venue_id, start_time__lt=high, end_time__gt=low)
+    rows = Booking.objects.filter(window, status__in=ACTIVE_STATUSES).order_by().values_list(
+        'venue_id', 'start_time', 'end_time', 'id', 'event_name'
+    )
+
+    grouped = {venue_id: [] for venue_id in spans}
+    for venue_id, *interval in rows:
+        grouped[venue_id].append(Interval(*interval))
+    return {venue_id: VenueIntervals(intervals, version=None) for venue_id, intervals in grouped.items()}
+
+
+def _first_clash(indexes, booking):
+    for intervals in indexes:
+        found = intervals.overlapping(booking.start_time, booking.end_time) if intervals else None
+        if found:
+            return found[0]
+    return None
+
+
+def import_bookings(rows, dry_run=False, allow_past=False, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Validate and insert bookings from (line, row, error) records, chunk by
+    chunk: field and time checks in memory, clashes against the database with
+    one range query per chunk and against earlier rows of the same file, taken
+    slot reservations with one more, then one bulk_create per chunk. Rows that fail are reported and skipped.
+    """
+    report = ImportReport(dry_run=dry_run)
+    resolver = _BookingResolver()
+    schedule = VenueSchedule.get_schedule()
+    # Rows accepted so far, per venue. Written chunks are in the database too,
+    # so outside a dry run only the current chunk has to be remembered.
+    accepted = {}
+
+    for chunk in chunked(rows, chunk_size):
+        resolver.load_users(chunk)
+        if not dry_run:
+            accepted = {}
+
+        parsed = []
+        for line, row, error in chunk:
+            if error:
+                report.error(line, error)
+                continue
+            try:
+                booking = _build_booking(row, resolver)
+                booking.validate_times(schedule, allow_past=allow_past)
+            except ValidationError as e:
+                report.error(line, _message(e))
+                continue
+            parsed.append((line, booking))
+
+        existing = _existing_intervals([booking for _, booking in parsed if booking.status in ACTIVE_STATUSES])
+        valid = []
+        for line, booking in parsed:
+            if booking.status in ACTIVE_STATUSES:
+                clash = _first_clash((existing.get(booking.venue_id), accepted.get(booking.venue_id)), booking)
+                if clash:
+                    report.error(line, f"Time slot conflicts with existing booking: {clash.event_name or 'another booking'}")
+                    continue
+                accepted.setdefault(booking.venue_id, VenueIntervals([], version=None)).add(
+                    Interval(booking.start_time, booking.end_time, None, booking.event_name)
+                )
+            valid.append((line, booking))
+
+        # Slots held by bookings the interval check can't see (e.g. older off-grid ones)
+        taken = {id(booking) for booking in reservation_conflicts([booking for _, booking in valid])}
+        for line, booking in valid:
+            if id(booking) in taken:
+                report.error(line, RESERVED_MESSAGE)
+        valid = [(line, booking) for line, booking in valid if id(booking) not in taken]
+
+        if not dry_run:
+            report.created += len(create_bookings([booking for _, booking in valid]))
+        else:
+            report.created += len(valid)
+
+    report.errors.sort()
+    return report
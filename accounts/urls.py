@@ -12,6 +12,7 @@ urlpatterns = [
     path('dashboard/', views.dashboard_view, name='dashboard'),
     path('venue_list/', views.venue_list_view, name='venue_list'),
     path('calendar/', views.calendar_view, name='calendar'),
+    path('api/calendar/', views.calendar_json, name='calendar_json'),
 
     # --- Booking ---
     path('create_booking/', views.create_booking_view, name='create_booking'),
@@ -20,14 +21,34 @@ urlpatterns = [
     # NEW PATH: This handles the link from the Calendar
     path('booking_detail/<int:booking_id>/', views.booking_detail_view, name='booking_detail'),
 
+    # --- QR entry passes (file URLs are content-addressed and cached for good) ---
+    path('booking_pass/<int:booking_id>.<str:fmt>', views.booking_pass, name='booking_pass'),
+    path('booking_pass/<int:booking_id>/<int:size>/<str:digest>.<str:fmt>', views.booking_pass_file, name='booking_pass_file'),
+
+    # --- Booking documents (content-addressed, Range requests supported) ---
+    path('booking_document/<int:booking_id>/<str:digest>/', views.booking_document, name='booking_document'),
+
+    # --- Calendar subscriptions (.ics, token in the URL) ---
+    path('feeds/<str:kind>/<int:obj_id>/<str:token>.ics', views.ics_feed, name='ics_feed'),
+
     # --- API Endpoints ---
     path('api/get_availability/', views.get_availability_json, name='get_availability'),
+    path('api/occupancy/', views.occupancy_board_json, name='occupancy_board'),
+    path('api/bookings/', views.bookings_json, name='bookings_json'),
+    path('api/venues/search/', views.venue_search_json, name='venue_search'),
+    path('api/venues/recommend/', views.recommend_venues_json, name='recommend_venues'),
+
+    # --- Live availability (server-sent events) ---
+    path('events/venues/<int:venue_id>/', views.availability_events, name='venue_events'),
+    path('events/venues/<int:venue_id>/<str:day>/', views.availability_events, name='venue_day_events'),
 
     # --- User Pages ---
     path('my_bookings/', views.my_bookings_view, name='my_bookings'),
     path('delete_booking/<int:booking_id>/', views.delete_booking_view, name='delete_booking'),
+    path('cancel_series/<int:series_id>/', views.cancel_series_view, name='cancel_series'),
     path('profile/', views.profile_view, name='profile'),
     path('check_availability/', views.check_availability, name='check_availability'),
+    path('check_availability/bulk/', views.check_availability_bulk, name='check_availability_bulk'),
     
     #--- AI Chat Integration ---
     path('ai-chat/', views.ai_chat_response, name='ai_chat'),
@@ -1,67 +1,132 @@
-from datetime import datetime, timedelta
-from calendar import HTMLCalendar
+import hashlib
+from datetime import datetime
+from collections import defaultdict
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.utils import timezone
 from .models import Booking
+from .caching import aget_versions, get_versions
+from .venue_matcher import VENUES_VERSION_NAME
 
-class Calendar(HTMLCalendar):
-    def __init__(self, year=None, month=None):
-        self.year = year
-        self.month = month
-        super(Calendar, self).__init__()
-
-    # 1. Format each day
-    def formatday(self, day, weekday):
-        # Filter events for this day (Approved/Pending only)
-        bookings = Booking.objects.filter(
-            start_time__year=self.year, 
-            start_time__month=self.month, 
-            start_time__day=day
-        ).exclude(status='REJECTED')
-
-        # --- NEW: GENERATE DATE STRING (YYYY-MM-DD) ---
-        # We need this to pass to the URL so the form knows which date to pick
-        current_date = f"{self.year}-{self.month:02d}-{day:02d}"
-        create_url = f"/create_booking/?date={current_date}"
-
-        d = ''
-        for event in bookings:
-            # Yellow clickable event box
-            d += f'''
-                <a href="/booking_detail/{event.id}/" style="text-decoration: none; display: block;">
-                    <div class="calendar-event">
-                        <span class="event-time">{event.start_time.strftime("%H:%M")}</span>
-                        <span class="event-title">{event.event_name}</span>
-                    </div>
-                </a>
-            '''
-
-        if day != 0:
-            # --- THE FIX IS HERE ---
-            # We wrap the day number {day} in a link to create_url
-            # We also add a small "+" icon to make it obvious
-            day_html = f'''
-                <div class="day-header">
-                    <a href="{create_url}" class="date-btn" title="Add Booking">
-                        {day} <i class="fas fa-plus-circle add-icon"></i>
-                    </a>
-                </div>
-            '''
-            return f"<td>{day_html}<div class='day-events'>{d}</div></td>"
-        
-        return '<td></td>'
-
-    # 2. Format a week
-    def formatweek(self, theweek):
-        week = ''
-        for d, weekday in theweek:
-            week += self.formatday(d, weekday)
-        return f'<tr> {week} </tr>'
-
-    # 3. Format the month
-    def formatmonth(self, withyear=True):
-        cal = f'<table border="0" cellpadding="0" cellspacing="0" class="calendar">\n'
-        cal += f'{self.formatmonthname(self.year, self.month, withyear=withyear)}\n'
-        cal += f'<tr class="week-headers"><th>Mon</th><th>Tue</th><th>Wed</th><th>Thu</th><th>Fri</th><th>Sat</th><th>Sun</th></tr>\n'
-        for week in self.monthdays2calendar(self.year, self.month):
-            cal += f'{self.formatweek(week)}\n'
-        cal += '</table>'
-        return cal
\ No newline at end of file
+# Month data is cached for a day; any booking write bumps the month version first
+CALENDAR_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def month_bounds(year, month):
+    """Return the aware [start, end) datetimes covering a calendar month"""
+    start = timezone.make_aware(datetime(year, month, 1))
+    if month == 12:
+        end = timezone.make_aware(datetime(year + 1, 1, 1))
+    else:
+        end = timezone.make_aware(datetime(year, month + 1, 1))
+    return start, end
+
+
+def calendar_version_name(year, month):
+    return f"calendar:{year}-{month:02d}"
+
+
+def month_bookings(year, month, venue_id=None):
+    """Bookings shown on the month's calendar (everything but REJECTED)"""
+    start, end = month_bounds(year, month)
+    bookings = Booking.objects.filter(
+        start_time__gte=start,
+        start_time__lt=end
+    ).exclude(status='REJECTED')
+    if venue_id:
+        bookings = bookings.filter(venue_id=venue_id)
+    return bookings
+
+
+# ==========================================
+# MONTH JSON (calendar API)
+# ==========================================
+def _month_version_names(year, month):
+    # Venue renames show up in the payload too, so their stamp counts as well
+    return calendar_version_name(year, month), VENUES_VERSION_NAME
+
+
+def _month_versions(year, month):
+    names = _month_version_names(year, month)
+    versions = get_versions(names)
+    return tuple(versions[name] for name in names)
+
+
+async def _amonth_versions(year, month):
+    names = _month_version_names(year, month)
+    versions = await aget_versions(names)
+    return tuple(versions[name] for name in names)
+
+
+def _etag_from_stamp(year, month, venue_id, stamp, venues_version):
+    latest = stamp['latest'].isoformat() if stamp['latest'] else ''
+    raw = f"{year}-{month:02d}:{venue_id or 'all'}:{stamp['count']}:{latest}:{venues_version}"
+    return f'"{hashlib.md5(raw.encode()).hexdigest()}"'
+
+
+def month_etag(year, month, venue_id=None):
+    """
+    Strong ETag of a month: the count and latest updated_at of its bookings.
+    Kept in the cache under the month version, so a revalidation that ends in
+    a 304 usually costs no query at all.
+    """
+    month_version, venues_version = _month_versions(year, month)
+    key = f"calendar:etag:{year}-{month:02d}:{venue_id or 'all'}:{month_version}:{venues_version}"
+    etag = cache.get(key)
+    if etag is None:
+        stamp = month_bookings(year, month, venue_id).order_by().aggregate(count=Count('id'), latest=Max('updated_at'))
+        etag = _etag_from_stamp(year, month, venue_id, stamp, venues_version)
+        cache.set(key, etag, CALENDAR_CACHE_TIMEOUT)
+    return etag
+
+
+async def amonth_etag(year, month, venue_id=None):
+    month_version, venues_version = await _amonth_versions(year, month)
+    key = f"calendar:etag:{year}-{month:02d}:{venue_id or 'all'}:{month_version}:{venues_version}"
+    etag = await cache.aget(key)
+    if etag is None:
+        stamp = await month_bookings(year, month, venue_id).order_by().aaggregate(count=Count('id'), latest=Max('updated_at'))
+        etag = _etag_from_stamp(year, month, venue_id, stamp, venues_version)
+        await cache.aset(key, etag, CALENDAR_CACHE_TIMEOUT)
+    return etag
+
+
+def _month_rows(year, month, venue_id):
+    return month_bookings(year, month, venue_id).order_by('start_time').values_list(
+        'id', 'start_time', 'event_name', 'venue__name'
+    )
+
+
+def _month_payload(year, month, venue_id, rows):
+    days = defaultdict(list)
+    for booking_id, start_time, event_name, venue_name in rows:
+        start_local = timezone.localtime(start_time)
+        days[start_local.day].append({
+            'id': booking_id,
+            'start': start_local.isoformat(),
+            'event_name': event_name,
+            'venue': venue_name,
+        })
+    return {'year': year, 'month': month, 'venue': venue_id, 'days': dict(days)}
+
+
+def month_data(year, month, venue_id=None):
+    """{'year', 'month', 'days': {day: [{id, start, event_name, venue}, ...]}} in ONE query (cached)"""
+    month_version, venues_version = _month_versions(year, month)
+    key = f"calendar:json:{year}-{month:02d}:{venue_id or 'all'}:{month_version}:{venues_version}"
+    data = cache.get(key)
+    if data is None:
+        data = _month_payload(year, month, venue_id, _month_rows(year, month, venue_id))
+        cache.set(key, data, CALENDAR_CACHE_TIMEOUT)
+    return data
+
+
+async def amonth_data(year, month, venue_id=None):
+    month_version, venues_version = await _amonth_versions(year, month)
+    key = f"calendar:json:{year}-{month:02d}:{venue_id or 'all'}:{month_version}:{venues_version}"
+    data = await cache.aget(key)
+    if data is None:
+        rows = [row async for row in _month_rows(year, month, venue_id)]
+        data = _month_payload(year, month, venue_id, rows)
+        await cache.aset(key, data, CALENDAR_CACHE_TIMEOUT)
+    return data
@@ -0,0 +1,131 @@
+import threading
+from collections import deque
+
+from .caching import aget_version, get_version
+
+# Bumped on every Venue save/delete (see signals.py)
+VENUES_VERSION_NAME = 'venues'
+
+
+class VenueMatcher:
+    """
+    Aho-Corasick automaton over lower-cased venue names and locations.
+
+    best_match() scans a message ONCE, whatever the number of venues, and
+    returns the longest name/location found in it as whole words ("lab" is
+    found in "is the lab free" but not in "label printer").
+    """
+
+    def __init__(self, venues):
+        # venues: iterable of (id, name, location)
+        self.names = {}
+        patterns = {}
+        for venue_id, name, location in venues:
+            self.names[venue_id] = name
+            for text, kind in ((name, 'name'), (location, 'location')):
+                text = (text or '').strip().lower()
+                if not text:
+                    continue
+                entry = patterns.setdefault((text, kind), [])
+                entry.append(venue_id)
+
+        # Trie: goto[state] = {char: next_state}; out[state] = patterns ending here
+        self.goto = [{}]
+        self.out = [[]]
+        for (text, kind), venue_ids in patterns.items():
+            state = 0
+            for char in text:
+                nxt = self.goto[state].get(char)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto.append({})
+                    self.out.append([])
+                    self.goto[state][char] = nxt
+                state = nxt
+            self.out[state].append((text, kind, venue_ids))
+
+        # Failure links, breadth-first; each state inherits the outputs of its fallback
+        self.fail = [0] * len(self.goto)
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self.goto[state].items():
+                queue.append(nxt)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[nxt] = self.goto[fallback].get(char, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def best_match(self, message):
+        """
+        Longest venue name or location contained in ``message`` (names win ties).
+        Returns (matched_text, kind, [venue_id, ...]) or None.
+        """
+        best = None
+        state = 0
+        text = message.lower()
+        for end, char in enumerate(text, 1):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for match in self.out[state]:
+                if not _on_word_boundaries(text, end - len(match[0]), end):
+                    continue
+                rank = (len(match[0]), match[1] == 'name')
+                if best is None or rank > best[0]:
+                    best = (rank, match)
+        return best[1] if best else None
+
+
+def _is_word_char(char):
+    return char.isalnum() or char == '_'
+
+
+def _on_word_boundaries(text, start, end):
+    """True unless text[start:end] cuts through a word at either end"""
+    if start > 0 and _is_word_char(text[start - 1]) and _is_word_char(text[start]):
+        return False
+    if end < len(text) and _is_word_char(text[end - 1]) and _is_word_char(text[end]):
+        return False
+    return True
+
+
+_lock = threading.Lock()
+_matcher = None  # (version, VenueMatcher)
+
+
+def _venue_rows():
+    from .models import Venue
+    return Venue.objects.order_by('name').values_list('id', 'name', 'location')
+
+
+def get_matcher():
+    """The process-wide matcher, rebuilt only after a Venue row changed"""
+    global _matcher
+
+    version = get_version(VENUES_VERSION_NAME)
+    current = _matcher
+    if current is not None and current[0] == version:
+        return current[1]
+
+    with _lock:
+        if _matcher is None or _matcher[0] != version:
+            _matcher = (version, VenueMatcher(_venue_rows()))
+        return _matcher[1]
+
+
+async def aget_matcher():
+    """get_matcher() for async views; the rows are read outside the lock"""
+    global _matcher
+
+    version = await aget_version(VENUES_VERSION_NAME)
+    current = _matcher
+    if current is not None and current[0] == version:
+        return current[1]
+
+    matcher = VenueMatcher([row async for row in _venue_rows()])
+    with _lock:
+        if _matcher is None or _matcher[0] != version:
+            _matcher = (version, matcher)
+        return _matcher[1]
@@ -0,0 +1,180 @@
+import re
+
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from .models import Venue
+
+# "small/medium/large" filters of the venue list: (min, max) capacity, inclusive
+CAPACITY_RANGES = {
+    'small': (None, 19),
+    'medium': (20, 50),
+    'large': (51, None),
+}
+
+# bm25() column weights: a hit in the name counts most, equipment least
+FTS_WEIGHTS = (10.0, 4.0, 2.0)
+
+FTS_TABLE = 'accounts_venue_fts'
+
+
+# ==========================================
+# SQLITE FTS5 INDEX
+# ==========================================
+# An external-content FTS5 table over accounts_venue. Triggers keep it in
+# sync on every INSERT / UPDATE / DELETE, including bulk_create and update().
+FTS_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, location, equipment,
+        content='accounts_venue', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON accounts_venue BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, location, equipment) VALUES (new.id, new.name, new.location, new.equipment);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON accounts_venue BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, location, equipment) VALUES ('delete', old.id, old.name, old.location, old.equipment);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE ON accounts_venue BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, location, equipment) VALUES ('delete', old.id, old.name, old.location, old.equipment);
+        INSERT INTO {FTS_TABLE}(rowid, name, location, equipment) VALUES (new.id, new.name, new.location, new.equipment);
+    END""",
+]
+
+FTS_DROP = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+_fts_available = {}  # connection alias -> bool
+
+
+def sqlite_has_fts5(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        compiled = cursor.fetchone()[0]
+        if compiled:
+            return True
+        # Some builds load FTS5 without advertising the compile option
+        try:
+            cursor.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+            cursor.execute("DROP TABLE temp.fts5_probe")
+            return True
+        except Exception:
+            return False
+
+
+def ensure_fts_index(conn=connection):
+    """
+    Create the FTS table and its triggers if missing, then rebuild it from
+    accounts_venue. Safe to repeat: Django re-creates the table on some SQLite
+    schema changes, which drops the triggers (see the post_migrate receiver).
+    """
+    if conn.vendor != 'sqlite' or not sqlite_has_fts5(conn):
+        return False
+    with conn.cursor() as cursor:
+        for statement in FTS_SCHEMA:
+            cursor.execute(statement)
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    _fts_available[conn.alias] = True
+    return True
+
+
+def drop_fts_index(conn=connection):
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        for statement in FTS_DROP:
+            cursor.execute(statement)
+    _fts_available.pop(conn.alias, None)
+
+
+def fts_enabled(conn=connection):
+    """True when the FTS5 table exists on this database (checked once per process)"""
+    if conn.alias not in _fts_available:
+        _fts_available[conn.alias] = conn.vendor == 'sqlite' and FTS_TABLE in conn.introspection.table_names()
+    return _fts_available[conn.alias]
+
+
+# ==========================================
+# SEARCH
+# ==========================================
+def search_terms(query):
+    return re.findall(r'\w+', (query or '').lower())
+
+
+def fts_expression(terms):
+    """Every term as a prefix match ("proj"* finds Projector), all required"""
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search_venues(query='', capacity=None, location=None, limit=None):
+    """
+    Venues matching ``query`` in name, location or equipment (prefix matching,
+    best match first), narrowed by a CAPACITY_RANGES key and a location
+    substring - all in ONE query. When the prefix search finds nothing, a
+    second query looks for the terms anywhere inside a word ("101" still
+    finds CQAR0101). Without a query every venue is returned by name.
+    """
+    terms = search_terms(query)
+    min_capacity, max_capacity = CAPACITY_RANGES.get(capacity, (None, None))
+
+    if terms and fts_enabled():
+        found = list(_fts_search(terms, min_capacity, max_capacity, location, limit))
+        if found:
+            return found
+
+    venues = Venue.objects.all()
+    if min_capacity is not None:
+        venues = venues.filter(capacity__gte=min_capacity)
+    if max_capacity is not None:
+        venues = venues.filter(capacity__lte=max_capacity)
+    if location:
+        venues = venues.filter(location__icontains=location)
+    if terms:
+        venues = _fallback_search(venues, terms)
+    return list(venues[:limit] if limit else venues)
+
+
+def _fts_search(terms, min_capacity, max_capacity, location, limit):
+    table = Venue._meta.db_table
+    conditions = [f"{FTS_TABLE} MATCH %s"]
+    params = [fts_expression(terms)]
+    if min_capacity is not None:
+        conditions.append("v.capacity >= %s")
+        params.append(min_capacity)
+    if max_capacity is not None:
+        conditions.append("v.capacity <= %s")
+        params.append(max_capacity)
+    if location:
+        conditions.append("v.location LIKE %s ESCAPE '\\'")
+        params.append('%' + re.sub(r'([\\%_])', r'\\\1', location) + '%')
+
+    sql = f"""
+        SELECT v.*, bm25({FTS_TABLE}, {', '.join(str(w) for w in FTS_WEIGHTS)}) AS rank
+        FROM {FTS_TABLE} JOIN {table} v ON v.id = {FTS_TABLE}.rowid
+        WHERE {' AND '.join(conditions)}
+        ORDER BY rank, v.name
+    """
+    if limit:
+        sql += " LIMIT %s"
+        params.append(limit)
+    return Venue.objects.raw(sql, params)
+
+
+def _fallback_search(venues, terms):
+    """Substring search (no FTS5, or FTS5 found nothing): every term must appear in some column, ranked by where the first one hit"""
+    for term in terms:
+        venues = venues.filter(
+            Q(name__icontains=term) | Q(location__icontains=term) | Q(equipment__icontains=term)
+        )
+    first = terms[0]
+    return venues.annotate(rank=Case(
+        When(name__istartswith=first, then=Value(0)),
+        When(name__icontains=first, then=Value(1)),
+        When(location__icontains=first, then=Value(2)),
+        default=Value(3),
+        output_field=IntegerField(),
+    )).order_by('rank', 'name')
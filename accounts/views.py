@@ -7,16 +7,45 @@ from django.contrib.auth.decorators import login_required
 from django.core.exceptions import ValidationError
 from django.db.models import Q
 from datetime import datetime, date, timedelta
+from django.utils.functional import SimpleLazyObject
 from django.utils.safestring import mark_safe
-from django.http import JsonResponse
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+import asyncio
 import json
+import logging
 import re
+from urllib.parse import quote
 
-from .models import Venue, Booking, VenueSchedule
+from .models import Venue, Booking, BookingSeries, VenueSchedule
 from .forms import BookingForm, VenueSearchForm
-from .utils import Calendar
+from .utils import amonth_data, amonth_etag, month_data
+from .booking_index import booking_index
+from .counters import estimated_total, get_counts
+from .occupancy import avenue_occupancy, get_snapshot
+from .venue_matcher import VENUES_VERSION_NAME, aget_matcher
+from .availability import aget_bitmaps, aget_day_bitmap, get_slot_table
+from .pagination import keyset_page
+from .venue_search import search_venues
+from .recommendations import arecommend_venues, parse_equipment, parse_headcount, parse_window, recommend_venues
+from .series import cancel_series, create_series
+from .fragments import booking_version_name, fragment_context, user_bookings_version_name, user_version_name
+from .feeds import check_feed_token, feed_stamp, feed_token, stream_ics
+from .events import astream_events, get_broker, sse_message, stream_events
+from .passes import PASS_FORMATS, PASS_SIZES, get_pass, pass_digest, pass_payload, pass_size, pass_url
+from .documents import (
+    aiter_file, document_content_type, document_digest, document_extension, document_url, iter_file, parse_range,
+)
+
+logger = logging.getLogger(__name__)
 
 # ==========================================
 # AUTHENTICATION
@@ -110,34 +139,57 @@ def guest_login_view(request):
 
 @login_required(login_url='login')
 def dashboard_view(request):
-    # Get booking counts for the chart
-    a_count = Booking.objects.filter(user=request.user, status='APPROVED').count()
-    p_count = Booking.objects.filter(user=request.user, status='PENDING').count()
-    r_count = Booking.objects.filter(user=request.user, status='REJECTED').count()
-    
-    return render(request, 'dashboard.html', {
-        'a_count': a_count,
-        'p_count': p_count,
-        'r_count': r_count,
-    })
+    # Booking counts for the chart (one lookup in the maintained counters),
+    # only read when the cached stats fragment is missing or stale
+    context = {'stats': SimpleLazyObject(lambda: get_counts(request.user))}
+    context.update(fragment_context(user_bookings_version_name(request.user.id)))
+    return render(request, 'dashboard.html', context)
 
 @login_required(login_url='login')
 def venue_list_view(request):
-    venues = Venue.objects.all()
-    query = request.GET.get('query')
-    if query:
-        venues = venues.filter(name__icontains=query)
-    location = request.GET.get('location')
-    if location:
-        venues = venues.filter(location__icontains=location)
-    capacity_filter = request.GET.get('capacity')
-    if capacity_filter == 'small':
-        venues = venues.filter(capacity__lt=20)
-    elif capacity_filter == 'medium':
-        venues = venues.filter(capacity__gte=20, capacity__lte=50)
-    elif capacity_filter == 'large':
-        venues = venues.filter(capacity__gt=50)
-    return render(request, 'venue_list.html', {'venues': venues})
+    # Name / location / equipment search and the size filter run as ONE query
+    # Run only when the cached grid for these filters is missing or stale
+    def find_venues():
+        venues = search_venues(
+            query=request.GET.get('query'),
+            capacity=request.GET.get('capacity'),
+            location=request.GET.get('location'),
+        )
+        for venue in venues:
+            venue.feed_url = feed_url(request, 'venue', venue.id)
+        return venues
+
+    context = {'venues': SimpleLazyObject(find_venues)}
+    context.update(fragment_context(VENUES_VERSION_NAME))
+    return render(request, 'venue_list.html', context)
+
+# Suggestions returned by the type-ahead search
+MAX_SEARCH_RESULTS = 20
+
+@login_required(login_url='login')
+def venue_search_json(request):
+    """Type-ahead: ?q= (prefix matching, best match first; substrings if that finds nothing), optional ?capacity=small|medium|large and ?limit="""
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), MAX_SEARCH_RESULTS)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be a number'}, status=400)
+
+    venues = search_venues(
+        query=request.GET.get('q'),
+        capacity=request.GET.get('capacity'),
+        location=request.GET.get('location'),
+        limit=limit,
+    )
+    return JsonResponse({'results': [
+        {
+            'id': venue.id,
+            'name': venue.name,
+            'location': venue.location,
+            'capacity': venue.capacity,
+            'equipment': venue.equipment,
+        }
+        for venue in venues
+    ]})
 
 @login_required(login_url='login')
 def create_booking_view(request):
@@ -145,6 +197,7 @@ def create_booking_view(request):
         messages.error(request, "Guests cannot make bookings. Please register an account.")
         return redirect('dashboard')
 
+    alternatives = []
     if request.method == 'POST':
         form = BookingForm(request.POST, request.FILES)
 
@@ -176,16 +229,44 @@ def create_booking_view(request):
                     )
                 except Exception as e:
                     messages.error(request, f"❌ Error parsing time slot: {str(e)}")
-                    return render(request, 'create_booking.html', {'form': form})
+                    return render_create_booking(request, form)
+
+            # --- RECURRING SERIES: every occurrence checked and written together ---
+            if form.cleaned_data.get('repeat'):
+                series = BookingSeries(
+                    user=request.user, venue=booking.venue, event_name=booking.event_name,
+                    start_time=booking.start_time, end_time=booking.end_time,
+                    frequency=form.cleaned_data['repeat'], count=form.cleaned_data['repeat_count'],
+                )
+                try:
+                    created, series_report = create_series(
+                        series, template=booking, skip_conflicts=form.cleaned_data.get('skip_conflicts')
+                    )
+                except ValidationError as e:
+                    created, series_report = [], []
+                    messages.error(request, f"❌ Booking Error: {e.messages[0] if e.messages else str(e)}")
+                if created:
+                    skipped = len(series_report) - len(created)
+                    note = f" {skipped} clashing dates were skipped." if skipped else ""
+                    messages.success(request, f"✅ {len(created)} bookings submitted! Waiting for admin approval.{note}")
+                    return redirect('my_bookings')
+                if series_report:
+                    messages.error(request, "❌ Some dates of the series are not available - nothing was booked. See the list below.")
+                return render_create_booking(request, form, series_report=series_report)
 
             try:
-                booking.full_clean()  # Validates all constraints including time validation
                 booking.status = 'PENDING'
-                booking.save()
+                booking.save_checked()  # Validates (including clashes) and saves under the venue lock
                 messages.success(request, "✅ Booking request submitted successfully! Waiting for admin approval.")
                 return redirect('dashboard')
             except ValidationError as e:
                 messages.error(request, f"❌ Booking Error: {e.messages[0] if e.messages else str(e)}")
+                # Suggest rooms at least as big that are free for the same window
+                if booking.venue_id and booking.start_time and booking.end_time and booking.start_time < booking.end_time:
+                    alternatives = recommend_venues(
+                        booking.venue.capacity, booking.start_time, booking.end_time,
+                        limit=3, exclude_ids=[booking.venue_id]
+                    )
         else:
             messages.error(request, "❌ Please fix the form errors below.")
     else:
@@ -200,12 +281,17 @@ def create_booking_view(request):
 
         form = BookingForm(initial=initial_data)
 
+    return render_create_booking(request, form, alternatives=alternatives)
+
+def render_create_booking(request, form, alternatives=(), series_report=()):
     # Get schedule for display
     schedule = VenueSchedule.get_schedule()
     context = {
         'form': form,
         'schedule': schedule,
         'time_slots': schedule.get_time_slots(),
+        'alternatives': alternatives,
+        'series_report': series_report,
     }
 
     return render(request, 'create_booking.html', context)
@@ -213,8 +299,130 @@ def create_booking_view(request):
 # --- DETAIL VIEW ---
 @login_required(login_url='login')
 def booking_detail_view(request, booking_id):
-    booking = get_object_or_404(Booking, id=booking_id)
-    return render(request, 'booking_detail.html', {'booking': booking})
+    booking = get_object_or_404(Booking.objects.select_related('user', 'venue'), id=booking_id)
+    can_see_files = can_see_pass(request.user, booking)
+    context = {'booking': booking, 'can_see_files': can_see_files}
+    if booking.document and can_see_files:
+        context['document_url'] = document_url(booking)
+    if booking.pass_status == 'ready' and can_see_files:
+        context['pass_image_url'] = pass_url(booking, 'svg')
+        context['pass_download_url'] = pass_url(booking, 'png', PASS_SIZES[-1]) + '?download=1'
+    # The pass encodes the venue name and the page shows the organizer's, so
+    # venue and account edits drop the fragment too
+    context.update(fragment_context(booking_version_name(booking.id), user_version_name(booking.user_id), VENUES_VERSION_NAME))
+    return render(request, 'booking_detail.html', context)
+
+# ==========================================
+# QR ENTRY PASSES
+# ==========================================
+# The file URL carries the hash of what the pass encodes, so it never changes content
+PASS_CACHE_CONTROL = 'private, max-age=31536000, immutable'
+
+def can_see_pass(user, booking):
+    return booking.user_id == user.id or user.is_staff
+
+def pass_booking(request, booking_id):
+    booking = get_object_or_404(Booking.objects.select_related('user', 'venue'), pk=booking_id, status='APPROVED')
+    if not can_see_pass(request.user, booking):
+        raise Http404("No such pass")
+    return booking
+
+@login_required(login_url='login')
+def booking_pass(request, booking_id, fmt):
+    """Stable link to a booking's pass (?size= for PNG): redirects to its current file URL"""
+    if fmt not in PASS_FORMATS:
+        raise Http404("Unknown format")
+    url = pass_url(pass_booking(request, booking_id), fmt, request.GET.get('size'))
+    return redirect(url + ('?download=1' if request.GET.get('download') else ''))
+
+@login_required(login_url='login')
+def booking_pass_file(request, booking_id, size, digest, fmt):
+    """The pass itself, rendered on first request and cached by the browser for good"""
+    if fmt not in PASS_FORMATS or size != pass_size(fmt, size):
+        raise Http404("Unknown pass variant")
+    booking = pass_booking(request, booking_id)
+    payload = pass_payload(booking)
+    if digest != pass_digest(payload, fmt, size):
+        # The booking changed since this URL was handed out
+        return redirect(pass_url(booking, fmt, size))
+
+    etag = f'"{digest}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(get_pass(payload, fmt, size), content_type=PASS_FORMATS[fmt])
+        if request.GET.get('download'):
+            response['Content-Disposition'] = f'attachment; filename="Booking_Pass_{booking.id}.{fmt}"'
+    response['ETag'] = etag
+    response['Cache-Control'] = PASS_CACHE_CONTROL
+    return response
+
+# ==========================================
+# BOOKING DOCUMENTS
+# ==========================================
+# Document URLs carry the content hash as well, so they are cached the same way
+DOCUMENT_CACHE_CONTROL = PASS_CACHE_CONTROL
+
+@login_required(login_url='login')
+def booking_document(request, booking_id, digest):
+    """The booking's document, streamed from disk with Range support (or handed to the web server)"""
+    booking = get_object_or_404(Booking, pk=booking_id)
+    if not booking.document or not can_see_pass(request.user, booking):
+        raise Http404("No such document")
+    if digest != document_digest(booking.document.name):
+        # The document was replaced since this URL was handed out
+        return redirect(document_url(booking))
+
+    etag = f'"{digest}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = document_response(request, booking, etag)
+    response['ETag'] = etag
+    response['Cache-Control'] = DOCUMENT_CACHE_CONTROL
+    return response
+
+def document_response(request, booking, etag):
+    """
+    200 or 206 (one byte range) straight from the file, a chunk at a time; a
+    stale If-Range or several ranges get the whole file. With
+    DOCUMENT_ACCEL_REDIRECT set, nginx sends it instead (ranges included).
+    """
+    name = booking.document.name
+    content_type = document_content_type(name)
+    accel = getattr(settings, 'DOCUMENT_ACCEL_REDIRECT', None)
+    if accel:
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = accel.rstrip('/') + '/' + quote(name)
+    else:
+        storage = booking.document.storage
+        try:
+            size = storage.size(name)
+        except FileNotFoundError:
+            raise Http404("The document is missing")
+        byte_range = None
+        if request.headers.get('If-Range', etag) == etag:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        if byte_range == 'unsatisfiable':
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+        is_asgi = isinstance(request, ASGIRequest)
+        if byte_range is None and not is_asgi:
+            # The whole file under WSGI: the server's file_wrapper can sendfile() it
+            response = FileResponse(storage.open(name, 'rb'), content_type=content_type)
+        else:
+            # ASGI would buffer a sync iterator whole, so it gets an async one
+            start, end = byte_range or (0, size - 1)
+            chunks = (aiter_file if is_asgi else iter_file)(storage.path(name), start, end - start + 1)
+            response = StreamingHttpResponse(chunks, content_type=content_type, status=206 if byte_range else 200)
+            response['Content-Length'] = end - start + 1
+            if byte_range:
+                response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Accept-Ranges'] = 'bytes'
+
+    disposition = 'attachment' if request.GET.get('download') else 'inline'
+    response['Content-Disposition'] = f'{disposition}; filename="Booking_{booking.id}_Document.{document_extension(name)}"'
+    return response
 
 @login_required(login_url='login')
 def modify_booking_view(request, booking_id):
@@ -250,13 +458,13 @@ def modify_booking_view(request, booking_id):
                         )
                     except Exception as e:
                         messages.error(request, f"❌ Error parsing time slot: {str(e)}")
-                        return render(request, 'modify_booking.html', {'form': form, 'booking': booking})
+                        schedule = VenueSchedule.get_schedule()
+                        return render(request, 'modify_booking.html', {'form': form, 'booking': booking, 'schedule': schedule, 'time_slots': schedule.get_time_slots()})
 
-                booking.full_clean()  # Validate constraints
                 booking.status = 'PENDING'  # Reset to pending for re-approval
                 booking.approved_by = None  # Clear approval
                 booking.approved_at = None
-                booking.save()
+                booking.save_checked()  # Validates (including clashes) and saves under the venue lock
                 messages.success(request, "✅ Booking updated! Awaiting admin approval.")
                 return redirect('my_bookings')
             except ValidationError as e:
@@ -271,34 +479,101 @@ def modify_booking_view(request, booking_id):
     context = {
         'form': form,
         'booking': booking,
+        'document_url': document_url(booking),
         'schedule': schedule,
         'time_slots': schedule.get_time_slots(),
     }
 
     return render(request, 'modify_booking.html', context)
 
+def calendar_params(request):
+    """(first day of the ?month=YYYY-M, venue id of the optional ?venue= filter)"""
+    d = get_date(request.GET.get('month', None))
+    venue_id = request.GET.get('venue')
+    venue_id = int(venue_id) if venue_id and venue_id.isdigit() else None
+    return d, venue_id
+
 @login_required(login_url='login')
 def calendar_view(request):
-    d = get_date(request.GET.get('month', None))
-    cal = Calendar(d.year, d.month)
-    html_cal = cal.formatmonth(withyear=True)
+    d, venue_id = calendar_params(request)
+    venue_query = f"&venue={venue_id}" if venue_id else ""
+
+    # The page draws the grid from the month JSON; later flips fetch it from calendar_json
     prev_month = d.replace(day=1) - timedelta(days=1)
     next_month = d.replace(day=28) + timedelta(days=4)
     return render(request, 'calendar.html', {
-        'calendar': mark_safe(html_cal),
-        'prev_month': f"month={prev_month.year}-{prev_month.month}",
-        'next_month': f"month={next_month.year}-{next_month.month}",
+        'month_data': month_data(d.year, d.month, venue_id),
+        'venue_id': venue_id,
+        'prev_month': f"month={prev_month.year}-{prev_month.month}{venue_query}",
+        'next_month': f"month={next_month.year}-{next_month.month}{venue_query}",
     })
 
+@login_required(login_url='login')
+async def calendar_json(request):
+    """Month JSON for the calendar page; an unchanged month answers If-None-Match with a 304"""
+    d, venue_id = calendar_params(request)
+    # Not @condition: it calls etag_func synchronously, and a cold ETag costs a query
+    etag = await amonth_etag(d.year, d.month, venue_id)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse(await amonth_data(d.year, d.month, venue_id))
+    if request.method in ('GET', 'HEAD'):
+        response['ETag'] = etag
+    # Always revalidate: a flip back to a month costs one header round-trip
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+# ==========================================
+# ICS SUBSCRIPTION FEEDS
+# ==========================================
+# No login: calendar apps authenticate with the signed token in the URL.
+# A poll whose ETag still matches is answered from the cache alone.
+def feed_etag(request, kind, obj_id, token):
+    return feed_stamp(kind, obj_id)[0] if check_feed_token(kind, obj_id, token) else None
+
+def feed_last_modified(request, kind, obj_id, token):
+    return feed_stamp(kind, obj_id)[1] if check_feed_token(kind, obj_id, token) else None
+
+@condition(etag_func=feed_etag, last_modified_func=feed_last_modified)
+def ics_feed(request, kind, obj_id, token):
+    """APPROVED bookings of a venue or a user as text/calendar, streamed from the database"""
+    if not check_feed_token(kind, obj_id, token):
+        raise Http404("Unknown feed")
+    if kind == 'venue':
+        title = get_object_or_404(Venue, pk=obj_id).name
+    else:
+        user = get_object_or_404(User, pk=obj_id)
+        title = f"{user.get_full_name() or user.username} - bookings"
+
+    response = StreamingHttpResponse(stream_ics(kind, obj_id, title, host=request.get_host()), content_type='text/calendar; charset=utf-8')
+    response['Content-Disposition'] = f'inline; filename="{kind}-{obj_id}.ics"'
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+def feed_url(request, kind, obj_id):
+    return request.build_absolute_uri(reverse('ics_feed', args=[kind, obj_id, feed_token(kind, obj_id)]))
+
 def get_date(req_day):
     if req_day:
         year, month = (int(x) for x in req_day.split('-'))
         return date(year, month, day=1)
     return datetime.today()
 
+# Limits for the batch (venue x day x slot) grid
+MAX_GRID_VENUES = 100
+MAX_GRID_DAYS = 31
+
 @login_required(login_url='login')
-def get_availability_json(request):
-    """API endpoint that returns available time slots for a venue on a given date"""
+async def get_availability_json(request):
+    """
+    API endpoint that returns available time slots for a venue on a given date.
+
+    Batch form: ?venue_ids=1,2,3&from=YYYY-MM-DD&to=YYYY-MM-DD returns a
+    venue x day x slot grid in one round-trip (see availability_grid_response).
+    """
+    if request.GET.get('venue_ids') or request.GET.get('from'):
+        return await availability_grid_response(request)
+
     venue_id = request.GET.get('venue_id')
     booking_date = request.GET.get('date')  # Format: YYYY-MM-DD
 
@@ -306,82 +581,206 @@ def get_availability_json(request):
         return JsonResponse({'error': 'Missing venue_id or date'}, status=400)
 
     try:
-        venue = Venue.objects.get(id=venue_id)
+        venue = await Venue.objects.aget(id=venue_id)
         booking_date_obj = datetime.strptime(booking_date, '%Y-%m-%d').date()
     except (Venue.DoesNotExist, ValueError):
         return JsonResponse({'error': 'Invalid venue or date'}, status=400)
 
-    # Get schedule and all time slots
-    schedule = VenueSchedule.get_schedule()
-    all_slots = schedule.get_time_slots()
+    # Get schedule and the parsed slot grid
+    schedule = await VenueSchedule.aget_schedule()
+    table = get_slot_table(schedule)
 
-    # Get approved and pending bookings for that venue on that date
+    # Approved and pending bookings for that venue on that date, as one bitmap
     # (PENDING bookings should block slots since they're already reserved in principle)
-    bookings_that_day = Booking.objects.filter(
-        venue=venue,
-        status__in=['APPROVED', 'PENDING'],
-        start_time__date=booking_date_obj
-    )
+    bitmap = await aget_day_bitmap(table, venue.id, booking_date_obj)
 
-    # Create a set of booked time ranges
-    booked_ranges = []
-    for booking in bookings_that_day:
-        booked_ranges.append({
-            'start': booking.start_time.strftime('%H:%M'),
-            'end': booking.end_time.strftime('%H:%M'),
-        })
-
-    # Check which slots are available
-    available_slots = []
-    booked_slots = []
-
-    for slot in all_slots:
-        is_booked = False
-        for booked in booked_ranges:
-            # Check if slot overlaps with any booked time
-            slot_start = datetime.strptime(slot['start'], '%H:%M').time()
-            slot_end = datetime.strptime(slot['end'], '%H:%M').time()
-            booked_start = datetime.strptime(booked['start'], '%H:%M').time()
-            booked_end = datetime.strptime(booked['end'], '%H:%M').time()
-
-            if slot_start < booked_end and slot_end > booked_start:
-                is_booked = True
-                break
-
-        if is_booked:
-            booked_slots.append(slot)
-        else:
-            available_slots.append(slot)
+    return JsonResponse({
+        'available_slots': table.available(bitmap),
+        'booked_slots': table.booked(bitmap),
+        'operating_hours': {
+            'open': schedule.open_hour,
+            'close': schedule.close_hour,
+        },
+    })
+
+async def availability_grid_response(request):
+    """Slot occupancy for many venues over a date range, e.g. "find any free room this week" """
+    try:
+        first_day = datetime.strptime(request.GET.get('from', ''), '%Y-%m-%d').date()
+        last_day = datetime.strptime(request.GET.get('to') or request.GET.get('from'), '%Y-%m-%d').date()
+    except ValueError:
+        return JsonResponse({'error': 'Invalid from/to date (use YYYY-MM-DD)'}, status=400)
+
+    if last_day < first_day or (last_day - first_day).days >= MAX_GRID_DAYS:
+        return JsonResponse({'error': f'Date range must be 1-{MAX_GRID_DAYS} days'}, status=400)
+
+    venues = Venue.objects.all()
+    venue_ids = request.GET.get('venue_ids')
+    if venue_ids:
+        try:
+            venues = venues.filter(id__in=[int(v) for v in venue_ids.split(',') if v.strip()])
+        except ValueError:
+            return JsonResponse({'error': 'venue_ids must be a comma-separated list of ids'}, status=400)
+    venues = [venue async for venue in venues.values('id', 'name')[:MAX_GRID_VENUES]]
+
+    schedule = await VenueSchedule.aget_schedule()
+    table = get_slot_table(schedule)
+    bitmaps = await aget_bitmaps(table, [v['id'] for v in venues], first_day, last_day)
+
+    days = [first_day + timedelta(days=i) for i in range((last_day - first_day).days + 1)]
+    grid = []
+    for venue in venues:
+        venue_days = {}
+        for day in days:
+            bitmap = bitmaps[(venue['id'], day)]
+            venue_days[day.isoformat()] = {
+                'booked': table.as_string(bitmap),
+                'free_count': table.free_count(bitmap),
+            }
+        grid.append({'id': venue['id'], 'name': venue['name'], 'days': venue_days})
 
     return JsonResponse({
-        'available_slots': available_slots,
-        'booked_slots': booked_slots,
+        'slots': table.slots,
+        'from': first_day.isoformat(),
+        'to': last_day.isoformat(),
+        'venues': grid,
         'operating_hours': {
             'open': schedule.open_hour,
             'close': schedule.close_hour,
         },
     })
 
+# ==========================================
+# LIVE AVAILABILITY (server-sent events)
+# ==========================================
+@login_required(login_url='login')
+async def availability_events(request, venue_id, day=None):
+    """
+    text/event-stream of the venue's slot changes, or of one day's. A day
+    stream opens with a 'snapshot' of the day, so the booking form needs no
+    poll of get_availability_json / check_availability to stay current.
+    """
+    if day is not None:
+        try:
+            day = datetime.strptime(day, '%Y-%m-%d').date()
+        except ValueError:
+            raise Http404("Invalid date")
+    if not await Venue.objects.filter(pk=venue_id).aexists():
+        raise Http404("Unknown venue")
+
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    last_event_id = int(last_event_id) if last_event_id.isdigit() else None
+    # An async iterator would be buffered whole by the WSGI handler, and a sync one by ASGI's
+    is_asgi = isinstance(request, ASGIRequest)
+    broker = get_broker()
+    subscription = await sync_to_async(broker.subscribe)(
+        venue_id, day, last_event_id, asyncio.get_running_loop() if is_asgi else None
+    )
+
+    try:
+        first = ''
+        if day is not None and last_event_id is None:
+            # Read after subscribing, so no change can fall between the two
+            table = get_slot_table(await VenueSchedule.aget_schedule())
+            bitmap = await aget_day_bitmap(table, venue_id, day)
+            first = sse_message('snapshot', {
+                'venue_id': venue_id,
+                'date': day.isoformat(),
+                'booked': table.as_string(bitmap),
+                'free_count': table.free_count(bitmap),
+            })
+    except BaseException:
+        broker.unsubscribe(subscription)
+        raise
+
+    stream = astream_events(subscription, first) if is_asgi else stream_events(subscription, first)
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx would otherwise hold the events back
+    return response
+
 @login_required(login_url='login')
 def my_bookings_view(request):
-    bookings = Booking.objects.filter(user=request.user).select_related('venue').order_by('-created_at')
+    bookings = Booking.objects.filter(user=request.user).select_related('venue')
     
     # Filter by status
     status_filter = request.GET.get('status')
     if status_filter and status_filter in ['PENDING', 'APPROVED', 'REJECTED']:
         bookings = bookings.filter(status=status_filter)
+    else:
+        status_filter = None
     
-    # Pagination
-    from django.core.paginator import Paginator
-    paginator = Paginator(bookings, 10)  # 10 bookings per page
-    page_number = request.GET.get('page')
-    bookings = paginator.get_page(page_number)
+    # Keyset pagination: ?cursor= comes from the previous page's links
+    page = keyset_page(bookings, request.GET.get('cursor'), per_page=10)
     
     return render(request, 'my_bookings.html', {
-        'bookings': bookings, 
-        'status_filter': status_filter
+        'bookings': page, 
+        'status_filter': status_filter,
+        'total': estimated_total(request.user, status_filter),
+        'feed_url': feed_url(request, 'user', request.user.id),
     })
 
+# Largest ?limit= accepted by the JSON listing
+MAX_LISTING_LIMIT = 100
+
+def booking_summary(booking):
+    return {
+        'id': booking.id,
+        'event_name': booking.event_name,
+        'purpose': booking.purpose,
+        'status': booking.status,
+        'venue': {'id': booking.venue_id, 'name': booking.venue.name},
+        'user': booking.user_id,
+        'start_time': booking.start_time.isoformat(),
+        'end_time': booking.end_time.isoformat(),
+        'time_slot': booking.time_slot,
+        'created_at': booking.created_at.isoformat(),
+        'pass_status': booking.pass_status,
+    }
+
+@login_required(login_url='login')
+def bookings_json(request):
+    """
+    Cursor-paginated booking listing (newest first).
+    ?status=, ?limit= (max 100), ?cursor= from next/prev, ?total=1 for the
+    estimated total. Staff may list another user's bookings (?user=<id>) or
+    everyone's (?user=all).
+    """
+    user = request.user
+    user_param = request.GET.get('user')
+    if user_param and request.user.is_staff:
+        if user_param == 'all':
+            user = None
+        elif user_param.isdigit():
+            user = get_object_or_404(User, pk=int(user_param))
+        else:
+            return JsonResponse({'error': 'user must be an id or "all"'}, status=400)
+
+    bookings = Booking.objects.select_related('venue')
+    if user is not None:
+        bookings = bookings.filter(user=user)
+
+    status_filter = request.GET.get('status')
+    if status_filter:
+        if status_filter not in ('PENDING', 'APPROVED', 'REJECTED'):
+            return JsonResponse({'error': 'status must be PENDING, APPROVED or REJECTED'}, status=400)
+        bookings = bookings.filter(status=status_filter)
+
+    try:
+        limit = min(max(int(request.GET.get('limit', 20)), 1), MAX_LISTING_LIMIT)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be a number'}, status=400)
+
+    page = keyset_page(bookings, request.GET.get('cursor'), per_page=limit)
+    data = {
+        'results': [booking_summary(booking) for booking in page],
+        'next': page.next_cursor,
+        'previous': page.prev_cursor,
+    }
+    if request.GET.get('total') == '1':
+        data['estimated_total'] = estimated_total(user, status_filter)
+    return JsonResponse(data)
+
 @login_required(login_url='login')
 def delete_booking_view(request, booking_id):
     booking = get_object_or_404(Booking, id=booking_id, user=request.user)
@@ -390,6 +789,14 @@ def delete_booking_view(request, booking_id):
         messages.success(request, "Booking cancelled successfully.")
     return redirect('my_bookings')
 
+@login_required(login_url='login')
+def cancel_series_view(request, series_id):
+    series = get_object_or_404(BookingSeries, id=series_id, user=request.user)
+    if request.method == 'POST':
+        cancelled = cancel_series(series)
+        messages.success(request, f"{len(cancelled)} upcoming bookings of the series cancelled.")
+    return redirect('my_bookings')
+
 @login_required(login_url='login')
 def profile_view(request):
     user = request.user
@@ -419,39 +826,154 @@ def profile_view(request):
                 return redirect('profile')
     return render(request, 'profile.html')
 
+# --- Live Occupancy Board ---
+@login_required(login_url='login')
+def occupancy_board_json(request):
+    """Every venue's current and next approved booking (cached until the next boundary)"""
+    return JsonResponse(get_snapshot())
+
 # --- AJAX Availability Check ---
-def check_availability(request):
+def parse_booking_time(value):
+    """Parse 'YYYY-MM-DD HH:MM' (or ISO) into an aware datetime, None if invalid"""
+    try:
+        parsed = parse_datetime(str(value).strip())
+    except ValueError:
+        return None
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+async def check_availability(request):
     venue_id = request.GET.get('venue_id')
-    start_time = request.GET.get('start_time')
-    end_time = request.GET.get('end_time')
-
-    if venue_id and start_time and end_time:
-        is_taken = Booking.objects.filter(
-            venue_id=venue_id,
-            status__in=['APPROVED', 'PENDING'],  # ← Check both statuses
-            start_time__lt=end_time,
-            end_time__gt=start_time
-        ).exists()
-        
-        if is_taken:
+    start_time = parse_booking_time(request.GET.get('start_time', ''))
+    end_time = parse_booking_time(request.GET.get('end_time', ''))
+
+    if venue_id and venue_id.isdigit() and start_time and end_time:
+        # Checks both APPROVED and PENDING bookings via the interval index
+        if await booking_index.afirst_clash(int(venue_id), start_time, end_time):
             return JsonResponse({'status': 'unavailable'})
         else:
             return JsonResponse({'status': 'available'})
 
     return JsonResponse({'status': 'error'})
 
+# Most venues one recommendation request may ask for
+MAX_RECOMMENDATIONS = 20
+
+@login_required(login_url='login')
+def recommend_venues_json(request):
+    """?people=30&start_time=...&end_time=...&equipment=projector,wifi&limit=5 -> free venues, best fit first (one query)"""
+    start_time = parse_booking_time(request.GET.get('start_time', ''))
+    end_time = parse_booking_time(request.GET.get('end_time', ''))
+    people = request.GET.get('people', '')
+
+    # ?venue_id= asks for alternatives to that room: at least as big, itself excluded
+    exclude_ids = []
+    venue_id = request.GET.get('venue_id', '')
+    if venue_id.isdigit():
+        exclude_ids = [int(venue_id)]
+        if not people:
+            capacity = Venue.objects.filter(pk=int(venue_id)).values_list('capacity', flat=True).first()
+            people = str(capacity) if capacity is not None else ''
+
+    if not people.isdigit() or not start_time or not end_time or start_time >= end_time:
+        return JsonResponse({'error': 'people (or venue_id), start_time and end_time (start before end) are required'}, status=400)
+
+    try:
+        limit = min(max(int(request.GET.get('limit', 5)), 1), MAX_RECOMMENDATIONS)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be a number'}, status=400)
+
+    equipment = [item.strip() for item in request.GET.get('equipment', '').split(',') if item.strip()]
+    venues = recommend_venues(int(people), start_time, end_time, equipment=equipment, limit=limit, exclude_ids=exclude_ids)
+    return JsonResponse({'results': [
+        {
+            'id': venue.id,
+            'name': venue.name,
+            'location': venue.location,
+            'capacity': venue.capacity,
+            'equipment': venue.equipment,
+        }
+        for venue in venues
+    ]})
+
+# Upper bound on how many checks one bulk request may carry
+MAX_BULK_CHECKS = 200
+
+@login_required(login_url='login')
+def check_availability_bulk(request):
+    """
+    Check many (venue, start, end) triples in one request.
+
+    POST {"checks": [{"venue_id": 1, "start_time": "2026-03-02 09:00", "end_time": "2026-03-02 10:00"}, ...]}
+    with the X-CSRFToken header, as the pages' other POST fetches send it.
+    Results come back in the same order. Only the caller's own clashing
+    bookings are listed; other people's just make the slot 'unavailable'.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request'}, status=400)
+
+    try:
+        checks = json.loads(request.body).get('checks', [])
+    except (ValueError, AttributeError):
+        return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+
+    if not isinstance(checks, list) or len(checks) > MAX_BULK_CHECKS:
+        return JsonResponse({'error': f'"checks" must be a list of at most {MAX_BULK_CHECKS} items'}, status=400)
+
+    results = []
+    all_clashes = []
+    for check in checks:
+        check = check if isinstance(check, dict) else {}
+        venue_id = str(check.get('venue_id', ''))
+        start_time = parse_booking_time(check.get('start_time', ''))
+        end_time = parse_booking_time(check.get('end_time', ''))
+        result = {
+            'venue_id': check.get('venue_id'),
+            'start_time': check.get('start_time'),
+            'end_time': check.get('end_time'),
+        }
+
+        clashes = []
+        if not (venue_id.isdigit() and start_time and end_time and start_time < end_time):
+            result['status'] = 'error'
+        else:
+            clashes = booking_index.clashes(int(venue_id), start_time, end_time)
+            result['status'] = 'unavailable' if clashes else 'available'
+        results.append(result)
+        all_clashes.append(clashes)
+
+    # ONE query for which of the clashing bookings are the caller's
+    clash_ids = {clash.booking_id for clashes in all_clashes for clash in clashes}
+    own_ids = set(
+        Booking.objects.filter(pk__in=clash_ids, user=request.user).values_list('pk', flat=True)
+    ) if clash_ids else set()
+    for result, clashes in zip(results, all_clashes):
+        if result['status'] != 'error':
+            result['conflicts'] = [
+                {
+                    'id': clash.booking_id,
+                    'event_name': clash.event_name,
+                    'start_time': timezone.localtime(clash.start).isoformat(),
+                    'end_time': timezone.localtime(clash.end).isoformat(),
+                }
+                for clash in clashes if clash.booking_id in own_ids
+            ]
+
+    return JsonResponse({'results': results})
+
 # ==========================================
 # 🤖 CAMPUS-BOT AI LOGIC
 # ==========================================
 
 @csrf_exempt
-def ai_chat_response(request):
+async def ai_chat_response(request):
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
             user_message = data.get('message', '').lower()
             
-            print(f"User Message: {user_message}") 
+            logger.debug("CampusBot message: %s", user_message)
 
             # ---------------------------------------------------------
             # 1. GREETINGS
@@ -463,17 +985,20 @@ def ai_chat_response(request):
             # 2. RECOMMENDATION (By Capacity)
             # ---------------------------------------------------------
             if any(word in user_message for word in ['people', 'capacity', 'pax', 'fit']):
-                import re
-                numbers = re.findall(r'\d+', user_message)
-                if numbers:
-                    required_pax = int(numbers[0])
-                    options = Venue.objects.filter(capacity__gte=required_pax).order_by('capacity')
+                required_pax = parse_headcount(user_message)
+                if required_pax:
+                    # Only rooms that are actually free for the asked (or the next) hour
+                    table = get_slot_table(await VenueSchedule.aget_schedule())
+                    start_time, end_time = parse_window(user_message, table=table)
+                    equipment = parse_equipment(user_message)
+                    options = await arecommend_venues(required_pax, start_time, end_time, equipment=equipment, limit=2)
                     
-                    if options.exists():
-                        names = ", ".join([f"{v.name} ({v.capacity})" for v in options[:2]])
-                        return JsonResponse({'response': f"💡 I recommend: {names}."})
+                    when = timezone.localtime(start_time).strftime('%a %H:%M')
+                    if options:
+                        names = ", ".join([f"{v.name} ({v.capacity})" for v in options])
+                        return JsonResponse({'response': f"💡 I recommend: {names} - free at {when}."})
                     else:
-                        return JsonResponse({'response': f"⚠️ No single room can fit {required_pax} people."})
+                        return JsonResponse({'response': f"⚠️ No free room can fit {required_pax} people at {when}."})
                 else:
                     return JsonResponse({'response': "How many people? (e.g., 'Room for 30 people')"})
 
@@ -481,36 +1006,37 @@ def ai_chat_response(request):
             # 3. DIRECT VENUE CHECK (The Fix!)
             # ---------------------------------------------------------
             # We look for a venue name match FIRST, before checking for "availability" keywords.
-            venues = Venue.objects.all()
-            found_venue = None
-            
-            for v in venues:
-                # Check if the exact venue name (or a significant part) is in the message
-                # e.g., if user types "CQAR0001", this will match.
-                if v.name.lower() in user_message:
-                    found_venue = v
-                    break
-            
-            if found_venue:
-                now = timezone.now()
-                is_booked = Booking.objects.filter(
-                    venue=found_venue, 
-                    start_time__lte=now, 
-                    end_time__gte=now,
-                    status='APPROVED'
-                ).exists()
-                
-                if is_booked:
-                    return JsonResponse({'response': f"🚫 {found_venue.name} is currently BOOKED."})
-                else:
-                    return JsonResponse({'response': f"✅ {found_venue.name} is AVAILABLE right now!"})
+            # One pass over the message finds the longest venue name (or location) in it,
+            # e.g., if user types "CQAR0001", this will match.
+            matcher = await aget_matcher()
+            match = matcher.best_match(user_message)
+
+            if match:
+                matched_text, kind, venue_ids = match
+                if kind == 'name':
+                    venue_id = venue_ids[0]
+                    occupancy = await avenue_occupancy(venue_id)
+                    is_booked = occupancy is not None and occupancy['status'] == 'occupied'
+
+                    if is_booked:
+                        return JsonResponse({'response': f"🚫 {matcher.names[venue_id]} is currently BOOKED."})
+                    else:
+                        return JsonResponse({'response': f"✅ {matcher.names[venue_id]} is AVAILABLE right now!"})
+
+                # A location names several rooms: report each of them
+                statuses = []
+                for venue_id in venue_ids[:5]:
+                    occupancy = await avenue_occupancy(venue_id)
+                    icon = "🚫" if occupancy and occupancy['status'] == 'occupied' else "✅"
+                    statuses.append(f"{icon} {matcher.names[venue_id]}")
+                return JsonResponse({'response': f"Rooms at {matched_text.title()}: " + ", ".join(statuses)})
 
             # ---------------------------------------------------------
             # 4. KEYWORD FALLBACK
             # ---------------------------------------------------------
             # If user asked "is it free?" but we couldn't find a venue name above
             if any(word in user_message for word in ['available', 'free', 'open', 'status', 'booked', 'check']):
-                names = ", ".join([v.name for v in venues[:3]])
+                names = ", ".join(list(matcher.names.values())[:3])
                 return JsonResponse({'response': f"Which venue? Try naming one specifically, like: {names}..."})
 
             # ---------------------------------------------------------
@@ -518,8 +1044,8 @@ def ai_chat_response(request):
             # ---------------------------------------------------------
             return JsonResponse({'response': "I didn't catch that. Try typing a venue name like 'CQAR0001' directly."})
 
-        except Exception as e:
-            print(f"Error: {e}")
+        except Exception:
+            logger.exception("CampusBot failed to answer")
             return JsonResponse({'response': "⚠️ My brain hit a snag. Please try again."})
     
     return JsonResponse({'error': 'Invalid request'}, status=400)
\ No newline at end of file
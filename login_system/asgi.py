@@ -3,6 +3,13 @@ ASGI config for login_system project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The availability, calendar JSON and CampusBot views are async and only avoid
+a thread per request when served from here, e.g.:
+
+    uvicorn login_system.asgi:application --workers 4
+
+``manage.py bench_servers`` compares them under the WSGI and ASGI handlers.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'accounts.profiling.RequestProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -53,9 +54,10 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'login_system.urls'
 
+# The Django backend, timing renders for Server-Timing / the slow request log
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'accounts.profiling.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -74,14 +76,50 @@ WSGI_APPLICATION = 'login_system.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# SQLite is tuned for many concurrent writers on registration day:
+# - WAL lets readers carry on while one request writes
+# - IMMEDIATE transactions take the write lock up front (booking writes queue
+#   behind each other instead of failing with "database is locked")
+# - timeout is how long (seconds) a writer waits for that lock
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+        },
+        # A file (not :memory:) so the concurrency tests' threads share one database
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
 
+# ==========================================
+# CACHE
+# ==========================================
+# Holds the version stamps (accounts/caching.py) and everything keyed on them:
+# calendar months, availability, rendered page fragments, ... Local memory is
+# per process, so a deployment with several workers should point them all at
+# one shared backend (e.g. django.core.cache.backends.redis.RedisCache, or
+# FileBasedCache on a single host) for a write in one to invalidate the others.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'university-portal',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 20000,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -128,6 +166,68 @@ MEDIA_URL = '/media/'
 # This is the actual folder on your computer where files will be saved
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Booking documents are streamed to disk, hashed and size/type-checked as they
+# arrive (see accounts/documents.py); other uploads use Django's handlers
+FILE_UPLOAD_HANDLERS = [
+    'accounts.documents.DocumentUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+# Set to an internal nginx location (e.g. '/protected-media/') aliased to
+# MEDIA_ROOT to hand document downloads to the web server via X-Accel-Redirect
+DOCUMENT_ACCEL_REDIRECT = None
+
+# ==========================================
+# LOGGING
+# ==========================================
+
+# Requests slower than this are written to SLOW_REQUEST_LOG (see accounts/profiling.py)
+SLOW_REQUEST_THRESHOLD_MS = 500
+SLOW_REQUEST_LOG = BASE_DIR / 'slow_requests.jsonl'
+
+# Send db / tpl / total timings to the browser (DevTools > Network > Timing)
+SERVER_TIMING = True
+
+# Carries slot changes to every worker's SSE streams (see accounts/events.py).
+# 'accounts.events.LocalBackend' skips the database when only one process serves.
+AVAILABILITY_EVENTS_BACKEND = 'accounts.events.DatabaseBackend'
+
+# App messages (CampusBot, background worker, ...) go to the console
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'jsonl': {
+            'format': '%(message)s',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+        'slow_requests': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': SLOW_REQUEST_LOG,
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'formatter': 'jsonl',
+            'delay': True,
+        },
+    },
+    'loggers': {
+        'accounts': {
+            'handlers': ['console'],
+            'level': 'DEBUG' if DEBUG else 'INFO',
+        },
+        'accounts.slow_requests': {
+            'handlers': ['slow_requests'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
 # ==========================================
 # EMAIL SETTINGS (NEW)
 # ==========================================